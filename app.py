@@ -1,10 +1,16 @@
-import base64, io
 import pandas as pd
 import streamlit as st
 import time, uuid, json
-from PIL import Image
 from src.utils import *
-from src.agent import InsightGenerator, ChatOrchestrator
+from src.agent import InsightGenerator, ChatOrchestrator, sys_data
+from src.insight_cache import InsightCache, hash_file, hash_text, schema_fingerprint, prompt_version, seed_bundled_insights
+from src.image_store import get_image_store
+from src.index_advisor import enable_index_advisor, get_index_advisor
+from src.dataset_registry import get_dataset_registry
+from src.thread_registry import get_thread_registry, is_owner_key, new_owner_key
+from src.schema_index import dataset_metadata
+from src.approximate import get_refresh_jobs
+from src.sql_executor import ENGINES
 
 st.set_page_config(
     layout="wide",
@@ -12,41 +18,89 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+insight_cache = InsightCache()
+image_store = get_image_store()
+dataset_registry = get_dataset_registry()
+thread_registry = get_thread_registry()
+
 # ---------- Session State Initialization ---------
+if "owner" not in st.session_state:
+    # Threads belong to the browser that started them, the key in the URL brings them back after a reload
+    owner = st.query_params.get("owner")
+    st.session_state.owner = owner if is_owner_key(owner) else new_owner_key()
+    st.query_params["owner"] = st.session_state.owner
 if "threads" not in st.session_state:
-    st.session_state.threads = {}
+    # Title and times of the earlier threads of this owner, the rest is loaded when one is opened and
+    # its chat history is restored from the checkpointer
+    st.session_state.threads = thread_registry.list_threads(st.session_state.owner)
 if "current_thread_id" not in st.session_state:
     st.session_state.current_thread_id = None
 
 
-def process_data(uploaded_file, use_saved_insights=True):
+def process_data(uploaded_file, use_saved_insights=True, approximate=False, database_type="SQLite"):
     insights_dict = None
 
     if uploaded_file is not None:
-        csv_to_sqlite(csv_file=uploaded_file)
-        csv_file_name = os.path.basename(uploaded_file.name)
-        file_base = os.path.splitext(csv_file_name)[0]
-        json_file_path = os.path.join("temp", f"{file_base}.json")
-        
-        if use_saved_insights and os.path.exists(json_file_path):
-            with open(json_file_path, "r") as file:
-                insights_dict = json.load(file)
+        content_hash = hash_file(uploaded_file)
+        prompt_hash = prompt_version(sys_data)
+        if approximate:
+            # Sampled insights are cached apart from the exact ones
+            prompt_hash = hash_text(prompt_hash, "approximate")
         else:
-            sample_data = run_sql_query("SELECT * FROM data LIMIT 5;")
-            column_names = get_column_names()
-            db_data = f"column_names: {column_names}, sample_data: {sample_data}"
-            
-            insights_result = InsightGenerator(db_data).invoke()
+            seed_bundled_insights(insight_cache, prompt_hash)
+        # Same content and prompts: found before the file is ingested
+        cache_key = insight_cache.find(content_hash, prompt_hash, database_type) if use_saved_insights else None
+        insights_dict = insight_cache.get(cache_key) if cache_key else None
+
+        progress_bar = st.progress(0.0, text="Loading data...")
+
+        def report_progress(fraction, rows):
+            progress_bar.progress(fraction or 0.0, text=f"Loading data... {rows:,} rows")
+
+        # Every dataset has its own database file, an upload seen before is not ingested again
+        dataset = dataset_registry.materialize(uploaded_file, content_hash, source_name=uploaded_file.name, progress=report_progress, database_type=database_type)
+        progress_bar.empty()
+        db_name = dataset["db_name"]
+        # Indexes only help SQLite's row store, DuckDB scans columns. A re-ingested file has a new executor, the advisor is attached again
+        if database_type == "SQLite" and get_index_advisor(db_name) is None:
+            enable_index_advisor(db_name)
+        # Built once, shared by the insight agents and the chat (wide tables: column names only, requests get their relevant columns)
+        db_data = dataset_metadata(db_name=db_name)
+
+        if insights_dict is not None:
+            return insights_dict, db_data, dataset, cache_key
+
+        schema_hash = schema_fingerprint(run_sql_query("PRAGMA table_info(data);", db_name))
+        cache_key = InsightCache.make_key(content_hash, schema_hash, prompt_hash)
+        cache_info = {"source_name": os.path.basename(uploaded_file.name), "content_hash": content_hash, "schema_hash": schema_hash, "prompt_hash": prompt_hash,
+                      "database_type": database_type}
+        
+        if use_saved_insights:
+            # Same schema, new data: re-run the stored SQL instead of regenerating everything
+            # Earlier upload of the same file (same name and columns), an unrelated dataset sharing the columns is not reused
+            refresh_key = insight_cache.find_refreshable(schema_hash, prompt_hash, cache_info["source_name"], database_type, exclude=cache_key)
+            previous_insights = insight_cache.get(refresh_key) if refresh_key else None
+            if previous_insights:
+                insights_dict, changed, failed = InsightGenerator(db_data, db_name=db_name, approximate=approximate).refresh_insights(previous_insights)
+                if failed:
+                    st.warning(f"{len(failed)} cached insight(s) could not be refreshed on the new data and were left out: " +
+                               "; ".join(f"{name}: {error}" for name, error in failed.items()))
+                if insights_dict:
+                    insight_cache.put(cache_key, insights_dict, **cache_info)
+                    st.toast(f"Insights refreshed, {changed} of {len(previous_insights)} changed.", icon="🔄")
+                else:
+                    insights_dict = None
+
+        if insights_dict is None:
+            insights_result = InsightGenerator(db_data, db_name=db_name, approximate=approximate).invoke()
             insights_dict = insights_result.get('json_insights')
             
             if insights_dict:
-                os.makedirs("temp", exist_ok=True)
-                with open(json_file_path, "w") as file:
-                    json.dump(insights_dict, file, indent=4)
+                insight_cache.put(cache_key, insights_dict, **cache_info)
                 st.toast("New insights generated and saved!", icon="✅")
                     
-        return insights_dict 
-    return None
+        return insights_dict, db_data, dataset, cache_key
+    return None, None, None, None
 
 def display_summary(summary_raw):
     try:
@@ -82,8 +136,8 @@ def display_sql_results(pairs, relation_columns):
             if isinstance(db_result, list) and (not db_result or all(isinstance(row, (dict, list, tuple)) for row in db_result)):
                 processed_result = []
                 if db_result and isinstance(db_result[0], (list, tuple)):
-                    col_names = []
-                    if relation_columns and isinstance(relation_columns, list):
+                    col_names = list(pair.get('columns') or [])
+                    if not col_names and relation_columns and isinstance(relation_columns, list):
                         for c_dict in relation_columns:
                             if isinstance(c_dict, dict):
                                 col_names.extend(list(c_dict.keys()))
@@ -95,11 +149,23 @@ def display_sql_results(pairs, relation_columns):
                         {k: (None if v is Ellipsis else v) for k, v in row.items()}
                         for row in db_result
                     ]
+                approximate = pair.get('approximate') or {}
+                margins = approximate.get('margins') or []
+                if approximate and len(margins) == len(processed_result) and isinstance(db_result[0], (list, tuple)):
+                    # Estimated columns get their 95% margin next to them
+                    estimated = [i for i in range(min(len(col_names), len(margins[0]))) if any(m[i] is not None for m in margins)]
+                    for row, row_margins in zip(processed_result, margins):
+                        for i in estimated:
+                            row[f"{col_names[i]} ±95%"] = row_margins[i]
                 if processed_result and isinstance(processed_result[0], dict):
                     df_result = pd.DataFrame(processed_result)
                     for col in df_result.select_dtypes(include=['object']).columns:
                         df_result[col] = df_result[col].apply(lambda x: str(x) if isinstance(x, bool) else x)
                     st.dataframe(df_result, hide_index=True, use_container_width=True)
+                    if pair.get('truncated'):
+                        st.caption(f"Showing {len(db_result):,} of {pair.get('total_rows', 0):,} rows.")
+                    if approximate:
+                        st.caption("≈ " + "; ".join(approximate.get('notes', [])))
                 elif processed_result:
                     st.write(processed_result)
             else:
@@ -110,9 +176,44 @@ def display_sql_results(pairs, relation_columns):
             except Exception:
                 st.code(str(db_result))
 
-def display_insights_in_column(insights_json):
-    for insight_key, insight_data in insights_json.items():
+@st.fragment(run_every=2)
+def poll_exact_refresh(thread_data, job_key):
+    """Polls a running exact refresh, the finished insight replaces the approximate one."""
+    jobs = get_refresh_jobs()
+    if jobs.status(job_key) == "running":
+        st.info("⏳ Exact refresh running in the background...")
+        return
+    try:
+        thread_data["insights"][job_key[1]] = jobs.pop(job_key)
+        thread_registry.save(st.session_state.owner, job_key[0], thread_data)
+        if thread_data.get("cache_key"):
+            insight_cache.update(thread_data["cache_key"], thread_data["insights"])
+    except Exception as e:
+        thread_data.setdefault("refresh_errors", {})[job_key[1]] = str(e)
+    st.rerun()
+
+def display_exact_refresh(thread_id, thread_data, insight_key, insight_data):
+    estimates = [pair["approximate"] for pair in insight_data.get('sql_results_pair', []) if isinstance(pair, dict) and pair.get("approximate")]
+    if not estimates:
+        return
+    job_key = (thread_id, insight_key)
+    jobs = get_refresh_jobs()
+    st.caption(f"≈ Approximate: estimated from a {estimates[0]['sample_fraction']:.2%} sample of {estimates[0]['population_rows']:,} rows.")
+    error = thread_data.get("refresh_errors", {}).pop(insight_key, None)
+    if error:
+        st.error(f"Exact refresh failed: {error}")
+    if jobs.status(job_key) is not None:
+        poll_exact_refresh(thread_data, job_key)
+    elif st.button("🎯 Refresh exact", key=f"exact_{thread_id}_{insight_key}"):
+        # The real queries run on the whole table in the background, the estimate stays visible meanwhile
+        generator = InsightGenerator(thread_data["metadata"], db_name=thread_data["db_name"])
+        jobs.submit(job_key, generator.refresh_exact, insight_key, insight_data)
+        st.rerun()
+
+def display_insights_in_column(thread_id, thread_data):
+    for insight_key, insight_data in thread_data.get("insights", {}).items():
         with st.expander(f"{insight_key}", expanded=False):
+            display_exact_refresh(thread_id, thread_data, insight_key, insight_data)
             st.markdown(f"## Details:\n{insight_data.get('insight_details', 'N/A')}")
             tab1, tab2 = st.tabs(["Summary & Recommendations", "Technical Details"])
 
@@ -125,7 +226,31 @@ def display_insights_in_column(insights_json):
                 st.markdown("**Analysis & Results:**")
                 display_sql_results(insight_data.get('sql_results_pair', []), insight_data.get('relation_columns', []))
         
-def display_chatbot(thread_data,chat_bot):
+def stream_reply(chat_bot, prompt):
+    """Renders tool progress and answer tokens as they arrive, returns the final text, image and chart."""
+    with st.chat_message("assistant"):
+        status = None
+        answer = st.empty()
+        text = ""
+        for event in chat_bot.stream(prompt):
+            if event["type"] == "tool_start":
+                if status is None:
+                    status = st.status("Working...", expanded=False)
+                status.update(label=f"Running {event['name']}...")
+                status.write(f"▶️ {event['name']}")
+            elif event["type"] == "tool_end" and status is not None:
+                status.write(f"✅ {event['name']} finished")
+            elif event["type"] == "token":
+                text += event["content"]
+                answer.markdown(text + "▌")
+            elif event["type"] == "final":
+                if status is not None:
+                    status.update(label="Done", state="complete")
+                answer.markdown(event["content"])
+                return event["content"], event["image"], event["chart"]
+    return text, "", ""
+
+def display_chatbot(thread_id, thread_data, chat_bot):
     MESSAGE_CONTAINER_HEIGHT = 650
     message_container = st.container(height=MESSAGE_CONTAINER_HEIGHT)
     with message_container:
@@ -133,10 +258,11 @@ def display_chatbot(thread_data,chat_bot):
         if not messages:
             st.info("Start the conversation by typing below!")
 
-        for message in messages:
+        for index, message in enumerate(messages):
             role = message.get("role")
             content = message.get("content")
-            image_b64 = message.get("image")
+            image_ref = message.get("image")
+            chart_json = message.get("chart")
 
             if not role or not content:
                 st.warning("Skipping incomplete message.")
@@ -144,13 +270,16 @@ def display_chatbot(thread_data,chat_bot):
 
             with st.chat_message(role):
                 st.markdown(content)
-                if image_b64:
-                    try:
-                        image_data = base64.b64decode(image_b64)
-                        image = Image.open(io.BytesIO(image_data))
-                        st.image(image, caption="Chatbot Visualization")
-                    except Exception as e:
+                if image_ref:
+                    # Messages only keep the reference, the PNG bytes go straight to st.image
+                    image_data = image_store.get(image_ref)
+                    if image_data is not None:
+                        st.image(image_data, caption="Chatbot Visualization")
+                    else:
                         st.error(f"⚠️ Could not display image")
+                if chart_json:
+                    # Plotly draws the figure in the browser, nothing is rasterized on the server
+                    st.plotly_chart(json.loads(chart_json), use_container_width=True, key=f"chart_{index}")
 
     if prompt := st.chat_input("Ask about these insights..."):
 
@@ -159,13 +288,16 @@ def display_chatbot(thread_data,chat_bot):
         thread_data["messages"].append({"role": "user", "content": prompt})
 
         try:
-            with st.spinner("Thinking..."):
-                message_text , image_base64, _ = chat_bot.invoke(prompt)
+            with message_container:
+                with st.chat_message("user"):
+                    st.markdown(prompt)
+                message_text, image_ref, chart_json = stream_reply(chat_bot, prompt)
 
             thread_data["messages"].append({
                 "role": "assistant",
                 "content": message_text,
-                "image": image_base64
+                "image": image_ref,
+                "chart": chart_json
             })
 
         except Exception as e:
@@ -174,6 +306,7 @@ def display_chatbot(thread_data,chat_bot):
                 "role": "assistant",
                 "content": f"Sorry, I encountered an error: {e}"
             })
+        thread_registry.save(st.session_state.owner, thread_id, thread_data)
         st.rerun()
 
 def init_state():
@@ -183,28 +316,58 @@ def init_state():
     uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"], label_visibility="collapsed")
     if uploaded_file is not None:
         use_saved = st.checkbox("Use cached insights", value=True)
+        approximate = st.checkbox("Approximate insights on a sample (faster on large tables, refresh exact per insight)", value=False)
+        database_type = st.radio("Query engine", ENGINES, horizontal=True, help="DuckDB runs aggregations vectorized on all cores, faster on large tables") if len(ENGINES) > 1 else "SQLite"
         
         if st.button(f"Process {uploaded_file.name}", type="primary"):
             with st.spinner("Processing data..."):
-                insights_json = process_data(uploaded_file, use_saved_insights=use_saved)
+                insights_json, metadata, dataset, cache_key = process_data(uploaded_file, use_saved_insights=use_saved, approximate=approximate, database_type=database_type)
                 if insights_json:
-                    sample_data = run_sql_query("SELECT * FROM data LIMIT 5;")
-                    column_names = get_column_names()
-                    metadata = f"column_names: {column_names}, sample_data: {sample_data}"
-                    chat_bot = ChatOrchestrator(metadata, insights_json)
-                    
                     new_thread_id = str(uuid.uuid4())
+                    # The chat history of the model is checkpointed under the thread id
+                    chat_bot = ChatOrchestrator(metadata, insights_json, db_name=dataset["db_name"], thread_id=new_thread_id)
+                    
                     assistant_msg = f"✅ Data from '{uploaded_file.name}' processed. Insights are ready on the left. Ask me anything about them!"
-                    st.session_state.threads[new_thread_id] = {
+                    thread_data = st.session_state.threads[new_thread_id] = {
                         "title": f"{uploaded_file.name}",
                         "insights": insights_json,
                         "messages": [{"role": "assistant", "content": assistant_msg}],
-                        "chat_bot": chat_bot
+                        "chat_bot": chat_bot,
+                        "dataset_key": dataset["key"],
+                        "db_name": dataset["db_name"],
+                        "metadata": metadata,
+                        "cache_key": cache_key
                     }
+                    thread_registry.save(st.session_state.owner, new_thread_id, thread_data)
                     st.session_state.current_thread_id = new_thread_id
                     st.rerun()
 
+def display_index_report(db_name):
+    advisor = get_index_advisor(db_name)
+    if advisor is None:
+        return
+    report = advisor.report()
+    if not report["indexes"] and not report["dropped"]:
+        return
+    st.divider()
+    with st.expander("⚡ Index advisor", expanded=False):
+        st.caption(f"{report['scan_to_search']} scan → search, {report['scan_to_index_scan']} scan → covering index scan, "
+                   f"{report['used_bytes'] / 1024**2:.1f} of {report['disk_budget'] / 1024**2:.0f} MB used")
+        for index in report["indexes"]:
+            st.markdown(f"`{index['name']}` ({', '.join(index['columns'])}), used {index['uses']}×")
+
+def open_thread(thread_id):
+    """Loads a thread listed from the registry index only, it is dropped when another session evicted it meanwhile."""
+    if thread_id not in st.session_state.threads or "insights" in st.session_state.threads[thread_id]:
+        return
+    thread_data = thread_registry.load(st.session_state.owner, thread_id)
+    if thread_data is None:
+        del st.session_state.threads[thread_id]
+    else:
+        st.session_state.threads[thread_id] = thread_data
+
 def main_ui():
+    open_thread(st.session_state.current_thread_id)
     with st.sidebar:
         st.title("💬 Data Chats")
         st.divider()
@@ -222,6 +385,9 @@ def main_ui():
                 if st.button(thread_title, key=f"thread_btn_{thread_id}", use_container_width=True, type=button_type):
                     st.session_state.current_thread_id = thread_id
                     st.rerun()
+        current_thread = st.session_state.threads.get(st.session_state.current_thread_id) or {}
+        if current_thread.get("db_name"):
+            display_index_report(current_thread["db_name"])
 
     if st.session_state.current_thread_id is None:
         init_state()
@@ -230,15 +396,20 @@ def main_ui():
         thread_id = st.session_state.current_thread_id
         if thread_id in st.session_state.threads:
             thread_data = st.session_state.threads[thread_id]
-            chat_bot = thread_data.get("chat_bot") 
+            chat_bot = thread_data.get("chat_bot")
+            if chat_bot is None:
+                # Thread of an earlier session: same thread id, the checkpointer brings its history back
+                chat_bot = thread_data["chat_bot"] = ChatOrchestrator(thread_data["metadata"], thread_data["insights"], db_name=thread_data["db_name"], thread_id=thread_id)
+            if thread_data.get("dataset_key") and dataset_registry.get(thread_data["dataset_key"]) is None:
+                st.warning("The data of this thread was removed from the dataset store, upload the file again to query it.")
 
             tab1, tab2 = st.tabs(["💡 Generated Insights", "💬 Chat about Analysis"])
 
             with tab1:
-                    display_insights_in_column(thread_data.get("insights", {}))
+                    display_insights_in_column(thread_id, thread_data)
 
             with tab2:
-                    display_chatbot(thread_data,chat_bot)
+                    display_chatbot(thread_id, thread_data, chat_bot)
         else:
             st.error("Error: Selected thread not found. Please start a new thread.")
             st.session_state.current_thread_id = None
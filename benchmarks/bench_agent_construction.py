@@ -0,0 +1,70 @@
+"""
+Per tool call overhead of building the chat sub-agents (ChatOpenAI client + StateGraph.compile())
+versus reusing the compiled-once agents, and a check that one shared Text2SQL_Agent keeps
+concurrent requests apart.
+
+Run from the repository root:
+    python -m benchmarks.bench_agent_construction --calls 50
+"""
+import os, json, time, argparse, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# ChatOpenAI only needs a key to be constructed, nothing is sent
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import src.agent as agent
+import src.llm as llm
+from src.utils import csv_to_sqlite
+from benchmarks.fake_llm import patch_chat_openai
+
+
+def per_call(calls: int) -> float:
+    """Previous behaviour: every tool call built fresh agents with their own client."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        llm.reset_chat_models()
+        agent.Text2SQL_Agent(agent.sys_data["text_to_sql"], use_cache=False)
+        agent.GraphVisualization("column_names: []")
+    return (time.perf_counter() - start) / calls
+
+
+def reused(calls: int) -> float:
+    """Agents are built once (as ChatOrchestrator does), tool calls only look them up."""
+    start = time.perf_counter()
+    text_to_sql = agent.Text2SQL_Agent(agent.sys_data["text_to_sql"], use_cache=False)
+    visualization = agent.GraphVisualization("column_names: []")
+    for _ in range(calls):
+        text_to_sql.graph, visualization.graph
+    return (time.perf_counter() - start) / calls
+
+
+def concurrent_requests(db_name: str, requests: int) -> int:
+    """Each request asks for a different LIMIT, returns how many got their own result back."""
+    responses = [json.dumps({"sql": [f"SELECT * FROM data LIMIT {i + 1}"]}) for i in range(requests)]
+    patch_chat_openai(latency=0.05, responses=responses)
+    t2s = agent.Text2SQL_Agent(agent.sys_data["text_to_sql"], db_name=db_name, use_cache=False)
+
+    def ask(i):
+        result = t2s.invoke(f"request {i}")
+        # Responses are handed out in call order, match them through the generated SQL
+        sql = result["result_data"][0]["sql_query"]
+        return result["result_data"][0]["total_rows"] == int(sql.rsplit(" ", 1)[1]) and result["prompt"] == f"request {i}"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return sum(executor.map(ask, range(requests)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=16)
+    args = parser.parse_args()
+
+    before, after = per_call(args.calls), reused(args.calls)
+    print(f"construction per tool call: before {before * 1000:.2f} ms, after {after * 1000:.4f} ms (one build amortized)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        csv_to_sqlite("data/market_data.csv", db_name=db_name)
+        isolated = concurrent_requests(db_name, args.requests)
+    print(f"shared Text2SQL_Agent, concurrent requests with their own state: {isolated}/{args.requests}")
@@ -0,0 +1,86 @@
+"""
+Insight-style queries (GROUP BY counts and sums, averages, distinct counts) on the whole table
+versus estimated from the ingestion sample by run_approximate: time per query, relative error
+of the estimates and how often the exact value lies within the reported 95% margin.
+
+A synthetic orders table is written to a temporary CSV and ingested with its sample. Distinct
+counts per group cannot be scaled from a sample, they are returned as counted on it with a note
+(the large error in that row is expected), whole-table distinct counts come from the profile.
+
+Run from the repository root:
+    python -m benchmarks.bench_approximate_insights --rows 5000000 --sample 100000
+"""
+import os, time, random, argparse, tempfile
+
+from src.approximate import run_approximate, sample_info
+from src.sql_executor import get_executor, EXACT_REFRESH_BUDGET
+from src.ingestion import ingest_csv
+
+REGIONS = ["north", "south", "east", "west", "central"]
+CATEGORIES = ["books", "games", "garden", "tools", "toys", "music", "sports", "beauty"]
+QUERIES = [
+    "SELECT region, COUNT(*) AS orders FROM data GROUP BY region ORDER BY orders DESC",
+    "SELECT category, SUM(amount) AS revenue FROM data GROUP BY category ORDER BY revenue DESC LIMIT 5",
+    "SELECT region, ROUND(AVG(amount), 2) AS avg_amount FROM data WHERE returned = 0 GROUP BY region",
+    "SELECT COUNT(*) FROM data WHERE amount > 400",
+    "SELECT COUNT(DISTINCT customer_id) FROM data",
+    "SELECT category, COUNT(DISTINCT customer_id) FROM data GROUP BY category",
+    # Aggregates times constants are scaled, other combinations of aggregates run exactly
+    "SELECT SUM(amount) / 1000000.0 AS revenue_millions FROM data",
+    "SELECT region, CAST(COUNT(*) AS REAL) AS orders FROM data GROUP BY region",
+    "SELECT ROUND(COUNT(*) * 100.0 / 3, 1) FROM data WHERE returned = 1",
+    "SELECT region, SUM(amount) / COUNT(*) FROM data GROUP BY region",
+]
+
+
+def write_orders(path: str, rows: int):
+    rng = random.Random(0)
+    with open(path, "w") as file:
+        file.write("order_id,customer_id,region,category,amount,returned\n")
+        for i in range(rows):
+            region = REGIONS[min(int(rng.expovariate(0.8)), len(REGIONS) - 1)]
+            category = rng.choice(CATEGORIES)
+            amount = round(rng.lognormvariate(4.5, 0.8), 2)
+            file.write(f"{i},{rng.randrange(rows // 20)},{region},{category},{amount},{int(rng.random() < 0.05)}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--sample", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file, db_name = os.path.join(tmp, "orders.csv"), os.path.join(tmp, "orders.db")
+        write_orders(csv_file, args.rows)
+        start = time.perf_counter()
+        ingest_csv(csv_file, db_name=db_name, sample_rows=args.sample)
+        print(f"ingested {args.rows:,} rows in {time.perf_counter() - start:.1f}s, sample {sample_info(db_name)['sample_rows']:,} rows")
+        executor = get_executor(db_name)
+
+        for query in QUERIES:
+            start = time.perf_counter()
+            exact = executor.run(query, use_cache=False, budget=EXACT_REFRESH_BUDGET)
+            exact_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            approximate = run_approximate(query, db_name)
+            approximate_seconds = time.perf_counter() - start
+
+            # Rows are matched on their first column when the query is grouped
+            exact_rows = {row[0] if len(row) > 1 else None: row for row in exact}
+            errors, covered, estimates = [], 0, 0
+            info = approximate.approximate or {}
+            for row, margins in zip(approximate.preview, info.get("margins") or [[None] * len(approximate.columns)] * len(approximate.preview)):
+                truth = exact_rows.get(row[0] if len(row) > 1 else None)
+                if truth is None:
+                    continue
+                value, actual, margin = row[-1], truth[-1], margins[-1]
+                if isinstance(actual, (int, float)) and actual:
+                    errors.append(abs(value - actual) / abs(actual))
+                if margin is not None:
+                    estimates += 1
+                    covered += abs(value - actual) <= margin
+            error = f"{max(errors):6.2%}" if errors else "     -"
+            coverage = f"{covered}/{estimates}" if estimates else "-"
+            print(f"exact {exact_seconds * 1000:8.1f}ms | sampled {approximate_seconds * 1000:6.1f}ms (x{exact_seconds / approximate_seconds:5.1f}) "
+                  f"| max rel. error {error} | within margin {coverage:>5} | {query[:70]}")
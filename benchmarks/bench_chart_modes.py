@@ -0,0 +1,105 @@
+"""
+Chart spec mode versus matplotlib code mode: LLM output tokens of the tool call and server-side
+render time per chart (spec: validate + build the Plotly figure JSON, code: sandboxed exec + PNG).
+
+Run from the repository root:
+    python -m benchmarks.bench_chart_modes --repeat 5
+"""
+import os, json, time, argparse, tempfile
+
+from src.utils import csv_to_sqlite, run_bounded_query
+from src.digest import count_tokens
+from src.chart_spec import render_chart_spec
+from src.sandbox import SandboxPool, encode_frame
+
+STYLE = """
+plt.figure(figsize=(10, 6), facecolor="#262730")
+ax = plt.gca()
+ax.set_facecolor("#262730")
+ax.tick_params(colors='white')
+"""
+
+# Tool call arguments as the LLM writes them in each mode
+CHARTS = {
+    "bar: securities per exchange": (
+        'SELECT "Listing Exchange", COUNT(*) AS Securities FROM data GROUP BY 1',
+        {"chart_type": "bar", "x": "Listing Exchange", "y": "Securities", "aggregation": "none", "title": "Securities per exchange", "sort": "-y"},
+        """import pandas as pd
+import matplotlib.pyplot as plt
+df = pd.DataFrame(result_data, columns=['Exchange', 'Securities']).sort_values('Securities', ascending=False)
+""" + STYLE + """plt.title('Securities per exchange', color='white')
+plt.xlabel('Listing Exchange', color='white')
+plt.ylabel('Securities', color='white')
+plt.bar(df['Exchange'], df['Securities'], color='skyblue')
+plt.tight_layout()
+""",
+    ),
+    "pie: ETF share": (
+        'SELECT ETF, COUNT(*) AS Securities FROM data GROUP BY ETF',
+        {"chart_type": "pie", "x": "ETF", "y": "Securities", "aggregation": "none", "title": "ETF share"},
+        """import pandas as pd
+import matplotlib.pyplot as plt
+df = pd.DataFrame(result_data, columns=['ETF', 'Securities'])
+""" + STYLE + """plt.title('ETF share', color='white')
+wedges, texts, autotexts = plt.pie(df['Securities'], labels=df['ETF'], autopct='%1.1f%%')
+for text in texts + autotexts:
+    text.set_color('white')
+plt.tight_layout()
+""",
+    ),
+    "histogram: round lot size": (
+        'SELECT "Round Lot Size" FROM data',
+        {"chart_type": "histogram", "x": "Round Lot Size", "title": "Round lot size distribution"},
+        """import pandas as pd
+import matplotlib.pyplot as plt
+df = pd.DataFrame(result_data, columns=['RoundLotSize'])
+""" + STYLE + """plt.title('Round lot size distribution', color='white')
+plt.xlabel('Round Lot Size', color='white')
+plt.ylabel('Count', color='white')
+plt.hist(df['RoundLotSize'].dropna(), bins=30, color='skyblue')
+plt.tight_layout()
+""",
+    ),
+}
+
+
+def timed(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Warm-up (worker imports, plotly import), not part of the per chart time
+    pool = SandboxPool(size=1)
+    pool.run("pass")
+    render_chart_spec({"chart_type": "bar", "x": "a", "y": "b"}, ["a", "b"], [("x", 1)])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        csv_to_sqlite("data/market_data.csv", db_name=db_name)
+
+        print(f"{'chart':<28} {'output tokens spec':>18} {'code':>6} {'render ms spec':>15} {'code':>7}")
+        for name, (query, spec, code) in CHARTS.items():
+            result = run_bounded_query(query, db_name, spill=True)
+            rows = list(result.iter_rows())
+
+            def render_spec():
+                render_chart_spec(dict(spec), result.columns, rows)
+
+            def render_code():
+                reply = pool.run(code, encode_frame(result.columns, rows))
+                assert reply["ok"] and reply["png"], reply
+
+            spec_tokens = count_tokens(json.dumps({"spec": spec}))
+            code_tokens = count_tokens(json.dumps({"code_string": code}))
+            spec_ms = timed(render_spec, args.repeat) * 1000
+            code_ms = timed(render_code, args.repeat) * 1000
+            print(f"{name:<28} {spec_tokens:>18} {code_tokens:>6} {spec_ms:>15.1f} {code_ms:>7.1f}")
+            result.close()
+    pool.close()
@@ -0,0 +1,58 @@
+"""
+Context size and turn latency of a long chat thread: the whole history resent on every turn
+(unbounded window) versus the checkpointed history bounded by rolling summarization.
+
+Every turn the fake LLM calls the column profile tool (a large tool output) and then answers.
+Checkpoints go to a temporary file, data/market_data.csv is ingested into a temporary database.
+
+Run from the repository root:
+    python -m benchmarks.bench_conversation_memory --turns 60
+"""
+import os, time, uuid, argparse, tempfile
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from benchmarks.fake_llm import patch_chat_openai
+from src.utils import csv_to_sqlite
+
+ANSWER = "The exchange with the most listings is N, followed by Q and P; ETFs are mostly listed on P. " * 3
+
+
+def respond(messages):
+    last = messages[-1]
+    if isinstance(last, HumanMessage) and last.content.startswith("Current summary:"):
+        return "The user explored listings per exchange, ETF shares and round lot sizes; answers came from the column profile."
+    if isinstance(last, ToolMessage):
+        return ANSWER
+    return AIMessage("", tool_calls=[{"name": "column_profile_tool", "args": {}, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+
+def run_thread(turns: int, history_tokens: int, tool_tokens: int, db_name: str, checkpoint_path: str):
+    from src.agent import ChatOrchestrator
+    chat = ChatOrchestrator("column_names: []", {}, db_name=db_name, history_tokens=history_tokens, tool_tokens=tool_tokens, checkpoint_path=checkpoint_path)
+    timings = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        chat.invoke(f"Question {turn}: how are listings split across exchanges and ETFs?")
+        timings.append(time.perf_counter() - start)
+    # Two orchestrator calls per turn (tool call + answer), the second one holds the whole turn
+    context = [entry["message_tokens"] for entry in chat.token_log[1::2]]
+    return context, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--history-tokens", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    patch_chat_openai(latency=args.latency, responder=respond)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "data.db")
+        csv_to_sqlite("data/market_data.csv", db_name=db_name)
+        for label, history_tokens, tool_tokens in (("unbounded", 10**9, 10**9), ("bounded", args.history_tokens, 300)):
+            context, timings = run_thread(args.turns, history_tokens, tool_tokens, db_name, os.path.join(tmp, f"{label}.db"))
+            checkpoint_bytes = os.path.getsize(os.path.join(tmp, f"{label}.db"))
+            print(f"{label:<10}: context tokens turn 1 {context[0]:>6,}, turn {args.turns // 2} {context[args.turns // 2 - 1]:>6,}, "
+                  f"turn {args.turns} {context[-1]:>6,} | turn latency first {timings[0] * 1000:6.1f}ms, last {timings[-1] * 1000:6.1f}ms "
+                  f"| checkpoint file {checkpoint_bytes / 1024:,.0f}KB")
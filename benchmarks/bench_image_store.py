@@ -0,0 +1,53 @@
+"""
+Chat rerun cost of a thread with many charts: base64 strings in the messages decoded with
+Image.open on every rerun (previous behaviour) versus image store references.
+
+Run from the repository root:
+    python -m benchmarks.bench_image_store --images 50 --reruns 20
+"""
+import io, sys, time, base64, argparse, tempfile
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from PIL import Image
+
+from src.image_store import ImageStore
+
+
+def make_png(seed: int) -> bytes:
+    figure, ax = plt.subplots(figsize=(10, 6))
+    ax.bar([f"c{i}" for i in range(12)], [(seed * 7 + i * 13) % 50 for i in range(12)])
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    pngs = [make_png(i) for i in range(args.images)]
+
+    messages = [{"role": "assistant", "content": "chart", "image": base64.b64encode(png).decode("utf-8")} for png in pngs]
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        for message in messages:
+            Image.open(io.BytesIO(base64.b64decode(message["image"]))).load()
+    before = (time.perf_counter() - start) / args.reruns
+    before_bytes = sum(sys.getsizeof(message["image"]) for message in messages)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ImageStore(tmp)
+        messages = [{"role": "assistant", "content": "chart", "image": store.put(png)} for png in pngs]
+        start = time.perf_counter()
+        for _ in range(args.reruns):
+            for message in messages:
+                store.get(message["image"])
+        after = (time.perf_counter() - start) / args.reruns
+        after_bytes = sum(sys.getsizeof(message["image"]) for message in messages)
+
+    print(f"{args.images} images, per rerun: base64 + Image.open {before * 1000:.1f} ms, image store {after * 1000:.2f} ms")
+    print(f"session state held by the messages: {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e3:.1f} KB")
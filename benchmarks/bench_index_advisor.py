@@ -0,0 +1,70 @@
+"""
+Latency of a repeated filter / GROUP BY workload on a large table, before and after the index
+advisor built its indexes, and the scan -> search conversions it reports.
+
+data/market_data.csv is replicated up to --rows rows and ingested in a temporary directory.
+
+Run from the repository root:
+    python -m benchmarks.bench_index_advisor --rows 2000000 --rounds 3
+"""
+import os, time, argparse, tempfile
+
+from benchmarks.bench_ingestion import replicate_csv
+from src.utils import csv_to_sqlite
+from src.sql_executor import get_executor
+from src.index_advisor import enable_index_advisor
+
+SYMBOLS = ["AAPL", "MSFT", "AMZN", "GOOG", "TSLA", "NVDA", "META", "INTC"]
+WORKLOAD = [
+    lambda i: f"SELECT \"Security Name\", \"Round Lot Size\" FROM data WHERE Symbol = '{SYMBOLS[i % len(SYMBOLS)]}'",
+    lambda i: f"SELECT COUNT(*) FROM data WHERE \"Listing Exchange\" = '{'NQ'[i % 2]}' AND ETF = 'Y'",
+    lambda i: "SELECT \"Listing Exchange\", COUNT(*) FROM data GROUP BY \"Listing Exchange\"",
+    lambda i: f"SELECT Symbol FROM data WHERE \"Market Category\" = 'Q' AND \"Round Lot Size\" > {100 + i} LIMIT 50",
+]
+
+
+def run_round(db_name: str, round_index: int) -> list:
+    executor = get_executor(db_name)
+    timings = []
+    for make_query in WORKLOAD:
+        start = time.perf_counter()
+        executor.run(make_query(round_index), use_cache=False, budget=None)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--budget-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = os.path.join(tmp, "market_data_replicated.csv")
+        db_name = os.path.join(tmp, "data.db")
+        rows = replicate_csv(csv_file, args.rows)
+        csv_to_sqlite(csv_file, db_name=db_name)
+        print(f"{rows:,} rows ingested")
+
+        advisor = enable_index_advisor(db_name, disk_budget=args.budget_mb * 1024**2, min_scans=args.rounds, background=True)
+        before = [run_round(db_name, i) for i in range(args.rounds)]
+        start = time.perf_counter()
+        advisor.wait()
+        build = time.perf_counter() - start
+        after = [run_round(db_name, args.rounds + i) for i in range(args.rounds)]
+
+        print(f"\n{'query':<70} {'before':>10} {'after':>10}")
+        for index, make_query in enumerate(WORKLOAD):
+            mean_before = sum(timings[index] for timings in before) / len(before)
+            mean_after = sum(timings[index] for timings in after) / len(after)
+            print(f"{make_query(0)[:68]:<70} {mean_before * 1000:8.1f}ms {mean_after * 1000:8.2f}ms")
+
+        report = advisor.report()
+        print(f"\nwaited {build:.2f}s for the background builds")
+        for index in report["indexes"]:
+            print(f"  {index['name']} ({', '.join(index['columns'])}): {index['size'] / 1024**2:.1f}MB, built in {index['build_seconds']}s")
+        print(f"scan -> search: {report['scan_to_search']}, scan -> covering index scan: {report['scan_to_index_scan']}, "
+              f"{report['used_bytes'] / 1024**2:.1f}MB of {report['disk_budget'] / 1024**2:.0f}MB budget")
+        for conversion in report["conversions"]:
+            print(f"  {conversion['before'][0]}  ->  {conversion['after'][0]}")
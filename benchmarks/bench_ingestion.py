@@ -0,0 +1,72 @@
+"""
+Time and peak memory of the old whole-file ingestion vs the streaming csv_to_sqlite.
+
+data/market_data.csv is replicated up to --rows rows in a temporary directory, each
+ingestion runs in its own process so the peak RSS numbers do not leak into each other.
+
+Run from the repository root:
+    python -m benchmarks.bench_ingestion --rows 10000000
+"""
+import os, time, sqlite3, resource, argparse, tempfile
+import multiprocessing as mp
+import pandas as pd
+
+SOURCE_CSV = "data/market_data.csv"
+
+
+def replicate_csv(path: str, rows: int) -> int:
+    with open(SOURCE_CSV, "r", encoding="utf-8") as file:
+        header = file.readline()
+        body = file.readlines()
+    written = 0
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(header)
+        while written < rows:
+            batch = body[: rows - written]
+            out.writelines(batch)
+            written += len(batch)
+    return written
+
+
+def legacy_ingest(csv_file: str, db_name: str):
+    df = pd.read_csv(csv_file)
+    conn = sqlite3.connect(db_name)
+    df.to_sql("data", conn, if_exists="replace", index=False)
+    conn.close()
+
+
+def streaming_ingest(csv_file: str, db_name: str):
+    from src.utils import csv_to_sqlite
+    csv_to_sqlite(csv_file, db_name=db_name)
+
+
+def worker(mode: str, csv_file: str, db_name: str, results):
+    start = time.perf_counter()
+    (legacy_ingest if mode == "legacy" else streaming_ingest)(csv_file, db_name)
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(mode: str, csv_file: str, db_name: str):
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=worker, args=(mode, csv_file, db_name, results))
+    process.start()
+    elapsed, peak_mb = results.get()
+    process.join()
+    return elapsed, peak_mb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = os.path.join(tmp, "market_data_replicated.csv")
+        rows = replicate_csv(csv_file, args.rows)
+        print(f"{rows:,} rows, {os.path.getsize(csv_file) / 1024 ** 2:.0f}MB csv")
+
+        for mode in ("legacy", "streaming"):
+            elapsed, peak_mb = measure(mode, csv_file, os.path.join(tmp, f"{mode}.db"))
+            print(f"{mode:<10}: {elapsed:7.2f}s  peak RSS {peak_mb:8.0f}MB")
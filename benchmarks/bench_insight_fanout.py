@@ -0,0 +1,47 @@
+"""
+Wall-clock comparison of sequential vs concurrent InsightGenerator.make_insight_cloud_node.
+
+The prompt -> SQL memo is off, every run pays for the same Text2SQL LLM round-trips (and
+nothing is written to temp/sql_cache.db).
+
+Run from the repository root:
+    python -m benchmarks.bench_insight_fanout --insights 10 --latency 0.3
+"""
+import time, json, argparse
+from langchain_core.messages import HumanMessage
+
+import src.agent as agent
+from benchmarks.fake_llm import patch_chat_openai
+
+
+def make_insights(count: int) -> str:
+    return json.dumps({
+        f"Insight_{i}": {"insight_details": f"Insight number {i}", "relation_columns": [], "relations": []}
+        for i in range(count)
+    })
+
+
+def run(count: int, latency: float, max_concurrency: int) -> float:
+    patch_chat_openai(latency=latency)
+    generator = agent.InsightGenerator("column_names: [], sample_data: []", max_concurrency=max_concurrency, use_cache=False)
+    state = {"messages": [HumanMessage("metadata")], "insights": make_insights(count)}
+
+    start = time.perf_counter()
+    result = generator.make_insight_cloud_node(state)
+    elapsed = time.perf_counter() - start
+
+    assert list(result["json_insights"]) == [f"Insight_{i}" for i in range(count)], "output order changed"
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--insights", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    sequential = run(args.insights, args.latency, max_concurrency=1)
+    print(f"max_concurrency=1  : {sequential:.2f}s")
+    for workers in (4, 8):
+        elapsed = run(args.insights, args.latency, max_concurrency=workers)
+        print(f"max_concurrency={workers:<3}: {elapsed:.2f}s  (speedup x{sequential / elapsed:.1f})")
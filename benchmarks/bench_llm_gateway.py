@@ -0,0 +1,107 @@
+"""
+A burst of LLM calls against a rate limited OpenAI-compatible server: ChatOpenAI calling the
+server directly (client side retries, no shared limit) versus every call going through the
+LLM gateway (shared rate limiter, priority lanes, coalescing).
+
+The workload mimics insight generation running while the user chats: a flood of background
+requests, some of them identical and sent at the same time, plus streamed interactive requests
+issued one per second in the middle of it. The server is benchmarks/fake_openai_server.py, it
+limits requests and tokens per window, the gateway is configured a little under both limits.
+
+Run from the repository root:
+    python -m benchmarks.bench_llm_gateway --background 60 --duplicates 20 --interactive 8 --max-tokens 3000
+"""
+import time, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from langchain_openai import ChatOpenAI
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from src.llm import MODEL
+from src.llm_gateway import LLMGateway, GatewayTransport, PRIORITY_HEADER
+
+
+def direct_models(url: str):
+    # Default client behaviour: each call retries on its own (honouring Retry-After), nothing is shared
+    llm = ChatOpenAI(model=MODEL, base_url=url, api_key="fake", stream_usage=True)
+    return llm, llm
+
+
+def gateway_models(url: str, gateway: LLMGateway):
+    client = httpx.Client(transport=GatewayTransport(gateway))
+    make = lambda priority: ChatOpenAI(model=MODEL, base_url=url, api_key="fake", http_client=client, max_retries=0, stream_usage=True,
+                                       default_headers={PRIORITY_HEADER: priority})
+    return make("interactive"), make("background")
+
+
+def run_workload(interactive, background, args) -> dict:
+    prompts = [f"Background insight question {i}" for i in range(args.background - args.duplicates)]
+    prompts += prompts[:args.duplicates]     # same prompt twice, in flight at the same time
+    failures, latencies = [], []
+    lock = threading.Lock()
+
+    def call(llm, prompt, timings=None):
+        start = time.perf_counter()
+        try:
+            # Chat turns are streamed like in the app
+            if timings is not None:
+                "".join(chunk.content for chunk in llm.stream(prompt))
+            else:
+                llm.invoke(prompt)
+            if timings is not None:
+                with lock:
+                    timings.append(time.perf_counter() - start)
+        except Exception as e:
+            with lock:
+                failures.append(type(e).__name__)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.background + args.interactive) as pool:
+        futures = [pool.submit(call, background, prompt) for prompt in prompts]
+        for i in range(args.interactive):
+            time.sleep(1.0)
+            futures.append(pool.submit(call, interactive, f"Chat question {i}", latencies))
+        for future in futures:
+            future.result()
+    return {"seconds": time.perf_counter() - start, "failures": failures, "latencies": sorted(latencies)}
+
+
+def percentile(values: list, q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)] if values else float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--background", type=int, default=60)
+    parser.add_argument("--duplicates", type=int, default=20)
+    parser.add_argument("--interactive", type=int, default=8)
+    parser.add_argument("--max-requests", type=int, default=20, help="server limit per window")
+    parser.add_argument("--max-tokens", type=int, default=3000, help="server token limit per window")
+    parser.add_argument("--window", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+    server_rpm = args.max_requests * 60 / args.window
+    server_tpm = args.max_tokens * 60 / args.window
+    print(f"server: {args.max_requests} requests and {args.max_tokens} tokens per {args.window:g}s ({server_rpm:.0f} requests, {server_tpm:.0f} tokens/min), "
+          f"{args.latency}s per answer | "
+          f"{args.background} background requests ({args.duplicates} duplicated), {args.interactive} interactive")
+
+    for label in ("direct", "gateway"):
+        server = FakeOpenAIServer(latency=args.latency, max_requests=args.max_requests, max_tokens=args.max_tokens, window=args.window).start()
+        gateway = None
+        if label == "gateway":
+            # A little under the server limit, bursts capped so a sliding window never sees more than the limit
+            gateway = LLMGateway(requests_per_minute=int(server_rpm * 0.85), tokens_per_minute=int(server_tpm * 0.85), burst_seconds=0.5, base_backoff=0.5)
+            interactive, background = gateway_models(server.url, gateway)
+        else:
+            interactive, background = direct_models(server.url)
+        result = run_workload(interactive, background, args)
+        server.stop()
+
+        line = (f"{label:<8}: total {result['seconds']:5.1f}s | server 429s {server.stats['rate_limited']:>3}, requests {server.stats['requests']:>3} "
+                f"| failed calls {len(result['failures']):>2} | interactive p50 {percentile(result['latencies'], 0.5):5.2f}s "
+                f"p95 {percentile(result['latencies'], 0.95):5.2f}s ({len(result['latencies'])} ok)")
+        if gateway is not None:
+            stats = gateway.get_stats()
+            line += f" | coalesced {stats['coalesced']}, gateway retries {stats['retries']}, waited {stats['wait_seconds']:.0f}s in total"
+        print(line)
@@ -0,0 +1,110 @@
+"""
+Latency of a chat turn whose LLM message calls several tools at once, against the baseline graph:
+LangGraph's ToolNode already maps the calls of one message over its default thread pool, the
+bounded pool (max_tool_concurrency) should keep that latency while returning every chart.
+
+The tools are stubbed with fixed sleeps (text-to-SQL, web search, visualization), the fake
+LLM asks for all of them in its first answer and then replies with text.
+
+The second part sends a visualization request whose first LLM message holds two named SQL
+lookups and the chart of one of them: the queries run first, the chart draws the referenced
+result in the same step, so the request takes two LLM round trips (tool calls, answer).
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel_tools --sql 0.8 --search 0.5 --chart 1.2 --llm 0.3
+"""
+import os, json, time, argparse, tempfile
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fake_llm import patch_chat_openai
+
+
+def make_responder(llm_calls: list):
+    def respond(messages):
+        llm_calls.append(time.perf_counter())
+        last = messages[-1]
+        if isinstance(last, HumanMessage) and last.content.startswith("Question"):
+            return AIMessage("", tool_calls=[
+                {"name": "text_to_sql_tool", "args": {"query": "listings per exchange"}, "id": f"call_sql_{time.perf_counter_ns()}"},
+                {"name": "search_web_tool", "args": {"query": "nasdaq listing rules"}, "id": f"call_web_{time.perf_counter_ns()}"},
+                {"name": "graph_visualization_tool", "args": {"query": "bar chart of listings per exchange"}, "id": f"call_viz_{time.perf_counter_ns()}"},
+            ])
+        if isinstance(last, HumanMessage):
+            # Visualization agent: two lookups and the chart of the second one in one message
+            return AIMessage("", tool_calls=[
+                {"name": "text_to_sql_tool", "args": {"query": "SELECT 'N' AS exchange, 120 AS listings UNION ALL SELECT 'Q', 340", "name": "totals"},
+                 "id": f"call_sql_{time.perf_counter_ns()}"},
+                {"name": "text_to_sql_tool", "args": {"query": "SELECT 'N' AS exchange, 12 AS etfs UNION ALL SELECT 'Q', 48", "name": "etfs"},
+                 "id": f"call_sql_{time.perf_counter_ns()}"},
+                {"name": "chart_spec_tool", "args": {"spec": {"chart_type": "bar", "x": "exchange", "y": "etfs", "aggregation": "none", "title": "ETFs"},
+                                                     "result_name": "etfs"}, "id": f"call_chart_{time.perf_counter_ns()}"},
+            ])
+        return "Listings are concentrated on N and Q, see the chart."
+    return respond
+
+
+def stub_tools(chat, sql_seconds: float, search_seconds: float, chart_seconds: float):
+    import src.agent as agent
+
+    def text_to_sql(query):
+        time.sleep(sql_seconds)
+        return {"result_data": [{"sql_query": "SELECT 1", "db_result": [[1]]}]}
+
+    def visualization(query):
+        time.sleep(chart_seconds)
+        return {"image_ref": "", "chart_json": '{"data": [], "layout": {}}'}
+
+    class StubSearch():
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __call__(self, query):
+            time.sleep(search_seconds)
+            return [{"url": "https://example.com", "content": "stub"}]
+
+    chat.text_to_sql.invoke = text_to_sql
+    chat.visualization.invoke = visualization
+    agent.TavilySearchResults = StubSearch
+
+
+def run_turn(chat, prompt: str, baseline: bool) -> dict:
+    if baseline:
+        # The baseline graph config: thread id only, ToolNode on LangGraph's default pool
+        return chat.graph.invoke(chat.turn_input(prompt), {"configurable": {"thread_id": chat.thread_id}})
+    return chat.invoke(prompt)[2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sql", type=float, default=0.8)
+    parser.add_argument("--search", type=float, default=0.5)
+    parser.add_argument("--chart", type=float, default=1.2)
+    parser.add_argument("--llm", type=float, default=0.3, help="seconds per fake LLM call")
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+    llm_calls = []
+    patch_chat_openai(latency=args.llm, responder=make_responder(llm_calls))
+    from src.agent import ChatOrchestrator, GraphVisualization
+
+    print(f"stub tool times: sql {args.sql}s, search {args.search}s, chart {args.chart}s "
+          f"(sum {args.sql + args.search + args.chart:.1f}s, slowest {max(args.sql, args.search, args.chart):.1f}s), llm {args.llm}s per call")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, baseline in (("baseline ToolNode", True), ("max_tool_concurrency=4", False)):
+            chat = ChatOrchestrator("column_names: []", {}, checkpoint_path=os.path.join(tmp, f"{baseline}.db"), max_tool_concurrency=4)
+            stub_tools(chat, args.sql, args.search, args.chart)
+            timings, charts = [], 0
+            for turn in range(args.turns):
+                start = time.perf_counter()
+                state = run_turn(chat, f"Question {turn}", baseline)
+                timings.append(time.perf_counter() - start)
+                charts += bool(state.get("chart_json"))
+            print(f"{label:<24}: {sum(timings) / len(timings):.2f}s per turn, charts returned {charts}/{args.turns}")
+
+    visualization = GraphVisualization("column_names: [exchange, listings, etfs]")
+    llm_calls.clear()
+    start = time.perf_counter()
+    state = visualization.invoke("bar chart of ETFs per exchange next to the listing totals")
+    elapsed = time.perf_counter() - start
+    drawn = json.loads(state["chart_json"])["data"][0]["y"] if state.get("chart_json") else None
+    print(f"two lookups + chart     : {elapsed:.2f}s, {len(llm_calls)} LLM round trips, results kept {len(state['database_results'])}, "
+          f"chart drew {list(drawn) if drawn is not None else 'nothing'} (etfs = [12, 48])")
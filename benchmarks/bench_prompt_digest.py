@@ -0,0 +1,35 @@
+"""
+Orchestrator system prompt size with the full str(insight) dump vs the digested prompt,
+measured on the cached insight fixtures in temp/. The budget bounds the whole system prompt.
+
+Run from the repository root:
+    python -m benchmarks.bench_prompt_digest
+"""
+import json, argparse
+
+from src.agent import sys_data
+from src.digest import build_system_prompt, count_tokens
+
+FIXTURES = ["temp/market_data.json", "temp/test_data.json"]
+
+
+def metadata_for(insights: dict) -> str:
+    columns = sorted({col for data in insights.values() for item in data.get("relation_columns", []) for col in item})
+    return f"column_names: {columns}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budgets", type=int, nargs="+", default=[2000, 4000, 6000])
+    args = parser.parse_args()
+
+    for fixture in FIXTURES:
+        with open(fixture, "r") as file:
+            insights = json.load(file)
+        metadata = metadata_for(insights)
+        before = count_tokens(sys_data["orchestrator"] + f"\n- Metadata = {metadata}" + f"\n- Insight = {insights}")
+        print(f"{fixture} ({len(insights)} insights): str(insight) prompt {before:,} tokens")
+        for budget in args.budgets:
+            for include_rows in (False, True):
+                after = count_tokens(build_system_prompt(sys_data["orchestrator"], metadata, insights, budget, include_rows))
+                print(f"  budget {budget:>5} rows={str(include_rows):<5}: {after:>6,} tokens ({100 * (1 - after / before):.0f}% less)")
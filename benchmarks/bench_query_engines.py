@@ -0,0 +1,89 @@
+"""
+SQLite versus DuckDB on the aggregate-heavy queries the agents generate: ingestion time, file size,
+median latency per query (result cache off), whether both engines return the same rows, and the
+throughput of the whole workload run from --clients concurrent threads.
+
+data/market_data.csv is replicated up to each --rows size and ingested into data.db and data.duckdb
+in a temporary directory.
+
+Run from the repository root:
+    python -m benchmarks.bench_query_engines --rows 1000000 5000000 --repeat 3 --clients 4
+"""
+import os, time, argparse, tempfile, statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_ingestion import replicate_csv
+from src.ingestion import ingest_csv
+from src.sql_executor import get_executor
+
+WORKLOAD = {
+    "group by count": "SELECT \"Listing Exchange\", COUNT(*) AS listings FROM data GROUP BY \"Listing Exchange\" ORDER BY listings DESC",
+    "filtered aggregate": "SELECT ETF, COUNT(*), AVG(\"Round Lot Size\"), MAX(\"Round Lot Size\") FROM data WHERE \"Test Issue\" = 'N' GROUP BY ETF ORDER BY ETF",
+    "two-key group by": "SELECT \"Listing Exchange\", \"Market Category\", COUNT(*) AS listings FROM data GROUP BY 1, 2 ORDER BY listings DESC, 1, 2 LIMIT 10",
+    "count distinct": "SELECT \"Listing Exchange\", COUNT(DISTINCT Symbol) FROM data GROUP BY \"Listing Exchange\" ORDER BY 1",
+    # LIKE ignores case in SQLite only, lower() makes both engines agree
+    "text filter": "SELECT COUNT(*) FROM data WHERE lower(\"Security Name\") LIKE '%common stock%' AND \"Nasdaq Traded\" = 'Y'",
+    "top-k": "SELECT Symbol, \"Round Lot Size\" FROM data WHERE ETF = 'Y' ORDER BY \"Round Lot Size\" DESC, Symbol LIMIT 20",
+}
+
+
+def normalize(rows: list) -> list:
+    """Rows comparable across engines: floats rounded, unordered results sorted."""
+    return sorted(tuple(round(value, 6) if isinstance(value, float) else value for value in row) for row in rows)
+
+
+def median_latency(executor, query: str, repeat: int) -> tuple[float, list]:
+    timings, rows = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = executor.run(query, use_cache=False, budget=None)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), rows
+
+
+def throughput(executor, clients: int, rounds: int) -> float:
+    """Workload runs per second with `clients` threads each running it `rounds` times."""
+    def client(_):
+        for _ in range(rounds):
+            for query in WORKLOAD.values():
+                executor.run(query, use_cache=False, budget=None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    return clients * rounds / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            csv_file = os.path.join(tmp, f"market_{rows}.csv")
+            replicate_csv(csv_file, rows)
+            print(f"\n{rows:,} rows ({os.path.getsize(csv_file) / 1024**2:.0f} MB CSV)")
+
+            executors, results = {}, {}
+            for engine, suffix in (("SQLite", ".db"), ("DuckDB", ".duckdb")):
+                db_name = os.path.join(tmp, f"market_{rows}{suffix}")
+                start = time.perf_counter()
+                ingest_csv(csv_file, db_name=db_name)
+                print(f"  {engine:<6} ingestion {time.perf_counter() - start:6.1f}s, file {os.path.getsize(db_name) / 1024**2:6.0f} MB")
+                executors[engine] = get_executor(db_name)
+
+            for name, query in WORKLOAD.items():
+                latencies = {}
+                for engine, executor in executors.items():
+                    latencies[engine], results[engine] = median_latency(executor, query, args.repeat)
+                same = "same rows" if normalize(results["SQLite"]) == normalize(results["DuckDB"]) else "DIFFERENT ROWS"
+                print(f"  {name:<18} SQLite {latencies['SQLite'] * 1000:8.1f}ms | DuckDB {latencies['DuckDB'] * 1000:7.1f}ms "
+                      f"(x{latencies['SQLite'] / latencies['DuckDB']:5.1f}) | {same}")
+
+            rates = {engine: throughput(executor, args.clients, args.rounds) for engine, executor in executors.items()}
+            print(f"  {args.clients} concurrent clients: SQLite {rates['SQLite']:.2f} workloads/s | DuckDB {rates['DuckDB']:.2f} workloads/s "
+                  f"(x{rates['DuckDB'] / rates['SQLite']:.1f}, {os.cpu_count()} cores)")
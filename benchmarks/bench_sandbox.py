@@ -0,0 +1,89 @@
+"""
+py_code_tool execution: in-process exec with per-call imports (previous behaviour) versus the
+pre-warmed sandbox pool, the size of the data handed to the plotting code, and how runaway
+code is stopped by the limits.
+
+Run from the repository root:
+    python -m benchmarks.bench_sandbox --rows 200000 --charts 10
+"""
+import time, pickle, argparse
+import numpy as np
+
+from src.sandbox import SandboxPool, SandboxLimits, encode_frame
+
+CODE = """
+import pandas as pd
+import matplotlib.pyplot as plt
+import io, base64
+df = pd.DataFrame(result_data, columns=["category", "value"])
+fig, ax = plt.subplots()
+df.groupby("category")["value"].sum().plot.bar(ax=ax)
+buffer = io.BytesIO()
+fig.savefig(buffer, format="png")
+base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
+"""
+
+CODE_DF = CODE.replace('pd.DataFrame(result_data, columns=["category", "value"])', "result_df")
+
+RUNAWAY = {
+    "busy loop": "while True: pass",
+    "sleep": "import time; time.sleep(60)",
+    "memory hog": "blob = bytearray(8 * 1024**3)",
+}
+
+
+def make_rows(count: int) -> list:
+    rng = np.random.default_rng(0)
+    return list(zip((f"c{i}" for i in rng.integers(0, 20, count)), rng.random(count).tolist()))
+
+
+def in_process(rows: list) -> str:
+    namespace = {"result_data": rows}
+    exec("import matplotlib.pyplot as plt", namespace, namespace)
+    exec("import pandas as pd", namespace, namespace)
+    exec("import io", namespace, namespace)
+    exec("import base64", namespace, namespace)
+    exec(CODE, namespace, namespace)
+    namespace["plt"].close("all")
+    return namespace["base64_image"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--charts", type=int, default=10)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    tuples_bytes = len(pickle.dumps(rows, protocol=5))
+    frame = encode_frame(["category", "value"], rows)
+    print(f"payload for {args.rows} rows: list of tuples {tuples_bytes / 1e6:.1f} MB, columnar frame {len(frame) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    in_process(rows)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.charts):
+        in_process(rows)
+    print(f"in-process exec : first chart {first:.2f}s, then {(time.perf_counter() - start) / args.charts:.2f}s/chart (no limits)")
+
+    limits = SandboxLimits(cpu_seconds=5, wall_seconds=10, max_memory=2 * 1024**3, max_tasks=args.charts + 10)
+    pool = SandboxPool(size=1, limits=limits)
+    start = time.perf_counter()
+    pool.run("base64_image = ''")
+    print(f"sandbox warm-up : {time.perf_counter() - start:.2f}s (paid once, in the background in the app)")
+    start = time.perf_counter()
+    for _ in range(args.charts):
+        assert pool.run(CODE, encode_frame(["category", "value"], rows))["ok"]
+    print(f"sandbox pool    : {(time.perf_counter() - start) / args.charts:.2f}s/chart (incl. encoding the frame)")
+    start = time.perf_counter()
+    for _ in range(args.charts):
+        assert pool.run(CODE_DF, encode_frame(["category", "value"], rows))["ok"]
+    print(f"sandbox pool    : {(time.perf_counter() - start) / args.charts:.2f}s/chart using result_df")
+
+    for name, code in RUNAWAY.items():
+        start = time.perf_counter()
+        reply = pool.run(code)
+        print(f"{name:<11}: stopped after {time.perf_counter() - start:.1f}s with {reply['error_type']}")
+    print(f"pool stats: {pool.get_stats()}")
+    pool.close()
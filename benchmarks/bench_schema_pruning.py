@@ -0,0 +1,94 @@
+"""
+Text2SQL prompt size and latency on wide tables: every column with its sample values in the
+prompt (schema_columns covering the table) versus the BM25 selected columns. Also the size of
+the shared dataset text (every InsightGenerator node) and of the orchestrator system prompt.
+
+Synthetic tables of 50 to 800 columns named metric_region_period (revenue_emea_q3...), each
+question names one column in words, every 4th with a synonym of the metric. The fake LLM
+answers with that column when it is in the prompt and with an unknown one otherwise (the
+selection then widens on the retry), and takes `--ms-per-1k` milliseconds per 1000 prompt tokens on top of `--latency`.
+
+Run from the repository root:
+    python -m benchmarks.bench_schema_pruning --columns 50 200 800 --questions 20
+"""
+import os, json, time, random, argparse, tempfile
+from langchain_core.messages import SystemMessage
+
+from benchmarks.fake_llm import patch_chat_openai
+from src.digest import count_tokens, build_system_prompt
+from src.schema_index import dataset_metadata
+from src.utils import csv_to_sqlite
+
+METRICS = ["revenue", "cost", "margin", "units", "returns", "discount", "churn", "signups", "visits", "tickets",
+           "refunds", "inventory", "backlog", "headcount", "latency", "uptime", "rating", "shipments", "orders", "leads"]
+REGIONS = ["emea", "apac", "latam", "na", "dach", "nordics", "benelux", "iberia", "uk", "anz"]
+PERIODS = ["q1", "q2", "q3", "q4"]
+# Every 4th question says the metric in other words, the name does not match it
+SYNONYMS = {"revenue": "sales", "cost": "spend", "units": "volume", "orders": "purchases", "visits": "traffic"}
+
+
+def make_columns(count: int) -> list:
+    names = [f"{metric}_{region}_{period}" for metric in METRICS for region in REGIONS for period in PERIODS]
+    return ["id"] + random.Random(count).sample(names, count - 1)
+
+
+def write_table(path: str, columns: list, rows: int):
+    rng = random.Random(len(columns))
+    with open(path, "w") as file:
+        file.write(",".join(columns) + "\n")
+        for row in range(rows):
+            file.write(",".join([str(row)] + [f"{rng.random() * 1000:.2f}" for _ in columns[1:]]) + "\n")
+
+
+def make_responder(target: dict, base: float, ms_per_1k: float, log: list):
+    def respond(messages):
+        prompt = "".join(str(message.content) for message in messages if isinstance(message, SystemMessage))
+        tokens = count_tokens("".join(str(message.content) for message in messages))
+        log.append(tokens)
+        time.sleep(base + ms_per_1k * tokens / 1000 / 1000)
+        column = target["column"] if f"'{target['column']}'" in prompt else "unknown_column"
+        return json.dumps({"sql": [f"SELECT AVG({column}) FROM data"]})
+    return respond
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--columns", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--ms-per-1k", type=float, default=40.0, help="prompt processing time per 1000 tokens")
+    args = parser.parse_args()
+
+    target, log = {}, []
+    patch_chat_openai(responder=make_responder(target, args.latency, args.ms_per_1k, log))
+    from src.agent import Text2SQL_Agent, sys_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.columns:
+            columns = make_columns(count)
+            csv_file, db_name = os.path.join(tmp, f"wide_{count}.csv"), os.path.join(tmp, f"wide_{count}.db")
+            write_table(csv_file, columns, args.rows)
+            csv_to_sqlite(csv_file, db_name=db_name)
+            metadata = dataset_metadata(db_name=db_name)
+            orchestrator = build_system_prompt(sys_data["orchestrator"], metadata, {})
+            print(f"{count:>4} columns: dataset text {count_tokens(metadata):>6,} tokens, insight generator prompt "
+                  f"{count_tokens(sys_data['insight_generator'] + metadata):>6,} tokens, orchestrator prompt {count_tokens(orchestrator):>6,} tokens "
+                  f"(dataset text {'cut' if metadata not in orchestrator else 'complete'})")
+            rng = random.Random(0)
+            renamed = [column for column in columns[1:] if column.split("_")[0] in SYNONYMS]
+            questions = [rng.choice(renamed) if i % 4 == 3 else rng.choice(columns[1:]) for i in range(args.questions)]
+
+            for label, schema_columns in (("full schema", 10**9), ("pruned", None)):
+                t2s = Text2SQL_Agent(sys_data["text_to_sql"], db_name=db_name, use_cache=False,
+                                     **({"schema_columns": schema_columns} if schema_columns else {}))
+                log.clear()
+                failed, start = 0, time.perf_counter()
+                for i, column in enumerate(questions):
+                    metric, region, period = column.split("_")
+                    metric = SYNONYMS.get(metric, metric) if i % 4 == 3 else metric
+                    target["column"] = column
+                    failed += bool(t2s.invoke(f"Average {metric} in {region.upper()} for {period.upper()}").get("run_failed"))
+                seconds = (time.perf_counter() - start) / len(questions)
+                print(f"{count:>4} columns {label:<11}: prompt {sum(log) / len(log):>8,.0f} tokens, {len(log) / len(questions):.2f} LLM calls "
+                      f"and {seconds * 1000:6.0f}ms per question, failed {failed}")
@@ -0,0 +1,49 @@
+"""
+LLM retries and latency of Text2SQL_Agent with and without local SQL validation/repair.
+
+Every scenario makes the fake LLM answer first with a mechanically broken query and with
+the correct one on the retry, like gpt-4o usually does after reading the exception.
+
+Run from the repository root:
+    python -m benchmarks.bench_sql_repair --latency 1.0
+"""
+import os, json, time, argparse, tempfile
+
+import src.agent as agent
+import src.sql_validator as sql_validator
+from src.utils import csv_to_sqlite
+from benchmarks.fake_llm import patch_chat_openai
+
+CORRECT = 'SELECT "Market Category", COUNT(*) FROM data GROUP BY "Market Category"'
+SCENARIOS = {
+    "unquoted column": json.dumps({"sql": ["SELECT Market Category, COUNT(*) FROM data GROUP BY Market Category"]}),
+    "column case/underscores": json.dumps({"sql": ["SELECT market_category, COUNT(*) FROM data GROUP BY 1"]}),
+    "wrong table name": json.dumps({"sql": ['SELECT "Market Category", COUNT(*) FROM market_data GROUP BY 1']}),
+    "markdown fence": "```json\n" + json.dumps({"sql": [CORRECT]}) + "\n```",
+    "semantic error": json.dumps({"sql": ["SELECT Price FROM data"]}),
+}
+
+
+def run(db_name: str, broken: str, latency: float, validate: bool) -> tuple[int, float]:
+    fakes = patch_chat_openai(latency=latency, content=json.dumps({"sql": [CORRECT]}), responses=[broken])
+    t2s = agent.Text2SQL_Agent(agent.sys_data["text_to_sql"], db_name=db_name, use_cache=False, validate=validate)
+    start = time.perf_counter()
+    t2s.invoke("Count securities per market category")
+    return fakes[0].calls, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        csv_to_sqlite("data/market_data.csv", db_name=db_name)
+
+        print(f"{'scenario':<25} {'LLM calls before':>16} {'after':>6} {'latency before':>15} {'after':>7}")
+        for name, broken in SCENARIOS.items():
+            calls_before, latency_before = run(db_name, broken, args.latency, validate=False)
+            calls_after, latency_after = run(db_name, broken, args.latency, validate=True)
+            print(f"{name:<25} {calls_before:>16} {calls_after:>6} {latency_before:>14.2f}s {latency_after:>6.2f}s")
+        print("validator stats:", sql_validator.get_stats())
@@ -0,0 +1,49 @@
+import time, json, threading
+from langchain_core.messages import AIMessage
+
+
+class FakeLLM():
+    """
+    Stand-in for ChatOpenAI that sleeps for `latency` seconds per call and answers with a
+    canned JSON payload, so the agent graphs can be timed without network access.
+    """
+
+    def __init__(self, latency: float = 0.2, content: str = None, responses: list = None, responder=None, **kwargs):
+        self.latency = latency
+        self.content = content if content is not None else json.dumps({"sql": ["SELECT 1"]})
+        self.responses = list(responses or [])
+        self.responder = responder
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages, *args, **kwargs):
+        """
+        Answers with `responder(messages)` when given, else from `responses` in order while there
+        are any left, then with `content`. An AIMessage answer (e.g. with tool calls) is returned as is.
+        """
+        with self._lock:
+            self.calls += 1
+            if self.responder is not None:
+                content = self.responder(messages)
+            else:
+                content = self.responses.pop(0) if self.responses else self.content
+        time.sleep(self.latency)
+        return content if isinstance(content, AIMessage) else AIMessage(content)
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def patch_chat_openai(latency: float = 0.2, content: str = None, responses: list = None, responder=None):
+    """Replaces ChatOpenAI in src.llm with a FakeLLM factory and returns the created fakes."""
+    import src.llm as llm
+    created = []
+
+    def factory(*args, **kwargs):
+        fake = FakeLLM(latency=latency, content=content, responses=responses, responder=responder)
+        created.append(fake)
+        return fake
+
+    llm.ChatOpenAI = factory
+    llm.reset_chat_models()
+    return created
@@ -0,0 +1,145 @@
+"""
+Local OpenAI-compatible chat completions server with rate limits, for exercising the LLM
+gateway (and the app) without network access or an API key.
+
+POST /v1/chat/completions answers after `latency` seconds, plain JSON or SSE when "stream"
+is set (ending with a usage chunk when stream_options.include_usage is). More than `max_requests` requests or `max_tokens` tokens within `window` seconds get a
+429 with Retry-After, like the OpenAI API.
+
+Standalone, then point the app at it:
+    python -m benchmarks.fake_openai_server --port 8765 --max-requests 60 --window 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+"""
+import json, math, time, uuid, argparse, threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer():
+
+    def __init__(self, port: int = 0, latency: float = 0.2, max_requests: int = 60, max_tokens: int = None, window: float = 60.0, content: str = None):
+        self.latency = latency
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.window = window
+        self.content = content or "This is a fake completion."
+        self.accepted = deque()          # (time, tokens) of the requests inside the window
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "bodies": {}}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def admit(self, tokens: int) -> float:
+        """0 when the request is within the limits, else the seconds to wait (Retry-After)."""
+        with self.lock:
+            now = time.monotonic()
+            self.stats["requests"] += 1
+            while self.accepted and now - self.accepted[0][0] >= self.window:
+                self.accepted.popleft()
+            over_requests = self.max_requests is not None and len(self.accepted) >= self.max_requests
+            over_tokens = self.max_tokens is not None and sum(t for _, t in self.accepted) + tokens > self.max_tokens
+            if over_requests or over_tokens:
+                self.stats["rate_limited"] += 1
+                return max(self.window - (now - self.accepted[0][0]), 0.01) if self.accepted else self.window
+            self.accepted.append((now, tokens))
+            self.stats["ok"] += 1
+            return 0.0
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status: int, payload: dict, headers: dict = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": "not found"}})
+                    return
+                request = json.loads(body or b"{}")
+                prompt_tokens = len(body) // 4
+                completion_tokens = len(server.content) // 4
+                with server.lock:
+                    server.stats["bodies"][body] = server.stats["bodies"].get(body, 0) + 1
+
+                retry_after = server.admit(prompt_tokens + completion_tokens)
+                if retry_after:
+                    self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                   {"Retry-After": str(math.ceil(retry_after)), "retry-after-ms": str(int(retry_after * 1000))})
+                    return
+
+                time.sleep(server.latency)
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                content = server.content
+                if request.get("response_format", {}).get("type") == "json_object":
+                    content = json.dumps({"answer": content})
+                if not request.get("stream"):
+                    self.send_json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": request.get("model", "gpt-4o"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for index, word in enumerate(content.split(" ")):
+                    delta = {"content": (" " if index else "") + word}
+                    if index == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model", "gpt-4o"),
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model", "gpt-4o"),
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    usage = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model", "gpt-4o"), "choices": [],
+                             "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}}
+                    self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-requests", type=int, default=60)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--window", type=float, default=60.0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.port, args.latency, args.max_requests, args.max_tokens, args.window)
+    print(f"fake OpenAI server on {server.url}")
+    server.server.serve_forever()
@@ -1,15 +1,37 @@
-import sqlite3, json
+import json, uuid, logging
 from src.utils import *
+from concurrent.futures import ThreadPoolExecutor
+from src.sql_cache import SQLMemoCache, get_sql_cache
+from src.insight_cache import schema_fingerprint, hash_text
+from src.digest import build_system_prompt, count_tokens
+from src.sql_validator import parse_sql_queries, validate_sql
+from src.sql_executor import QueryBudget, QueryBudgetExceeded, INTERACTIVE_BUDGET, INSIGHT_BUDGET, EXACT_REFRESH_BUDGET, dialect_prompt, engine_name
+from src.approximate import run_approximate
 from typing import Literal
 from src.agent_states import *
-from langchain_openai import ChatOpenAI
+from src.llm import get_chat_model
+from src.sandbox import get_sandbox_pool, encode_frame, MAX_FRAME_ROWS
+from src.image_store import get_image_store
+from src.chart_spec import render_chart_spec, ChartSpecError
+from src.profiler import profile_digest
+from src.schema_index import TOP_K_COLUMNS, get_schema_index, is_schema_error, parse_descriptions
+from src.memory import HISTORY_TOKENS, TOOL_TOKENS, compact_history, format_turns, get_checkpointer, prune_checkpoints, split_turns
 from IPython.display import Image, display
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode, tools_condition
+from typing import Annotated
+from langgraph.types import Command
+from langchain_core.tools import InjectedToolCallId
+from langchain_core.runnables import RunnableConfig
+from langgraph.prebuilt import ToolNode, InjectedState, tools_condition
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, AIMessageChunk, ToolMessage
 
 
+logger = logging.getLogger(__name__)
+
+# Parts of a stored query result compared by refresh_insight to decide whether to re-summarize
+RESULT_CHECK_KEYS = ("db_result", "total_rows", "summary")
+
 # -------------------------------- Load System Messages ---------------------------------
 
 sys_data = load_system_message()
@@ -17,74 +39,124 @@ sys_data = load_system_message()
 # ----------------------------------------- Agents --------------------------------------
 
 class Text2SQL_Agent():
+    """
+    Compiled once and shared: everything about a single request (prompt, retry count, cache key...)
+    lives in the graph state, so one instance can serve concurrent invocations.
+    """
     
-    def __init__(self,prompt:str, system_prompt:str, db_name:str="data/data.db",table_name:str="data", database_type:str="SQLite",max_try:int=3):
-        self.llm  = ChatOpenAI(model="gpt-4o", model_kwargs={ "response_format": { "type": "json_object" } })
-        self.prompt = prompt
+    def __init__(self, system_prompt:str, db_name:str="data/data.db",table_name:str="data", database_type:str=None,max_try:int=3, use_cache:bool=True, max_rows:int=200, budget:QueryBudget=INTERACTIVE_BUDGET, validate:bool=True, priority:str="interactive", schema_columns:int=TOP_K_COLUMNS,
+                 approximate:bool=False):
+        self.llm  = get_chat_model(json_mode=True, priority=priority)
         self.db_name = db_name
+        self.schema_columns = schema_columns
+        # Estimate from the ingestion sample (scaled, with margins) instead of scanning the whole table
+        self.approximate = approximate
         self.max_try = max_try
+        self.max_rows = max_rows
+        self.budget = budget
+        self.validate = validate
         self.table_name = table_name
-        self.database_type = database_type
+        # Defaults to the engine that runs the SQL (SQLite or DuckDB), the prompt asks for its dialect
+        self.database_type = database_type or engine_name(db_name)
         self.system_prompt = system_prompt
-        self.run_failed = False
-        self.loop_count = 0
+        self.sql_cache = get_sql_cache() if use_cache else None
 
         self.compile()
 
+    def schema_prompt(self, state: Text2SQLState) -> str:
+        # Wide tables: only the columns relevant to this request, the selection widens after an unknown column
+        index = get_schema_index(self.db_name, self.table_name)
+        if index is None:
+            return ""
+        return f"\n- Schema={index.schema_prompt(state['prompt'], state.get('schema_width') or self.schema_columns)}"
+
     def text_to_sql_node(self, state: Text2SQLState):
-        
-        self.loop_count += 1
 
         if state.get("loop_again", True):
-            sys_prompt = SystemMessage(self.system_prompt + f"\n- Table_name={self.table_name}\n- database_type={self.database_type}")
-            issue_prompt = HumanMessage(f"Exception has {state.get('exception_message', '')} {self.prompt}")
+            sys_prompt = SystemMessage(self.system_prompt + f"\n- Table_name={self.table_name}\n- database_type={dialect_prompt(self.database_type)}" + self.schema_prompt(state))
+            issue_prompt = HumanMessage(f"Exception has {state.get('exception_message', '')} {state['prompt']}")
 
             result = self.llm.invoke([sys_prompt] + state["messages"] + [issue_prompt] )
         else:
-            sys_prompt = SystemMessage(sys_data["text_to_sql"] + f"\n- Table_name={self.table_name}\n- database_type={self.database_type}")
+            sys_prompt = SystemMessage(sys_data["text_to_sql"] + f"\n- Table_name={self.table_name}\n- database_type={dialect_prompt(self.database_type)}" + self.schema_prompt(state))
             result = self.llm.invoke([sys_prompt] + state["messages"])
 
-        if self.loop_count > self.max_try:
-            self.run_failed = True   
-
-        return {"messages": [result], "sql_queries": result.content, "loop_again": False}
+        return {"messages": [result], "sql_queries": result.content, "loop_again": False, "loop_count": state.get("loop_count", 0) + 1, "from_cache": False}
     
     def execute_sql_node(self, state: Text2SQLState):
         current_sql_query = ""
         result = list()
         try:
-            sql_queries = json.loads(state["sql_queries"] if hasattr(state["sql_queries"], "sql") else str(state["sql_queries"]))
+            if self.validate:
+                sql_queries = parse_sql_queries(state["sql_queries"])
+            else:
+                sql_queries = json.loads(state["sql_queries"] if hasattr(state["sql_queries"], "sql") else str(state["sql_queries"]))
             
             try:
                 for sql_query in sql_queries["sql"]:
                     current_sql_query = sql_query
-                    db_result = self.run_sql_query(sql_query)
-                    result.append({ "sql_query": current_sql_query, "db_result": db_result})
+                    if self.validate:
+                        # Mechanical mistakes are fixed here instead of costing an LLM retry
+                        current_sql_query, _ = validate_sql(sql_query, self.db_name, self.table_name)
+                    query_result = self.run_sql_query(current_sql_query)
+                    result.append({ "sql_query": current_sql_query, **query_result.to_dict()})
+
+                if state.get("cache_key") and not state.get("from_cache"):
+                    self.sql_cache.put(state["cache_key"], state["prompt"], json.dumps({"sql": [pair["sql_query"] for pair in result]}))
                 
                 return {"loop_again": False, "result_data": result}
+
+            except QueryBudgetExceeded as e:
+                exception_message = f"""
+                    Query {current_sql_query} was not run to completion. {str(e)}
+                    Data base Information: - Database Type = {self.database_type} - Table_name = {self.table_name}\n
+                """
+                return self.retry_or_fail(state, exception_message)
             
             except Exception as e:
                 exception_message = f"""
                     Exception occurred while trying to run query {current_sql_query} exception {str(e)}
                     Data base Information: - Database Type = {self.database_type} - Table_name = {self.table_name}\n
                 """
-                return {"loop_again": True, "exception_message": exception_message}
+                return self.retry_or_fail(state, exception_message)
 
             
         except Exception as e:
             exception_message = f"Exception occurred while trying to convert {state["sql_queries"]} to Json.loads {str(e)}"
-            return {"loop_again": True, "exception_message": exception_message}
+            return self.retry_or_fail(state, exception_message)
+
+    def retry_or_fail(self, state: Text2SQLState, exception_message: str):
+        if state.get("from_cache") and state.get("cache_key"):
+            # The memoized SQL failed, forget it so the next request does not start from it again
+            self.sql_cache.delete(state["cache_key"])
+        # Give up once every retry was spent instead of looping until the recursion limit
+        if state.get("loop_count", 0) > self.max_try:
+            return {"loop_again": False, "run_failed": True, "exception_message": exception_message}
+        if is_schema_error(exception_message):
+            return {"loop_again": True, "exception_message": exception_message, "schema_width": 2 * (state.get("schema_width") or self.schema_columns)}
+        return {"loop_again": True, "exception_message": exception_message}
         
     def run_sql_query(self, query):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        # Only a bounded preview goes back into the LLM context
+        if self.approximate:
+            return run_approximate(query, self.db_name, self.table_name, max_rows=self.max_rows, budget=self.budget)
+        return run_bounded_query(query, self.db_name, max_rows=self.max_rows, budget=self.budget)
 
     def loop_again_condition(self,state: Text2SQLState)-> Literal["text_to_sql", END]:
         return "text_to_sql" if state.get("loop_again", False) else END
+
+    def start_condition(self,state: Text2SQLState)-> Literal["text_to_sql", "execute_sql"]:
+        # A memoized SQL skips the LLM and goes straight to execution
+        return "execute_sql" if state.get("sql_queries") else "text_to_sql"
+
+    def cache_key(self, prompt: str):
+        if self.sql_cache is None:
+            return None
+        try:
+            schema_hash = schema_fingerprint(run_sql_query(f"PRAGMA table_info({self.table_name});", self.db_name))
+        except Exception:
+            return None
+        return SQLMemoCache.make_key(prompt, schema_hash, hash_text(self.system_prompt), self.table_name, self.database_type)
     
     def compile(self):
         builder = StateGraph(Text2SQLState)
@@ -92,12 +164,12 @@ class Text2SQL_Agent():
         builder.add_node("execute_sql", self.execute_sql_node)
 
         # Regular flow
-        builder.add_edge(START, "text_to_sql")
+        builder.add_conditional_edges(START, self.start_condition)
         builder.add_edge("text_to_sql", "execute_sql")
         builder.add_conditional_edges("execute_sql", self.loop_again_condition)
         
         # Compile the graph
-        self.graph = builder.compile()
+        self.graph = builder.compile(checkpointer=False)
 
     def print_graph(self):
         try:
@@ -107,28 +179,52 @@ class Text2SQL_Agent():
             print("Failed to render graph image:", e)
             print(self.graph.get_graph(xray=True).draw_mermaid())
 
-    def invoke(self):
-        return self.graph.invoke({"messages": [HumanMessage(self.prompt)], "loop_again": False})
+    def invoke(self, prompt:str):
+        """Returns the final state, `result_data` holds the results and `run_failed` is set when every retry failed."""
+        state = {"messages": [HumanMessage(prompt)], "prompt": prompt, "loop_again": False, "loop_count": 0, "run_failed": False}
+        state["cache_key"] = self.cache_key(prompt)
+        cached = self.sql_cache.get(state["cache_key"]) if state["cache_key"] else None
+        if cached is not None:
+            state["sql_queries"] = cached
+            state["from_cache"] = True
+        return self.graph.invoke(state)
     
 
 class InsightGenerator():
     
-    def __init__(self,metadata:str):
-        self.llm  = ChatOpenAI(model="gpt-4o", model_kwargs={ "response_format": { "type": "json_object" } })
+    def __init__(self,metadata:str, max_concurrency:int=4, db_name:str="data/data.db", table_name:str="data", approximate:bool=False, use_cache:bool=True):
+        # Background lane of the LLM gateway, chat requests are admitted first
+        self.llm  = get_chat_model(json_mode=True, priority="background")
         self.metadata = metadata
-        self.loop_count = 0
+        self.max_concurrency = max(1, max_concurrency)
+        self.db_name = db_name
+        self.table_name = table_name
+        # approximate: insight SQL runs on the ingestion sample, refresh_exact re-runs it on the table
+        self.approximate = approximate
+        # One compiled Text2SQL graph serves every insight thread
+        self.text_to_sql = Text2SQL_Agent(sys_data["text_to_sql"], db_name=db_name, table_name=table_name, budget=INSIGHT_BUDGET, priority="background",
+                                          approximate=approximate, use_cache=use_cache)
         self.compile()
 
     def metadata_node(self, state: InsightState):
         sys_prompt = SystemMessage(sys_data["metadata"])
-        return {"messages": [self.llm.invoke([sys_prompt] + state["messages"])]}
+        # Stats over all rows from the ingestion profile, the sample rows alone are easy to misread
+        profile = get_column_profile(self.table_name, self.db_name)
+        profile_message = [HumanMessage(f"Column profile (all rows):\n{profile_digest(profile)}")] if profile else []
+        messages = state["messages"] + profile_message
+        metadata = self.llm.invoke([sys_prompt] + messages)
+        # The column descriptions make the schema index match requests phrased in business terms
+        index = get_schema_index(self.db_name, self.table_name)
+        if index is not None:
+            index.add_descriptions(parse_descriptions(metadata.content))
+        return {"messages": profile_message + [metadata]}
     
     def relation_mapper_node(self, state: InsightState):
         sys_prompt = SystemMessage(sys_data["relation_mapper"])
         return {"messages": [self.llm.invoke([sys_prompt] + state["messages"])]}
     
     def insight_generator_node(self, state: InsightState):
-        self.loop_count += 1
+        loop_count = state.get("loop_count", 0) + 1
 
         if state.get("loop_again", False):
             sys_prompt = SystemMessage(sys_data["insight_generator"])
@@ -138,10 +234,10 @@ class InsightGenerator():
             issue_prompt = HumanMessage(f"Correct the insight json generated {state.get('insights', '')} exception {state.get('exception_message', '')}")
             insights = self.llm.invoke([sys_prompt] + state["messages"]+ [issue_prompt])
 
-        if self.loop_count > 2:
+        if loop_count > 2:
             raise Exception("Loop count exceeded")
 
-        return {"messages": [insights], "insights": insights.content, "loop_again": False}
+        return {"messages": [insights], "insights": insights.content, "loop_again": False, "loop_count": loop_count}
 
     def check_json_syntax_node(self, state: InsightState):
         try:
@@ -151,19 +247,94 @@ class InsightGenerator():
             error = f"Expected JSON syntax error {e}"
             return {"loop_again": True, "exception_message": error}
         
+    def build_insight(self, insight_name: str, insight_data: dict, messages: list):
+        """Runs the Text2SQL agent and the summarizer for one insight, returns None if the SQL failed."""
+        t2s_result = self.text_to_sql.invoke(str({insight_name: insight_data}))
+        if t2s_result.get("run_failed"):
+            return None
+        insight_data["sql_results_pair"] = t2s_result["result_data"]
+        insight_summary = self.llm.invoke([sys_data["summarizer"]] + messages + [HumanMessage(f"The insight {insight_name} {insight_data}")])
+        insight_data["insight_summary"] = insight_summary.content
+        return insight_data
+
+    def refresh_insight(self, insight_name: str, insight_data: dict, messages: list):
+        """
+        Re-runs the stored SQL of a cached insight, the summarizer is only called when a result changed.
+        Returns (insight_data, changed), a failing query raises.
+        """
+        pairs = []
+        for pair in insight_data.get("sql_results_pair", []):
+            pairs.append({"sql_query": pair["sql_query"], **self.text_to_sql.run_sql_query(pair["sql_query"]).to_dict()})
+
+        # Cached results went through JSON, compare in the same representation. The preview is capped,
+        # the row count and the full-result column stats (truncated results only) catch changes past it
+        old_results = [[pair.get(key) for key in RESULT_CHECK_KEYS] for pair in insight_data.get("sql_results_pair", [])]
+        changed = json.loads(json.dumps([[pair.get(key) for key in RESULT_CHECK_KEYS] for pair in pairs])) != old_results
+        insight_data["sql_results_pair"] = pairs
+        if changed:
+            insight_summary = self.llm.invoke([sys_data["summarizer"]] + messages + [HumanMessage(f"The insight {insight_name} {insight_data}")])
+            insight_data["insight_summary"] = insight_summary.content
+        return insight_data, changed
+
+    def refresh_exact(self, insight_name: str, insight_data: dict) -> dict:
+        """
+        Re-runs the SQL of an approximate insight on the whole table and summarizes the exact results.
+        Returns a new insight dict, the given one is left untouched (the UI keeps showing it meanwhile).
+        """
+        insight_data = dict(insight_data)
+        insight_data["sql_results_pair"] = [
+            {"sql_query": pair["sql_query"], **run_bounded_query(pair["sql_query"], self.db_name, max_rows=self.text_to_sql.max_rows, budget=EXACT_REFRESH_BUDGET).to_dict()}
+            for pair in insight_data.get("sql_results_pair", [])
+        ]
+        insight_summary = self.llm.invoke([sys_data["summarizer"], HumanMessage(self.metadata), HumanMessage(f"The insight {insight_name} {insight_data}")])
+        insight_data["insight_summary"] = insight_summary.content
+        return insight_data
+
+    def refresh_insights(self, insights: dict) -> tuple[dict, int, dict]:
+        """
+        Refreshes insights cached for a dataset with the same schema without regenerating them.
+        Returns the refreshed insights, the number of insights whose results changed and the
+        error message of every insight that could not be refreshed (left out of the result).
+        """
+        messages = [HumanMessage(self.metadata)]
+        refreshed, changed_count, failed = {}, 0, {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                insight_name: executor.submit(self.refresh_insight, insight_name, insight_data, messages)
+                for insight_name, insight_data in insights.items()
+            }
+            for insight_name, future in futures.items():
+                try:
+                    insight_data, changed = future.result()
+                except Exception as e:
+                    logger.warning("Refreshing insight %s failed: %s", insight_name, e)
+                    failed[insight_name] = str(e)
+                    continue
+                changed_count += changed
+                refreshed[insight_name] = insight_data
+        return refreshed, changed_count, failed
+
     def make_insight_cloud_node(self, state: InsightState):
         insights = json.loads(state["insights"])
         keys_to_remove = []
-        for insight_name, insight_data in insights.items():
-            t2s = Text2SQL_Agent(str({insight_name: insight_data}), sys_data["text_to_sql"])
-            t2s_result = t2s.invoke()
-            if t2s.run_failed:
-                keys_to_remove.append(insight_name)
-                continue
-            insight_data["sql_results_pair"] = t2s_result["result_data"]
-            insight_summary = self.llm.invoke([sys_data["summarizer"]] + state["messages"]+ [HumanMessage(f"The insight {insight_name} {insight_data}")])
-            insight_data["insight_summary"] = insight_summary.content
-            insights[insight_name] = insight_data
+
+        # Every insight is independent, fan them out and collect in the original key order
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                insight_name: executor.submit(self.build_insight, insight_name, insight_data, state["messages"])
+                for insight_name, insight_data in insights.items()
+            }
+
+            for insight_name, future in futures.items():
+                try:
+                    insight_data = future.result()
+                except Exception as e:
+                    logger.warning("Insight %s failed: %s", insight_name, e)
+                    insight_data = None
+                if insight_data is None:
+                    keys_to_remove.append(insight_name)
+                    continue
+                insights[insight_name] = insight_data
         
         # Remove the marked keys after the iteration is complete ---
         for key in keys_to_remove:
@@ -192,7 +363,7 @@ class InsightGenerator():
         
         
         # Compile the graph
-        self.graph = builder.compile()
+        self.graph = builder.compile(checkpointer=False)
 
     def print_graph(self):
         try:
@@ -207,122 +378,196 @@ class InsightGenerator():
     
 
 class GraphVisualization():
+    """
+    Compiled once, the query results and the chart of a request travel in the graph state. Every
+    text_to_sql_tool call keeps its own result, the chart tools pick one by name (latest by default).
+
+    chart_mode="spec": the LLM answers with a JSON chart spec rendered as a Plotly figure in the
+    browser, exec'd matplotlib code is only the fallback. chart_mode="code": matplotlib code only.
+    """
     
-    def __init__(self, user_prompt: str, metadata: str,table_name:str="data",database_type:str="SQLite" ,database_name:str="data/data.db"):
+    def __init__(self, metadata: str,table_name:str="data",database_type:str=None ,database_name:str="data/data.db", chart_mode:str="spec", max_tool_concurrency:int=4,
+                 schema_columns:int=TOP_K_COLUMNS):
 
-        tools = [self.text_to_sql_tool, self.py_code_tool]
-        self.llm = ChatOpenAI(model="gpt-4o").bind_tools(tools)
+        if chart_mode == "spec":
+            tools = [self.text_to_sql_tool, self.chart_spec_tool, self.py_code_tool]
+        else:
+            tools = [self.text_to_sql_tool, self.py_code_tool]
+            # Starts the plotting workers now so the first chart does not wait for their imports
+            get_sandbox_pool()
+        self.llm = get_chat_model().bind_tools(tools)
         self.tool_node = ToolNode(tools=tools)
-        self.prompt = user_prompt
         self.metadata = metadata
+        self.chart_mode = chart_mode
+        self.max_tool_concurrency = max(1, max_tool_concurrency)
+        self.schema_columns = schema_columns
         self.db_name = database_name
         self.table_name = table_name
-        self.database_type = database_type
-        self.database_results = []
+        self.database_type = database_type or engine_name(database_name)
+        self.system_prompt = self.make_system_prompt()
         self.compile()
     
-    def make_system_prompt(self):
+    def make_system_prompt(self, metadata: str = None):
         return SystemMessage(
-            sys_data["chart_display"] +
-            f"\n- Metadata = {self.metadata},\n **database_type** = {self.database_type}, \n**table_name** = {self.table_name}"
+            sys_data["chart_spec" if self.chart_mode == "spec" else "chart_display"] +
+            f"\n- Metadata = {metadata or self.metadata},\n **database_type** = {dialect_prompt(self.database_type)}, \n**table_name** = {self.table_name}"
         )
     
     def run_sql_query(self, query):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return run_sql_query(query, self.db_name)
+
+    @staticmethod
+    def pick_result(state: dict, result_name: str = None):
+        """(query result, None) for `result_name` (a text_to_sql_tool name or call id), the latest one without a name, else (None, error)."""
+        results = state.get("database_results") or {}
+        if not results:
+            return None, "Error: call text_to_sql_tool first, the chart is built from its result."
+        if not result_name:
+            return next(reversed(results.values()))["result"], None
+        for call_id, entry in reversed(results.items()):
+            if result_name in (call_id, entry["name"]):
+                return entry["result"], None
+        return None, f"Error: unknown result_name {result_name}, available: {[entry['name'] or call_id for call_id, entry in results.items()]}"
     
-    def text_to_sql_tool(self, query: str):
+    def text_to_sql_tool(self, query: str, tool_call_id: Annotated[str, InjectedToolCallId], name: str = None):
         """
         Provided a SQL query, returns the result of the query.
 
         Parameters:
             query (str): A Runnable SQL query.
+            name (str): Optional short name of the result, the chart tools reference it as result_name.
 
         Returns:
             result from database
         """
         try:
-            self.database_results = self.run_sql_query(query)
-            return self.database_results[:5]
+            # The full result is spilled to disk for py_code_tool, the LLM only sees a preview
+            database_results = run_bounded_query(query, self.db_name, spill=True)
+            preview = database_results.to_dict()
+            preview["db_result"] = preview["db_result"][:5]
+            preview["result_name"] = name or tool_call_id
+            return Command(update={
+                "database_results": {tool_call_id: {"name": name, "result": database_results}},
+                "messages": [ToolMessage(json.dumps(preview, default=str), tool_call_id=tool_call_id)],
+            })
         except Exception as e:
             return "Exception in text_to_sql_tool ->",e    
     
-    def py_code_tool(self,code_string: str,execution_globals: dict = None) -> str:
+    def chart_spec_tool(self, spec: dict, state: Annotated[dict, InjectedState], tool_call_id: Annotated[str, InjectedToolCallId], result_name: str = None) -> str | Command:
         """
-        Executes Python code provided as a string and returns the value of 'base64_image'.
-        The variable 'result_data' (containing results from the database) is injected into the execution namespace.
-        """
-        namespace = {}
-        if execution_globals:
-            namespace.update(execution_globals)
-
-        if self.database_results is not None:
-            namespace['result_data'] = self.database_results
-        else:
-            namespace['result_data'] = []
-            print("Warning: self.database_results not set before calling py_code_tool.")
+        Renders a text_to_sql_tool result as an interactive chart from a JSON spec.
 
+        Parameters:
+            spec (dict): {"chart_type": bar|line|area|scatter|pie|histogram|box, "x": column, "y": column or list of columns,
+                "series": optional column, "aggregation": sum|mean|count|min|max|none, "title": str,
+                "sort": optional x|y|-y, "limit": optional int}
+            result_name (str): Name given to the text_to_sql_tool call to draw, the latest result when omitted.
 
+        Returns:
+            A confirmation or the validation error to fix.
+        """
+        database_results, error = self.pick_result(state, result_name)
+        if error:
+            return error
         try:
-            exec("import matplotlib.pyplot as plt", namespace, namespace)
-            exec("import pandas as pd", namespace, namespace)
-            exec("import io", namespace, namespace)
-            exec("import base64", namespace, namespace)
-            exec(code_string, namespace, namespace)
-            try:
-                if 'plt' in namespace:
-                    namespace['plt'].close('all')
-            except Exception:
-                pass # Ignore errors during cleanup
-
-            result = namespace.get('base64_image')
-
-            if result is not None and isinstance(result, str):
-                self.base64_image = result
-                return "image created successfully -> "+result[:30]
-            elif result is None:
-                return "Error: Python code executed successfully, but the required 'base64_image' variable was not set or was None."
-            else:
-                return f"Error: Python code executed, 'base64_image' was set, but it is not a string (type: {type(result)}). It must be a base64 encoded string."
-
-        except NameError as e:
-            return f"Error during Python code execution (NameError): {e}. Ensure the code accesses data via the 'result_data' variable (list of dicts) and imports necessary libraries (pandas, matplotlib, etc.)."
-        except ImportError as e:
-            return f"Error during Python code execution (ImportError): {e}. Ensure the Python code includes all necessary imports (e.g., pandas, matplotlib.pyplot, seaborn, base64, io)."
-        except Exception as e:
-            import traceback
-            tb_str = traceback.format_exc()
-            error_details = f"Error during Python code execution: {type(e).__name__}: {e}\n"
-            error_details += f"Data available in 'result_data': {namespace.get('result_data', 'Not Set')}\n"
-            error_details += f"Traceback:\n{tb_str}"
-            return error_details
+            chart_json, spec, notes = render_chart_spec(spec, database_results.columns, database_results.iter_rows())
+        except (ChartSpecError, KeyError, TypeError, ValueError) as e:
+            return f"Error: invalid chart spec: {e}"
+        y = ", ".join(spec["y"])
+        message = f"chart created: {spec['chart_type']} of {y or spec['aggregation']} by {spec['x']}" + (f" ({'; '.join(notes)})" if notes else "")
+        return Command(update={
+            "chart_json": chart_json,
+            "messages": [ToolMessage(message, tool_call_id=tool_call_id)],
+        })
+
+    def py_code_tool(self,code_string: str, state: Annotated[dict, InjectedState], tool_call_id: Annotated[str, InjectedToolCallId], execution_globals: dict = None,
+                     result_name: str = None) -> str | Command:
+        """
+        Executes Python code provided as a string that draws a matplotlib figure, the figure is stored as a PNG image.
+        The variable 'result_data' (containing results from the database) is injected into the execution namespace,
+        'result_df' holds the same rows as a pandas DataFrame. result_name picks the text_to_sql_tool result (latest by default).
+        """
+        database_results, error = self.pick_result(state, result_name)
+        if result_name and error:
+            return error
+        capped = database_results is not None and database_results.total_rows > MAX_FRAME_ROWS
+        if database_results is not None:
+            frame = encode_frame(database_results.columns, database_results.iter_rows())
+        else:
+            frame = None
+            print("Warning: database_results not set before calling py_code_tool.")
+
+        # LLM-written code runs in a pre-warmed worker process with CPU, memory and time limits
+        reply = get_sandbox_pool().run(code_string, frame, execution_globals)
+
+        if reply["ok"]:
+            if reply["png"] is None:
+                return "Error: Python code executed successfully, but no matplotlib figure was drawn."
+            image_ref = get_image_store().put(reply["png"])
+            return Command(update={
+                "image_ref": image_ref,
+                "messages": [ToolMessage(f"image created successfully -> {image_ref[:12]}"
+                                         + (f" (only the first {MAX_FRAME_ROWS} of {database_results.total_rows} rows were plotted, aggregate in SQL)" if capped else ""),
+                                         tool_call_id=tool_call_id)],
+            })
+
+        if reply["error_type"] == "NameError":
+            return f"Error during Python code execution (NameError): {reply['error']}. Ensure the code accesses data via the 'result_data' variable (list of tuples) or 'result_df' (DataFrame) and imports necessary libraries (pandas, matplotlib, etc.)."
+        if reply["error_type"] in ("ImportError", "ModuleNotFoundError"):
+            return f"Error during Python code execution (ImportError): {reply['error']}. Ensure the Python code includes all necessary imports (e.g., pandas, matplotlib.pyplot, seaborn)."
+        if reply["error_type"] in ("TimeoutError", "CPUTimeExceeded", "MemoryError"):
+            return f"Error during Python code execution ({reply['error_type']}): {reply['error']}. Aggregate the data in SQL and keep the plotting code simple."
+        error_details = f"Error during Python code execution: {reply['error_type']}: {reply['error']}\n"
+        error_details += f"Data available in 'result_data': {reply.get('result_data', 'Not Set')}\n"
+        error_details += f"Traceback:\n{reply['traceback']}"
+        return error_details
         
+    def tools_node(self, state: GraphVisualizationState, config: RunnableConfig):
+        """
+        Runs the text_to_sql_tool calls of the message, then its chart calls, each group in parallel:
+        a chart requested in the same message as its query draws that query's result.
+        """
+        calls = state["messages"][-1].tool_calls
+        sql_calls = [call for call in calls if call["name"] == "text_to_sql_tool"]
+        chart_calls = [call for call in calls if call["name"] != "text_to_sql_tool"]
+        if not sql_calls or not chart_calls:
+            return self.tool_node.invoke(state, config)
+
+        updates = []
+        results = dict(state.get("database_results") or {})
+        for group in (sql_calls, chart_calls):
+            message = state["messages"][-1].model_copy(update={"tool_calls": group})
+            output = self.tool_node.invoke({**state, "messages": state["messages"][:-1] + [message], "database_results": results}, config)
+            for update in output if isinstance(output, list) else [output]:
+                updates.append(update)
+                if isinstance(update, Command):
+                    results.update(update.update.get("database_results") or {})
+        # The tool messages answer the calls of the original message, in both groups' order
+        if not any(isinstance(update, Command) for update in updates):
+            return {"messages": [message for update in updates for message in update["messages"]]}
+        return updates
+
     def chart_display_node(self, state: GraphVisualizationState):
-        sys_prompt = self.make_system_prompt()
+        sys_prompt = self.system_prompt
+        index = get_schema_index(self.db_name, self.table_name)
+        if index is not None and index.wide:
+            # Only the columns relevant to the request, twice as many after every unknown column error
+            schema_errors = sum(is_schema_error(message.content) for message in state["messages"] if isinstance(message, ToolMessage))
+            request = state["messages"][0].content
+            sys_prompt = self.make_system_prompt(index.schema_prompt(request, self.schema_columns * 2**schema_errors))
         return {"messages": [self.llm.invoke([sys_prompt] + state["messages"])]}
     
     def compile(self):
         builder = StateGraph(GraphVisualizationState)
         builder.add_node("chart_display", self.chart_display_node)
-        builder.add_node("tools", self.tool_node)
+        builder.add_node("tools", self.tools_node)
 
         builder.add_edge(START, "chart_display")
         builder.add_edge("tools", "chart_display")
         builder.add_conditional_edges("chart_display", tools_condition)
         
         # Compile the graph
-        self.graph = builder.compile()
-
-    def print_base64_image(self):
-        try:
-            png_data = base64.b64decode(self.base64_image)
-            display(Image(data=png_data))
-        except Exception as e:
-            print("Failed to render base64 image:", e)
+        self.graph = builder.compile(checkpointer=False)
 
     def print_graph(self):
         try:
@@ -332,29 +577,109 @@ class GraphVisualization():
             print("Failed to render graph image:", e)
             print(self.graph.get_graph(xray=True).draw_mermaid())
 
-    def invoke(self):
-        return self.graph.invoke({"messages": [HumanMessage(self.prompt)]})
+    def invoke(self, prompt: str):
+        """
+        Returns the final state: `chart_json` is the Plotly figure of a spec chart, `image_ref` the image store
+        reference of a matplotlib chart, both are empty when no chart was made.
+        """
+        # Tool calls of one message run in parallel, bounded by max_concurrency
+        result = self.graph.invoke({"messages": [HumanMessage(prompt)], "database_results": {}, "image_ref": "", "chart_json": ""}, {"max_concurrency": self.max_tool_concurrency})
+        for entry in (result.get("database_results") or {}).values():
+            entry["result"].close()
+        return result
 
 
 class ChatOrchestrator():
     
-    def __init__(self,metadata: str, insight: dict):
+    def __init__(self,metadata: str, insight: dict, token_budget:int=4000, include_rows:bool=False, chart_mode:str="spec", db_name:str="data/data.db", table_name:str="data",
+                 thread_id:str=None, history_tokens:int=HISTORY_TOKENS, tool_tokens:int=TOOL_TOKENS, checkpoint_path:str="temp/checkpoints.db",
+                 max_tool_concurrency:int=4, schema_columns:int=TOP_K_COLUMNS):
 
-        tools = [self.text_to_sql_tool, self.search_web_tool,self.graph_visualization_tool]
-        self.llm = ChatOpenAI(model="gpt-4o").bind_tools(tools)
+        tools = [self.text_to_sql_tool, self.search_web_tool,self.graph_visualization_tool, self.insight_details_tool, self.column_profile_tool]
+        self.llm = get_chat_model().bind_tools(tools)
         self.tool_node = ToolNode(tools=tools)
         self.metadata = metadata
         self.insight = insight
-        self.base64_image = ""
+        self.token_budget = token_budget
+        self.include_rows = include_rows
+        # Tool calls of one LLM message run concurrently on at most this many threads
+        self.max_tool_concurrency = max(1, max_tool_concurrency)
+        self.schema_columns = schema_columns
+        self.db_name = db_name
+        self.table_name = table_name
+        self.profile = None
+        self.token_log = []
+        self.system_prompt = None
+        # Conversation history lives in the checkpointer under thread_id, bounded by history_tokens
+        self.thread_id = thread_id or uuid.uuid4().hex
+        self.history_tokens = history_tokens
+        self.tool_tokens = tool_tokens
+        self.checkpointer = get_checkpointer(checkpoint_path)
+        self.summary_llm = get_chat_model()
+        # Sub-agents are compiled once and reused by every tool call
+        self.text_to_sql = Text2SQL_Agent(sys_data["text_to_sql"], db_name=db_name, table_name=table_name, schema_columns=schema_columns)
+        self.visualization = GraphVisualization(metadata, table_name=table_name, database_name=db_name, chart_mode=chart_mode, max_tool_concurrency=max_tool_concurrency,
+                                                schema_columns=schema_columns)
         self.compile()
     
     def make_system_prompt(self):
-        return SystemMessage(
-            sys_data["orchestrator"] +
-            f"\n- Metadata = {self.metadata}" +
-            f"\n- Insight = {self.insight}"
-        )
+        # Built once, the digest replaces str(self.insight) which resent every row on each turn
+        if self.system_prompt is None:
+            # token_budget bounds the whole system prompt, base instructions included
+            self.system_prompt = SystemMessage(build_system_prompt(sys_data["orchestrator"], self.metadata, self.insight, self.token_budget, self.include_rows))
+        return self.system_prompt
+
+    def insight_details_tool(self, insight_name: str) -> dict:
+        """
+        Returns the full stored insight, including its SQL queries, result rows and summary.
+        The system prompt only holds a digest of the insights, use this when the raw rows or exact details are needed.
+
+        Parameters:
+            insight_name (str): The insight name as listed in the system prompt (the '## ' headers).
+
+        Returns:
+            dict: The insight or an error message listing the available names.
+        """
+        if insight_name in self.insight:
+            return self.insight[insight_name]
+        return {"error": f"Unknown insight {insight_name}", "available": list(self.insight)}
     
+    def column_profile_tool(self, column_names: list[str] = None) -> dict:
+        """
+        Returns precomputed statistics of columns, computed over all rows when the data was loaded, without running SQL.
+        Per column: sqlite_type, rows, nulls, null_rate, distinct_count (distinct_approx marks an estimate),
+        min, max, mean, std, p05/p25/p50/p75/p95 and top_values ([value, count] pairs, top_approx marks an estimate).
+
+        Parameters:
+            column_names (list[str]): Columns to look up, leave empty for every column.
+
+        Returns:
+            dict: column name -> statistics, unknown names are listed under "unknown_columns".
+        """
+        if self.profile is None:
+            self.profile = get_column_profile(self.table_name, self.db_name)
+        if not self.profile:
+            return {"error": "No column profile for this table, use the Text-to-SQL tool."}
+        if not column_names:
+            return {name: self.compact_profile(entry) for name, entry in self.profile.items()}
+
+        lookup = {name.lower(): name for name in self.profile}
+        result, unknown = {}, []
+        for column_name in column_names:
+            name = lookup.get(str(column_name).strip().strip('"').lower())
+            if name is None:
+                unknown.append(column_name)
+            else:
+                result[name] = self.compact_profile(self.profile[name])
+        if unknown:
+            result["unknown_columns"] = {"names": unknown, "available": list(self.profile)}
+        return result
+
+    @staticmethod
+    def compact_profile(entry: dict) -> dict:
+        # Text columns have no numeric stats, leave the empty fields out of the LLM context
+        return {key: value for key, value in entry.items() if value is not None and key != "position"}
+
     def text_to_sql_tool(self, query: str) -> list:
         """
         Converts natural language text to SQL queries.
@@ -365,8 +690,7 @@ class ChatOrchestrator():
         Returns:
             list: A list of generated SQL query strings and their corresponding results.
         """
-        txt2sql_agent = Text2SQL_Agent(query, sys_data["text_to_sql"]).invoke()
-        return txt2sql_agent.get("result_data", [])
+        return self.text_to_sql.invoke(query).get("result_data", [])
     
     def search_web_tool(self, query: str) -> list:
         """
@@ -382,7 +706,7 @@ class ChatOrchestrator():
         tavily = TavilySearchResults(max_results=3) 
         return tavily(query)
     
-    def graph_visualization_tool(self, query: str) -> str:
+    def graph_visualization_tool(self, query: str, tool_call_id: Annotated[str, InjectedToolCallId]) -> Command:
         """
         Acts as a proxy to the GraphVisualization agent.
         It receives a natural language visualization request
@@ -392,35 +716,73 @@ class ChatOrchestrator():
             query (str): A natural language visualization request with a context and explanation.
 
         Returns:
-            str: A message indicating that the visualization image was created or an error message.
+            Command: The chart fields of the state and a message indicating whether the visualization was created.
         """
-        visu = GraphVisualization(query, self.metadata)
-        visu.invoke()
-        self.base64_image = visu.base64_image
-        return f"Visualization tool invoked. {self.base64_image[:50]}"
+        result = self.visualization.invoke(query)
+        image_ref, chart_json = result.get("image_ref", ""), result.get("chart_json", "")
+        if chart_json:
+            message = "Visualization tool invoked. Interactive chart created."
+        else:
+            message = f"Visualization tool invoked. Image {image_ref[:12] or 'not created'}"
+        update = {"messages": [ToolMessage(message, tool_call_id=tool_call_id)]}
+        # A call that made no chart must not clear the chart of a parallel call
+        if image_ref or chart_json:
+            update.update(image_ref=image_ref, chart_json=chart_json)
+        return Command(update=update)
     
+    def summarize_turns(self, summary: str, turns: list) -> str:
+        prompt = HumanMessage(f"Current summary:\n{summary or '(empty)'}\n\nRemoved turns:\n{format_turns(turns)}")
+        return self.summary_llm.invoke([SystemMessage(sys_data["conversation_summary"]), prompt]).content
+
+    def memory_node(self, state: ChatOrchestratorState):
+        summary = state.get("summary", "")
+        return compact_history(state["messages"], lambda turns: self.summarize_turns(summary, turns), self.history_tokens, self.tool_tokens)
+
+    def relevant_columns(self, messages: list) -> list:
+        """Wide tables: the columns matching the current question, the system prompt only lists the column names."""
+        index = get_schema_index(self.db_name, self.table_name)
+        turn = split_turns(messages)[-1] if messages else []
+        if index is None or not index.wide or not turn or not isinstance(turn[0], HumanMessage):
+            return []
+        schema_errors = sum(is_schema_error(message.content) for message in turn if isinstance(message, ToolMessage))
+        return [SystemMessage(f"Columns relevant to the question: {index.schema_prompt(turn[0].content, self.schema_columns * 2**schema_errors)}")]
+
     def orchestrator_node(self, state: ChatOrchestratorState):
         sys_prompt = self.make_system_prompt()
-        return {"messages": [self.llm.invoke([sys_prompt] + state["messages"])]}
+        summary = [SystemMessage(f"Summary of the earlier conversation:\n{state['summary']}")] if state.get("summary") else []
+        messages = [sys_prompt] + summary + self.relevant_columns(state["messages"]) + state["messages"]
+        self.token_log.append({
+            "system_tokens": count_tokens(sys_prompt.content),
+            "message_tokens": sum(count_tokens(str(message.content)) for message in messages[1:]),
+        })
+        return {"messages": [self.llm.invoke(messages)]}
     
     def compile(self):
         builder = StateGraph(ChatOrchestratorState)
+        builder.add_node("memory", self.memory_node)
         builder.add_node("orchestrator", self.orchestrator_node)
         builder.add_node("tools", self.tool_node)
 
-        builder.add_edge(START, "orchestrator")
+        builder.add_edge(START, "memory")
+        builder.add_edge("memory", "orchestrator")
         builder.add_edge("tools", "orchestrator")
         builder.add_conditional_edges("orchestrator", tools_condition)
         
-        # Compile the graph
-        self.graph = builder.compile()
+        # Compile the graph, the checkpointer restores the thread history on every turn
+        self.graph = builder.compile(checkpointer=self.checkpointer)
+
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}, "max_concurrency": self.max_tool_concurrency}
+
+    def turn_input(self, prompt: str) -> dict:
+        # The chart fields are reset every turn, the checkpointer would carry the last chart over
+        return {"messages": [HumanMessage(prompt)], "image_ref": "", "chart_json": ""}
     
-    def print_base64_image(self):
+    def print_image(self):
         try:
-            png_data = base64.b64decode(self.base64_image)
-            display(Image(data=png_data))
+            display(Image(data=get_image_store().get(self.graph.get_state(self.config()).values.get("image_ref", ""))))
         except Exception as e:
-            print("Failed to render base64 image:", e)
+            print("Failed to render image:", e)
 
     def print_graph(self):
         try:
@@ -431,8 +793,40 @@ class ChatOrchestrator():
             print(self.graph.get_graph(xray=True).draw_mermaid())
 
     def invoke(self, prompt:str):
-        reply = self.graph.invoke({"messages": [HumanMessage(prompt)]})
+        reply = self.graph.invoke(self.turn_input(prompt), self.config())
+        prune_checkpoints(self.checkpointer, self.thread_id)
         result = reply["messages"][-1].content if reply["messages"][-1].content is not None else ""
-        img = self.base64_image
-        self.base64_image = ""
-        return result, img, reply
+        reply["chart"] = reply.get("chart_json", "")
+        return result, reply.get("image_ref", ""), reply
+
+    def stream(self, prompt:str):
+        """
+        Streams one chat turn as events instead of waiting for the whole graph run:
+            {"type": "token", "content": str}                      answer tokens of the orchestrator LLM
+            {"type": "tool_start", "name": str, "args": dict}      the orchestrator called a tool
+            {"type": "tool_end", "name": str, "content": str}      the tool returned
+            {"type": "final", "content": str, "image": str, "chart": str}
+                last event, same values as invoke(), image is an image store reference, chart a Plotly figure JSON
+        """
+        content = ""
+        for mode, chunk in self.graph.stream(self.turn_input(prompt), self.config(), stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") == "orchestrator" and isinstance(message, AIMessageChunk) and message.content:
+                    yield {"type": "token", "content": message.content}
+                continue
+
+            for node, update in chunk.items():
+                # A tool node that returned Commands reports one update per tool call
+                for part in update if isinstance(update, list) else [update]:
+                    for message in (part or {}).get("messages", []):
+                        if node == "orchestrator" and isinstance(message, AIMessage):
+                            for tool_call in message.tool_calls:
+                                yield {"type": "tool_start", "name": tool_call["name"], "args": tool_call["args"]}
+                            content = message.content or ""
+                        elif node == "tools" and isinstance(message, ToolMessage):
+                            yield {"type": "tool_end", "name": message.name, "content": str(message.content)}
+
+        values = self.graph.get_state(self.config()).values
+        prune_checkpoints(self.checkpointer, self.thread_id)
+        yield {"type": "final", "content": content, "image": values.get("image_ref", ""), "chart": values.get("chart_json", "")}
@@ -13,6 +13,12 @@ class Text2SQLState(TypedDict):
     loop_again: Annotated[bool, save_last]
     exception_message: Annotated[str, save_last]
     result_data: Annotated[list, save_last]
+    prompt: Annotated[str, save_last]
+    loop_count: Annotated[int, save_last]
+    run_failed: Annotated[bool, save_last]
+    cache_key: Annotated[str, save_last]
+    from_cache: Annotated[bool, save_last]
+    schema_width: Annotated[int, save_last]
 
 class InsightState(TypedDict):
     messages: Annotated[list, add_messages]
@@ -20,9 +26,18 @@ class InsightState(TypedDict):
     loop_again: Annotated[bool, save_last]
     exception_message: Annotated[str, save_last]
     json_insights: Annotated[json, save_last]
+    loop_count: Annotated[int, save_last]
 
 class ChatOrchestratorState(TypedDict):
     messages: Annotated[list, add_messages]
+    summary: str
+    # Set by graph_visualization_tool, tool calls of one step run in parallel so they are not kept on the agent
+    image_ref: Annotated[str, save_last]
+    chart_json: Annotated[str, save_last]
 
 class GraphVisualizationState(TypedDict):
     messages: Annotated[list, add_messages]
+    # text_to_sql_tool call id -> {"name", "result"}, parallel calls each add their own entry
+    database_results: Annotated[dict, merge_dicts]
+    image_ref: Annotated[str, save_last]
+    chart_json: Annotated[str, save_last]
@@ -0,0 +1,479 @@
+import re
+import math
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.sql_executor import DATABASE_ERRORS, QueryResult, get_executor, INSIGHT_BUDGET, MAX_PREVIEW_ROWS, MAX_PREVIEW_BYTES
+from src.profiler import load_profile
+
+
+# ---------------------------------- Approximate Queries --------------------------------
+
+SAMPLE_ROWS = 100_000     # rows kept in <table>__sample, smaller tables get no sample
+Z_95 = 1.96
+COMPLEX = re.compile(r"\b(JOIN|UNION|INTERSECT|EXCEPT|WITH|OVER|HAVING)\b", re.IGNORECASE)
+SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+SELECT_HEAD = re.compile(r"^\s*SELECT\s+(DISTINCT\s+)?", re.IGNORECASE)
+FROM = re.compile(r"\bFROM\b", re.IGNORECASE)
+WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+ALIAS = re.compile(r"(?:\s+AS)?\s+(\"[^\"]*\"|\w+)\s*$", re.IGNORECASE)
+CALL = re.compile(r"^(\w+)\s*\(", re.IGNORECASE)
+AGGREGATE_INSIDE = re.compile(r"\b(COUNT|SUM|TOTAL|AVG|MIN|MAX)\s*\(", re.IGNORECASE)
+RULE_OF_THREE = 3         # 95% upper bound of a count when none of the sampled rows matched
+NUMBER_LITERAL = re.compile(r"^(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+CAST_AS = re.compile(r"\bAS\b", re.IGNORECASE)
+REAL_TYPE = re.compile(r"^(REAL|FLOAT|DOUBLE|NUMERIC|DECIMAL)\b", re.IGNORECASE)
+INTEGER_TYPE = re.compile(r"^(INTEGER|INT|BIGINT|HUGEINT)\b", re.IGNORECASE)
+
+
+def sample_table_name(table_name: str) -> str:
+    return f"{table_name}__sample"
+
+
+def quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class ReservoirSampler():
+    """
+    Uniform sample of `size` rows over every chunk of an ingestion: each row gets a random key
+    and the rows with the smallest keys are kept (bottom-k), so memory stays at `size` rows.
+    """
+
+    def __init__(self, size: int = SAMPLE_ROWS, seed: int = 0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.sample = None
+
+    def update(self, chunk: pd.DataFrame):
+        keys = self.rng.random(len(chunk))
+        if len(self.keys) >= self.size:
+            # Only rows that beat the current k-th smallest key can enter
+            keep = keys < self.keys.max()
+            if not keep.any():
+                return
+            chunk, keys = chunk[keep], keys[keep]
+        self.keys = np.concatenate([self.keys, keys])
+        self.sample = chunk.reset_index(drop=True) if self.sample is None else pd.concat([self.sample, chunk], ignore_index=True)
+        if len(self.keys) > self.size:
+            keep = np.argpartition(self.keys, self.size)[:self.size]
+            self.keys, self.sample = self.keys[keep], self.sample.iloc[keep].reset_index(drop=True)
+
+    def frame(self) -> pd.DataFrame | None:
+        return self.sample
+
+
+# ---- Query rewriting ----
+
+def mask_quoted(query: str) -> str:
+    """Same length copy of `query` with the inside of string literals and quoted identifiers blanked out."""
+    masked, i = list(query), 0
+    while i < len(query):
+        opening = query[i]
+        if opening not in "'\"`[":
+            i += 1
+            continue
+        closing = "]" if opening == "[" else opening
+        j = i + 1
+        while j < len(query):
+            if query[j] == closing:
+                # '' / "" is an escaped quote, not the end
+                if closing != "]" and j + 1 < len(query) and query[j + 1] == closing:
+                    j += 2
+                    continue
+                break
+            j += 1
+        for k in range(i + 1, min(j, len(query))):
+            masked[k] = "_"
+        i = j + 1
+    return "".join(masked)
+
+
+def mask_nested(masked: str) -> str:
+    """Blanks everything inside parentheses, keywords and commas left are at the top level."""
+    flat, depth = [], 0
+    for char in masked:
+        if char == "(":
+            depth += 1
+        flat.append(char if depth == 0 else "_")
+        if char == ")":
+            depth = max(depth - 1, 0)
+    return "".join(flat)
+
+
+def split_top_level(text: str) -> list:
+    """(start, end) spans of the comma separated parts of `text` outside parentheses and quotes."""
+    flat = mask_nested(mask_quoted(text))
+    spans, start = [], 0
+    for match in re.finditer(",", flat):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return spans
+
+
+def function_call(expression: str) -> tuple[str, str] | None:
+    """(NAME, arguments) when the whole expression is one function call, e.g. COUNT(*)."""
+    match = CALL.match(expression)
+    if not match or not expression.endswith(")"):
+        return None
+    # The opening parenthesis must close at the very end
+    depth = 0
+    masked = mask_quoted(expression)
+    for position in range(match.end() - 1, len(masked)):
+        depth += {"(": 1, ")": -1}.get(masked[position], 0)
+        if depth == 0 and position < len(masked) - 1:
+            return None
+    return match.group(1).upper(), expression[match.end():-1].strip()
+
+
+def enclosed(expression: str) -> bool:
+    """True when the parenthesis opening `expression` closes at its very end, e.g. (COUNT(*) * 2)."""
+    depth = 0
+    masked = mask_quoted(expression)
+    for position, char in enumerate(masked):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth == 0:
+            return position == len(masked) - 1
+    return False
+
+
+def linear_aggregate(expression: str) -> dict | None:
+    """
+    {"kind", "argument", "factor", "real"} when `expression` is one COUNT/SUM times constants, e.g.
+    COUNT(*) * 1.0, SUM(x) / 1e6 or CAST(COUNT(*) AS REAL): its sample value is `factor` times the
+    aggregate. None for anything else, division by an integer is refused as SQLite truncates it.
+    """
+    expression = expression.strip()
+    while expression.startswith("(") and enclosed(expression):
+        expression = expression[1:-1].strip()
+
+    call = function_call(expression)
+    if call is not None:
+        name, argument = call
+        if name == "COUNT" and not argument.upper().startswith("DISTINCT"):
+            return {"kind": "count", "argument": argument, "factor": 1, "real": False}
+        if name in ("SUM", "TOTAL"):
+            return {"kind": "sum", "argument": argument, "factor": 1, "real": name == "TOTAL"}
+        if name == "CAST":
+            casts = list(CAST_AS.finditer(mask_nested(mask_quoted(argument))))
+            inner = linear_aggregate(argument[:casts[-1].start()]) if casts else None
+            target = argument[casts[-1].end():].strip() if casts else ""
+            if inner is not None and REAL_TYPE.match(target):
+                return dict(inner, real=True)
+            # Casting a plain count/sum to an integer loses nothing worth scaling
+            if inner is not None and INTEGER_TYPE.match(target) and inner["factor"] == 1:
+                return dict(inner, real=False)
+        return None
+
+    flat = mask_nested(mask_quoted(expression))
+    operators = list(re.finditer(r"[*/]", flat))
+    if not operators:
+        return None
+    starts = [0] + [match.end() for match in operators]
+    ends = [match.start() for match in operators] + [len(expression)]
+    found, factor, real = None, 1, False
+    for operator, start, end in zip(["*"] + [match.group() for match in operators], starts, ends):
+        part = expression[start:end].strip()
+        if NUMBER_LITERAL.match(part):
+            value, is_real = float(part), not part.isdigit()
+            if operator == "/":
+                if value == 0 or not (real or is_real):
+                    return None
+                factor /= value
+            else:
+                factor *= value
+            real = real or is_real
+            continue
+        inner = linear_aggregate(part)
+        if inner is None or found is not None or operator == "/":
+            return None
+        found, factor, real = inner, factor * inner["factor"], real or inner["real"]
+    return None if found is None else dict(found, factor=factor, real=real)
+
+
+def classify(expression: str) -> dict:
+    """
+    How the sample value of a select expression relates to the full table:
+    count/sum are scaled by 1/fraction (also when multiplied/divided by constants or cast, see
+    `linear_aggregate`), avg is kept and gets a margin, distinct and extreme are kept (sample bounds),
+    unscaled marks other expressions containing an aggregate (AVG(x) * 2, MAX(x) - MIN(x)...), their
+    margin is unknown and `plan_query` runs those exactly.
+    """
+    expression = expression.strip()
+    masked = mask_quoted(expression)
+    flat = mask_nested(masked)
+    alias = ALIAS.search(flat)
+    # `x - 5` is no alias: the word before an alias ends a value, not an operator
+    if alias and flat[:alias.start()].strip() and re.search(r"[\w)\"\]`]$", flat[:alias.start()].rstrip()):
+        expression = expression[:alias.start()].strip()
+
+    digits = None
+    call = function_call(expression)
+    if call and call[0] == "ROUND":
+        parts = [call[1][start:end].strip() for start, end in split_top_level(call[1])]
+        if function_call(parts[0]) is not None or linear_aggregate(parts[0]) is not None:
+            expression, call = parts[0], function_call(parts[0])
+            digits = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+    if call is not None:
+        name, argument = call
+        if name == "COUNT":
+            if argument.upper().startswith("DISTINCT"):
+                return {"kind": "distinct", "argument": argument[len("DISTINCT"):].strip(), "digits": digits}
+            return {"kind": "count", "argument": argument, "digits": digits}
+        if name in ("SUM", "TOTAL"):
+            return {"kind": "sum", "argument": argument, "digits": digits}
+        if name == "AVG":
+            return {"kind": "avg", "argument": argument, "digits": digits}
+        if name in ("MIN", "MAX"):
+            return {"kind": "extreme", "argument": argument, "digits": digits}
+    linear = linear_aggregate(expression)
+    if linear is not None:
+        return {"kind": linear["kind"], "argument": linear["argument"], "digits": digits, "factor": linear["factor"]}
+    if AGGREGATE_INSIDE.search(mask_quoted(expression)):
+        return {"kind": "unscaled", "argument": None, "digits": None}
+    return {"kind": "plain", "argument": None, "digits": None}
+
+
+def plan_query(query: str, table_name: str) -> dict | None:
+    """
+    Rewrites a query of `table_name` to run on its sample: the table is swapped and hidden columns
+    (sums of squares, counts) are appended for the margins. None when the query is not a single
+    SELECT over the table (joins, subqueries, set operations, windows, HAVING) or combines aggregates
+    in a way that cannot be scaled (SUM(a) / COUNT(*), COUNT(*) - 5, AVG(x) * 2...), those run exactly.
+    """
+    query = query.strip().rstrip(";").strip()
+    masked = mask_quoted(query)
+    if len(SELECT.findall(masked)) != 1 or COMPLEX.search(masked) or ";" in masked:
+        return None
+    flat = mask_nested(masked)
+    head = SELECT_HEAD.match(flat)
+    from_match = FROM.search(flat)
+    if head is None or from_match is None:
+        return None
+    table = re.match(r"\s*(\"(?:[^\"]|\"\")+\"|\[[^\]]+\]|`[^`]+`|\w+)", query[from_match.end():])
+    if table is None or table.group(1).strip("\"[]`").replace('""', '"').lower() != table_name.lower():
+        return None
+
+    select_start, select_end = head.end(), from_match.start()
+    select_list = query[select_start:select_end]
+    expressions = [select_list[start:end] for start, end in split_top_level(select_list)]
+    columns = [classify(expression) for expression in expressions]
+    if any(column["kind"] == "unscaled" for column in columns):
+        return None
+    aggregated = any(column["kind"] not in ("plain",) for column in columns)
+
+    hidden = []
+    for column in columns:
+        if column["kind"] in ("sum", "avg"):
+            column["squares"] = len(columns) + len(hidden)
+            hidden.append(f"SUM(({column['argument']}) * ({column['argument']}))")
+        if column["kind"] in ("sum", "avg"):
+            column["count"] = len(columns) + len(hidden)
+            hidden.append(f"COUNT({column['argument']})")
+
+    table_start, table_end = from_match.end() + table.start(1), from_match.end() + table.end(1)
+    sql = (
+        query[:select_end].rstrip() + "".join(f", {expression}" for expression in hidden) + " " +
+        query[select_end:table_start] + quote(sample_table_name(table_name)) + query[table_end:]
+    )
+    return {
+        "sql": sql, "columns": columns, "aggregated": aggregated,
+        "filtered": bool(WHERE.search(flat)), "grouped": bool(GROUP_BY.search(flat)),
+    }
+
+
+# ---- Execution ----
+
+def sample_info(db_name: str, table_name: str = "data") -> dict | None:
+    """Sample and table row counts, None when the table has no sample (small tables, older ingestions)."""
+    executor = get_executor(db_name)
+    try:
+        sample_rows = executor.run(f"SELECT COUNT(*) FROM {quote(sample_table_name(table_name))}")[0][0]
+    except DATABASE_ERRORS:
+        return None
+    profile = load_profile(db_name, table_name)
+    population = next(iter(profile.values()))["rows"] if profile else None
+    if not sample_rows or not population or sample_rows >= population:
+        return None
+    return {"sample_rows": sample_rows, "population_rows": population, "fraction": sample_rows / population}
+
+
+def observed_rows(value, column: dict, row: tuple) -> int | None:
+    """Sampled rows behind a COUNT/SUM value, None for the other kinds."""
+    if column["kind"] == "count":
+        return None if value is None or isinstance(value, str) else value / column.get("factor", 1)
+    if column["kind"] == "sum":
+        return row[column["count"]] or 0
+    return None
+
+
+def estimate(value, column: dict, row: tuple, fraction: float):
+    """
+    (full table estimate, 95% margin or None) of one sampled value. A COUNT no sampled row matched
+    gets the rule-of-three upper bound 3 * N / n as its margin instead of 0, a SUM over no sampled
+    row has no margin.
+    """
+    if value is None or isinstance(value, str):
+        return value, None
+    kind, finite = column["kind"], 1 - fraction
+    if kind in ("count", "sum"):
+        # The value is factor * the aggregate (COUNT(*) * 1.0, SUM(x) / 1e6...), only the aggregate scales
+        factor = column.get("factor", 1)
+        raw = value / factor
+        if observed_rows(value, column, row) == 0:
+            if kind == "sum":
+                return value, None
+            margin = RULE_OF_THREE / fraction * abs(factor)
+            return value, (int(math.ceil(margin)) if isinstance(value, int) else margin)
+        if kind == "count":
+            margin = Z_95 * math.sqrt(finite * max(raw, 0)) / fraction
+        else:
+            margin = Z_95 * math.sqrt(finite * (row[column["squares"]] or 0.0)) / fraction
+        scaled, margin = raw / fraction * factor, margin * abs(factor)
+        if isinstance(value, int):
+            return int(round(scaled)), (int(math.ceil(margin)) if kind == "count" else margin)
+        return scaled, margin
+    if kind == "avg":
+        count = row[column["count"]] or 0
+        if not count:
+            return value, None
+        variance = max((row[column["squares"]] or 0.0) / count - value * value, 0.0)
+        return value, Z_95 * math.sqrt(finite * variance / count)
+    return value, None
+
+
+def round_estimate(value, digits: int | None):
+    if isinstance(value, float):
+        return round(value, digits if digits is not None else 4)
+    return value
+
+
+def profile_distinct(db_name: str, table_name: str, plan: dict) -> dict:
+    """COUNT(DISTINCT column) over the whole table comes from the ingestion profile instead of the sample."""
+    if plan["filtered"] or plan["grouped"]:
+        return {}
+    profile = load_profile(db_name, table_name)
+    lookup = {name.lower(): entry for name, entry in profile.items()}
+    distinct = {}
+    for position, column in enumerate(plan["columns"]):
+        entry = lookup.get(str(column["argument"]).strip("\"[]`").lower()) if column["kind"] == "distinct" else None
+        if entry is not None:
+            distinct[position] = entry["distinct_count"]
+    return distinct
+
+
+def run_approximate(query: str, db_name: str = "data/data.db", table_name: str = "data", max_rows: int = MAX_PREVIEW_ROWS,
+                    max_bytes: int = MAX_PREVIEW_BYTES, budget=INSIGHT_BUDGET) -> QueryResult:
+    """
+    Runs `query` on the sample of `table_name` and scales it to the full table: COUNT/SUM are
+    divided by the sampling fraction, AVG is kept, each estimate gets a 95% margin (normal
+    approximation). `result.approximate` describes the sample, the margins of the preview rows
+    and what was not scaled. Falls back to the exact query when there is no sample or it cannot
+    be rewritten.
+    """
+    executor = get_executor(db_name)
+    info = sample_info(db_name, table_name)
+    plan = plan_query(query, table_name) if info else None
+    if plan is None:
+        return executor.run_bounded(query, max_rows=max_rows, max_bytes=max_bytes, budget=budget)
+
+    fraction = info["fraction"]
+    visible = len(plan["columns"])
+    distinct = profile_distinct(db_name, table_name, plan)
+    margins = []
+    unobserved = []
+
+    def scaled_rows(rows):
+        for row in rows:
+            values, row_margins = [], []
+            for position, column in enumerate(plan["columns"]):
+                if observed_rows(row[position], column, row) == 0:
+                    unobserved.append(position)
+                value, margin = estimate(row[position], column, row, fraction)
+                if position in distinct:
+                    value = distinct[position]
+                values.append(round_estimate(value, column["digits"]))
+                row_margins.append(round_estimate(margin, column["digits"]) if margin is not None else None)
+            if len(margins) <= max_rows:
+                margins.append(row_margins)
+            yield tuple(values)
+
+    with executor.connection(budget) as conn:
+        cursor = conn.execute(plan["sql"])
+        try:
+            columns = [column[0] for column in cursor.description or []][:visible]
+            result = QueryResult(columns).collect(scaled_rows(executor.fetch_batches(cursor)), max_rows, max_bytes)
+        finally:
+            cursor.close()
+
+    kinds = {column["kind"] for column in plan["columns"]}
+    notes = [f"estimated from a uniform sample of {info['sample_rows']:,} of {info['population_rows']:,} rows ({fraction:.2%})"]
+    if kinds & {"count", "sum"}:
+        notes.append(f"COUNT/SUM scaled by 1/{fraction:.4g}, margins are 95% confidence half-widths")
+    if "distinct" in kinds:
+        notes.append("COUNT(DISTINCT) comes from the ingestion profile" if distinct and len(distinct) == len([c for c in plan["columns"] if c["kind"] == "distinct"])
+                     else "COUNT(DISTINCT) counts the values seen in the sample, a lower bound")
+    if "extreme" in kinds:
+        notes.append("MIN/MAX are the sample extremes")
+    if unobserved:
+        notes.append(f"no sampled row matched for some COUNT/SUM values: not observed in the sample, the full table may still hold "
+                     f"up to ~{math.ceil(RULE_OF_THREE / fraction):,} such rows (rule of three, 95%), the COUNT margin is that upper bound")
+    if plan["grouped"] or not plan["aggregated"]:
+        notes.append("rows and groups missing from the sample are missing from the result")
+    result.approximate = {
+        "sample_fraction": round(fraction, 6), "sample_rows": info["sample_rows"], "population_rows": info["population_rows"],
+        "margins": margins[:len(result.preview)], "notes": notes,
+    }
+    return result
+
+
+# ---- Exact refresh jobs ----
+
+class RefreshJobs():
+    """Keyed background jobs (exact re-runs of approximate insights), the UI polls their state across reruns."""
+
+    def __init__(self, max_workers: int = 2):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="exact_refresh")
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args) -> bool:
+        """Starts `fn(*args)` under `key`, False when a job with that key is still running."""
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and not job.done():
+                return False
+            self.jobs[key] = self.pool.submit(fn, *args)
+            return True
+
+    def status(self, key) -> str | None:
+        with self._lock:
+            job = self.jobs.get(key)
+        if job is None:
+            return None
+        if not job.done():
+            return "running"
+        return "failed" if job.exception() is not None else "done"
+
+    def pop(self, key):
+        """Result of a finished job (raises its exception), the job is forgotten."""
+        with self._lock:
+            job = self.jobs.pop(key)
+        return job.result()
+
+
+_refresh_jobs = None
+_refresh_jobs_lock = threading.Lock()
+
+
+def get_refresh_jobs() -> RefreshJobs:
+    global _refresh_jobs
+    with _refresh_jobs_lock:
+        if _refresh_jobs is None:
+            _refresh_jobs = RefreshJobs()
+        return _refresh_jobs
@@ -0,0 +1,183 @@
+import json
+import pandas as pd
+
+
+# ------------------------------------- Chart Specs -------------------------------------
+
+CHART_TYPES = ("bar", "line", "area", "scatter", "pie", "histogram", "box")
+AGGREGATIONS = ("sum", "mean", "count", "min", "max", "none")
+MAX_POINTS = 5000              # rows sent to the browser, bigger results are downsampled
+BACKGROUND = "#262730"          # Streamlit dark background
+HISTFUNCS = {"sum": "sum", "mean": "avg", "count": "count", "min": "min", "max": "max"}
+
+
+class ChartSpecError(ValueError):
+    pass
+
+
+def match_column(name, columns: list, field: str) -> str:
+    """Exact column name, tolerating case and spaces/underscores differences."""
+    if name in columns:
+        return name
+    normalized = {str(column).replace(" ", "").replace("_", "").lower(): column for column in columns}
+    column = normalized.get(str(name).replace(" ", "").replace("_", "").lower())
+    if column is None:
+        raise ChartSpecError(f"'{field}' column {name!r} is not in the query result, available columns: {columns}")
+    return column
+
+
+def validate_chart_spec(spec: dict, columns: list) -> dict:
+    """
+    Checks a chart spec against the columns of the query result and returns it normalized:
+    {"chart_type", "x", "y" (list), "series", "aggregation", "title", "sort", "limit"}.
+    Raises ChartSpecError with a message meant for the LLM.
+    """
+    if isinstance(spec, str):
+        try:
+            spec = json.loads(spec)
+        except json.JSONDecodeError as e:
+            raise ChartSpecError(f"Chart spec is not valid JSON: {e}")
+    if not isinstance(spec, dict):
+        raise ChartSpecError("Chart spec must be a JSON object")
+
+    chart_type = str(spec.get("chart_type", "")).lower()
+    if chart_type not in CHART_TYPES:
+        raise ChartSpecError(f"chart_type must be one of {list(CHART_TYPES)}, got {spec.get('chart_type')!r}")
+
+    y = spec.get("y") or []
+    y = [y] if isinstance(y, str) else list(y)
+    aggregation = str(spec.get("aggregation") or ("none" if chart_type in ("scatter", "histogram", "box") else "sum")).lower()
+    if aggregation not in AGGREGATIONS:
+        raise ChartSpecError(f"aggregation must be one of {list(AGGREGATIONS)}, got {spec.get('aggregation')!r}")
+
+    normalized = {
+        "chart_type": chart_type,
+        "x": match_column(spec["x"], columns, "x") if spec.get("x") else None,
+        "y": [match_column(column, columns, "y") for column in y],
+        "series": match_column(spec["series"], columns, "series") if spec.get("series") else None,
+        "aggregation": aggregation,
+        "title": str(spec.get("title") or ""),
+        "sort": spec.get("sort") if spec.get("sort") in ("x", "y", "-y") else None,
+        "limit": parse_limit(spec.get("limit")),
+    }
+
+    if chart_type == "box":
+        if not normalized["y"]:
+            raise ChartSpecError("box charts need 'y' (the value column)")
+    elif normalized["x"] is None:
+        raise ChartSpecError(f"{chart_type} charts need an 'x' column")
+    if chart_type == "pie" and len(normalized["y"]) > 1:
+        raise ChartSpecError("pie charts take a single 'y' column")
+    if chart_type in ("bar", "line", "area", "scatter", "pie") and not normalized["y"] and aggregation != "count":
+        raise ChartSpecError(f"{chart_type} charts need 'y' columns, or aggregation 'count'")
+    return normalized
+
+
+def parse_limit(limit) -> int | None:
+    if not limit:
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ChartSpecError(f"limit must be a positive integer, got {limit!r}") from None
+    if limit < 1:
+        raise ChartSpecError(f"limit must be a positive integer, got {limit!r}")
+    return limit
+
+
+def prepare_frame(spec: dict, frame: pd.DataFrame) -> tuple[pd.DataFrame, list]:
+    """Applies aggregation, sorting, limit and the point cap, returns (frame, notes)."""
+    notes = []
+    for column in spec["y"]:
+        if spec["aggregation"] not in ("none", "count") or spec["chart_type"] in ("histogram", "box", "scatter"):
+            converted = pd.to_numeric(frame[column], errors="coerce")
+            if converted.notna().sum() == 0 and frame[column].notna().any():
+                raise ChartSpecError(f"'y' column {column!r} is not numeric")
+            frame[column] = converted
+
+    if spec["aggregation"] != "none" and spec["chart_type"] not in ("histogram", "box"):
+        keys = [column for column in (spec["x"], spec["series"]) if column]
+        if spec["aggregation"] == "count":
+            frame = frame.groupby(keys, dropna=False).size().reset_index(name="count")
+            spec["y"] = ["count"]
+        else:
+            frame = frame.groupby(keys, dropna=False)[spec["y"]].agg(spec["aggregation"]).reset_index()
+
+    if spec["sort"] == "x" or (spec["sort"] is None and spec["chart_type"] in ("line", "area")):
+        frame = frame.sort_values(spec["x"])
+    elif spec["sort"] in ("y", "-y") and spec["y"]:
+        frame = frame.sort_values(spec["y"][0], ascending=spec["sort"] == "y")
+    if spec["limit"]:
+        frame = frame.head(spec["limit"])
+
+    if len(frame) > MAX_POINTS:
+        step = -(-len(frame) // MAX_POINTS)
+        notes.append(f"downsampled from {len(frame)} to {len(frame.iloc[::step])} points")
+        frame = frame.iloc[::step]
+    return frame, notes
+
+
+def column_values(frame: pd.DataFrame, column: str) -> list:
+    """JSON ready values, missing values become null."""
+    values = frame[column]
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def build_traces(spec: dict, frame: pd.DataFrame) -> list:
+    chart_type, x, series = spec["chart_type"], spec["x"], spec["series"]
+    groups = frame.groupby(series, dropna=False, sort=False) if series else [(None, frame)]
+    traces = []
+    for name, group in groups:
+        if chart_type == "pie":
+            traces.append({"type": "pie", "labels": column_values(group, x), "values": column_values(group, spec["y"][0]) if spec["y"] else None})
+            break
+        for y in spec["y"] or [None]:
+            trace = {"name": " / ".join(str(part) for part in (name, y) if part is not None) or None}
+            if chart_type == "histogram":
+                trace.update(type="histogram", x=column_values(group, x))
+                if y is not None:
+                    trace.update(y=column_values(group, y), histfunc=HISTFUNCS.get(spec["aggregation"], "sum"))
+            elif chart_type == "box":
+                trace.update(type="box", y=column_values(group, y))
+                if x:
+                    trace["x"] = column_values(group, x)
+            else:
+                trace.update(type="bar" if chart_type == "bar" else "scatter", x=column_values(group, x), y=column_values(group, y))
+                if chart_type == "line":
+                    trace["mode"] = "lines"
+                elif chart_type == "area":
+                    trace.update(mode="lines", stackgroup="one")
+                elif chart_type == "scatter":
+                    trace["mode"] = "markers"
+            traces.append(trace)
+    return traces
+
+
+def build_figure(spec: dict, frame: pd.DataFrame) -> dict:
+    """
+    Plotly figure as a plain dict: plotly.js draws it in the browser, building it with plotly
+    graph objects (validation + templates) would cost more server time than the chart itself.
+    """
+    axis = {"gridcolor": "#3a3b45", "zerolinecolor": "#3a3b45"}
+    layout = {
+        "title": {"text": spec["title"]},
+        "paper_bgcolor": BACKGROUND,
+        "plot_bgcolor": BACKGROUND,
+        "font": {"color": "white"},
+        "xaxis": dict(axis, title={"text": spec["x"] or ""}),
+        "yaxis": dict(axis, title={"text": ", ".join(spec["y"])}),
+        "barmode": "group",
+        "showlegend": bool(spec["series"]) or len(spec["y"]) > 1 or spec["chart_type"] == "pie",
+    }
+    return {"data": build_traces(spec, frame), "layout": layout}
+
+
+def render_chart_spec(spec: dict, columns: list, rows) -> tuple[str, dict, list]:
+    """
+    Validates `spec` against the query result and builds the Plotly figure.
+    Returns (figure JSON rendered by the browser, normalized spec, notes). No image is rasterized here.
+    """
+    spec = validate_chart_spec(spec, columns)
+    frame = pd.DataFrame.from_records(list(rows), columns=columns)
+    frame, notes = prepare_frame(spec, frame)
+    return json.dumps(build_figure(spec, frame), default=str), spec, notes
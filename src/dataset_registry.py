@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+from src.ingestion import ingest_csv
+from src.insight_cache import hash_file, write_json_atomic
+from src.sql_executor import DUCKDB_SUFFIX, reset_executor
+
+
+# ----------------------------------- Dataset Registry ----------------------------------
+
+# Besides the database file: SQLite WAL/shared memory, DuckDB WAL
+SIDE_FILES = ("", "-wal", "-shm", ".wal")
+
+class DatasetRegistry():
+    """
+    One database file per uploaded dataset and engine, keyed by the content hash of the CSV.
+
+    Files live in `root/<key>.db` (SQLite) or `root/<key>-duckdb.duckdb` (DuckDB) and are tracked in
+    `root/index.json` (source name, engine, rows, size, last access). A dataset is ingested into a private temporary file that is renamed into place
+    once complete, so readers never see a half written table and never wait on the ingestion
+    writer. Uploading the same content again reuses the file. Least recently used datasets are
+    deleted once `max_datasets` or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, root: str = "temp/datasets", max_datasets: int = 20, max_bytes: int = 10 * 1024**3):
+        self.root = root
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._ingest_locks = {}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, database_type: str = "SQLite") -> str:
+        return content_hash[:32] + ("-duckdb" if database_type == "DuckDB" else "")
+
+    def db_path(self, key: str, database_type: str = "SQLite") -> str:
+        return os.path.join(self.root, key + (DUCKDB_SUFFIX if database_type == "DuckDB" else ".db"))
+
+    def load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key: str) -> dict | None:
+        """Entry of a materialized dataset ({"key", "db_name", "table_name", "rows", ...}), None when it is gone."""
+        with self._lock:
+            index = self.load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            path = self.db_path(key, entry.get("database_type", "SQLite"))
+            if not os.path.exists(path):
+                del index[key]
+                write_json_atomic(self.index_path, index)
+                return None
+            entry["last_access"] = time.time()
+            write_json_atomic(self.index_path, index)
+            return dict(entry, key=key, db_name=path)
+
+    def materialize(self, csv_file, content_hash: str = None, source_name: str = None, table_name: str = "data", progress=None,
+                    database_type: str = "SQLite") -> dict:
+        """
+        Returns the dataset entry of `csv_file`, ingesting it only when no file holds its content yet.
+        `database_type` picks the engine ("SQLite" or "DuckDB"), `progress(fraction, rows)` is only called while ingesting.
+        """
+        key = self.make_key(content_hash or hash_file(csv_file), database_type)
+        with self._lock:
+            ingest_lock = self._ingest_locks.setdefault(key, threading.Lock())
+
+        # Two threads uploading the same file ingest it once, the second one waits and reuses it
+        with ingest_lock:
+            entry = self.get(key)
+            if entry is not None and entry.get("table_name") == table_name:
+                return entry
+
+            path = self.db_path(key, database_type)
+            # Same suffix as the final file, it selects the engine that ingests
+            tmp_path = self.db_path(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp", database_type)
+            try:
+                rows = ingest_csv(csv_file, db_name=tmp_path, table_name=table_name, progress=progress)
+                reset_executor(path)
+                os.replace(tmp_path, path)
+            finally:
+                for suffix in SIDE_FILES:
+                    if os.path.exists(tmp_path + suffix):
+                        os.remove(tmp_path + suffix)
+
+            with self._lock:
+                index = self.load_index()
+                now = time.time()
+                index[key] = {
+                    "source_name": source_name or os.path.basename(str(getattr(csv_file, "name", csv_file))),
+                    "table_name": table_name, "database_type": database_type, "rows": rows, "size": os.path.getsize(path), "created": now, "last_access": now,
+                }
+                self.evict(index, keep=key)
+                write_json_atomic(self.index_path, index)
+            return dict(index[key], key=key, db_name=path)
+
+    def evict(self, index: dict, keep: str = None):
+        """Drops least recently used datasets from `index` (in place) and disk until within budget."""
+        by_age = sorted((key for key in index if key != keep), key=lambda key: index[key].get("last_access", 0))
+        total = sum(entry.get("size", 0) for entry in index.values())
+        while by_age and (len(index) > self.max_datasets or total > self.max_bytes):
+            key = by_age.pop(0)
+            entry = index.pop(key)
+            total -= entry.get("size", 0)
+            path = self.db_path(key, entry.get("database_type", "SQLite"))
+            self._ingest_locks.pop(key, None)
+            reset_executor(path)
+            for suffix in SIDE_FILES:
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_dataset_registry() -> DatasetRegistry:
+    """Process-wide registry shared by every browser session."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DatasetRegistry()
+        return _registry
@@ -0,0 +1,114 @@
+import json
+import threading
+
+
+# ------------------------------------ Prompt Digest ------------------------------------
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """tiktoken encoding of gpt-4o, False when tiktoken or its BPE file is unavailable."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    # ~4 characters per token for English/JSON text
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + "…"
+    return text[: max_tokens * 4] + "…"
+
+
+def summary_text(insight_summary) -> str:
+    """The summarizer answers with a JSON string, only its 'insight' sentence goes in the digest."""
+    try:
+        summary = json.loads(insight_summary) if isinstance(insight_summary, str) else insight_summary
+    except json.JSONDecodeError:
+        return str(insight_summary)
+    if isinstance(summary, dict):
+        return str(summary.get("insight", ""))
+    return str(summary)
+
+
+def insight_lines(name: str, data: dict, detail: int, include_rows: bool, max_rows: int) -> list:
+    """
+    One insight rendered at a detail level:
+    3 = details + summary + queries (+ rows), 2 = details + summary, 1 = summary, 0 = name only.
+    """
+    lines = [f"## {name}"]
+    if detail >= 2 and data.get("insight_details"):
+        lines.append(f"details: {data['insight_details']}")
+    if detail >= 1 and data.get("insight_summary"):
+        lines.append(f"finding: {summary_text(data['insight_summary'])}")
+    if detail >= 3:
+        for pair in data.get("sql_results_pair", []):
+            lines.append(f"sql: {pair.get('sql_query', '')}")
+            if include_rows and pair.get("db_result"):
+                rows = pair["db_result"][:max_rows]
+                more = pair.get("total_rows", len(pair["db_result"])) - len(rows)
+                lines.append(f"rows: {json.dumps(rows, default=str)}" + (f" (+{more} more)" if more > 0 else ""))
+    return lines
+
+
+def build_insight_digest(insights: dict, token_budget: int = 2000, include_rows: bool = False, max_rows: int = 3) -> str:
+    """
+    Compact, size-capped text of the insights for the orchestrator system prompt.
+
+    Every insight starts at full detail, while the digest is over `token_budget` the detail of
+    the insights is lowered from the last one up, whatever still does not fit is cut.
+    """
+    if not insights:
+        return ""
+    names = list(insights)
+    detail = {name: 3 for name in names}
+
+    def render():
+        return "\n".join(
+            line for name in names
+            for line in insight_lines(name, insights[name], detail[name], include_rows, max_rows)
+        )
+
+    digest = render()
+    for level in (2, 1, 0):
+        for name in reversed(names):
+            if count_tokens(digest) <= token_budget:
+                return digest
+            detail[name] = level
+            digest = render()
+    return truncate_to_tokens(digest, token_budget)
+
+
+def build_metadata_digest(metadata: str, token_budget: int = 1000) -> str:
+    return truncate_to_tokens(str(metadata), token_budget)
+
+
+def build_system_prompt(base: str, metadata: str, insights: dict, token_budget: int = 4000, include_rows: bool = False) -> str:
+    """
+    `base` + metadata digest + insight digest in at most `token_budget` tokens altogether.
+    The metadata gets up to a third of what the base prompt leaves, the insights the rest.
+    """
+    head, separator = base + "\n- Metadata = ", "\n- Insight = "
+    remaining = max(0, token_budget - count_tokens(head) - count_tokens(separator))
+    metadata_text = build_metadata_digest(metadata, remaining // 3)
+    insight_text = build_insight_digest(insights, remaining - count_tokens(metadata_text), include_rows)
+    # Token counts of the parts do not add up exactly once joined
+    return truncate_to_tokens(head + metadata_text + separator + insight_text, token_budget)
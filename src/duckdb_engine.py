@@ -0,0 +1,204 @@
+import os
+import uuid
+import shutil
+import decimal
+import datetime
+import tempfile
+import threading
+from contextlib import contextmanager
+from src.sql_executor import SQLExecutor, QueryBudget, FETCH_BATCH, reset_executor
+from src.profiler import TableProfiler
+from src.approximate import SAMPLE_ROWS, sample_table_name
+
+
+# ------------------------------------ DuckDB Engine ------------------------------------
+
+# Result types returned as they are, every other value is made JSON/SQLite friendly (dates -> ISO text...)
+PLAIN_TYPES = {"BOOLEAN", "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER",
+               "UBIGINT", "UHUGEINT", "FLOAT", "DOUBLE", "VARCHAR", "NULL"}
+INTEGER_TYPES = {"BOOLEAN", "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT"}
+REAL_TYPES = {"FLOAT", "DOUBLE", "DECIMAL"}
+VECTOR_SIZE = 2048   # rows per DuckDB vector, fetch_df_chunk counts in vectors
+
+
+def base_type(type_name) -> str:
+    return str(type_name).split("(")[0].strip().upper()
+
+
+def affinity(type_name) -> str:
+    """SQLite style type of a DuckDB column for the profile, dates and times keep their own name."""
+    name = base_type(type_name)
+    if name in INTEGER_TYPES:
+        return "INTEGER"
+    if name in REAL_TYPES:
+        return "REAL"
+    if name.startswith(("DATE", "TIME")):
+        return name
+    return "TEXT"
+
+
+def plain_value(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (datetime.timedelta, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class DuckDBExecutor(SQLExecutor):
+    """
+    Read-only DuckDB database behind the SQLExecutor interface (run, run_bounded, connection...).
+
+    The database is opened once per file, every query runs on its own cursor so concurrent calls do
+    not serialize, and DuckDB runs each of them vectorized over `threads` cores. Budgets only limit
+    wall-clock time (the cursor is interrupted), DuckDB has no VM step counter.
+    """
+
+    def __init__(self, db_name: str, threads: int = None, memory_limit: str = None):
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self._database = None
+        super().__init__(db_name)
+
+    def enable_wal(self):
+        pass
+
+    def database(self):
+        # Opened on first use like the SQLite pool, a missing file fails the query and not the lookup
+        with self._lock:
+            if self._database is None:
+                import duckdb
+                config = {key: value for key, value in (("threads", self.threads), ("memory_limit", self.memory_limit)) if value}
+                self._database = duckdb.connect(self.db_name, read_only=True, config=config)
+            return self._database
+
+    def _acquire(self):
+        cursor = self.database().cursor()
+        self._count("hits")
+        return cursor
+
+    def _release(self, conn):
+        conn.close()
+
+    @contextmanager
+    def connection(self, budget: QueryBudget = None):
+        import duckdb
+        conn = self._acquire()
+        timer = None
+        if budget is not None and budget.seconds:
+            timer = threading.Timer(budget.seconds, conn.interrupt)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield conn
+        except duckdb.InterruptException as e:
+            if timer is None:
+                raise
+            self._count("cancelled")
+            raise self.budget_exceeded("time", budget) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._release(conn)
+
+    @staticmethod
+    def fetch_all(cursor) -> list:
+        return list(DuckDBExecutor.fetch_batches(cursor))
+
+    @staticmethod
+    def fetch_batches(cursor):
+        convert = [i for i, column in enumerate(cursor.description or []) if base_type(column[1]) not in PLAIN_TYPES]
+        while rows := cursor.fetchmany(FETCH_BATCH):
+            if not convert:
+                yield from rows
+                continue
+            for row in rows:
+                row = list(row)
+                for i in convert:
+                    row[i] = plain_value(row[i])
+                yield tuple(row)
+
+    def close(self):
+        with self._lock:
+            database, self._database = self._database, None
+        if database is not None:
+            database.close()
+
+
+# ---- Ingestion ----
+
+@contextmanager
+def csv_path(csv_file):
+    """Path of `csv_file`, uploads (file-like) are spooled to a temporary file DuckDB can scan."""
+    if isinstance(csv_file, (str, os.PathLike)):
+        yield os.fspath(csv_file)
+        return
+    spool = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".csv", delete=False)
+    try:
+        with spool:
+            csv_file.seek(0)
+            shutil.copyfileobj(csv_file, spool, 1024 * 1024)
+        yield spool.name
+    finally:
+        os.remove(spool.name)
+
+
+def ingest_csv_duckdb(csv_file, db_name: str, table_name: str = "data", chunk_size: int = 50_000, progress=None, sample_rows: int = SAMPLE_ROWS) -> int:
+    """
+    Loads `csv_file` into `table_name` of the DuckDB file `db_name` with DuckDB's parallel CSV reader
+    (types detected by DuckDB, dates stay DATE/TIMESTAMP). The profile and the sample tables match the
+    SQLite ingestion, the profile is computed from the loaded table in `chunk_size` batches.
+
+    `progress(fraction, rows)` is called while profiling, fraction is the share of profiled rows.
+    Returns the number of ingested rows.
+    """
+    import duckdb
+    reset_executor(db_name)
+    with csv_path(csv_file) as path:
+        conn = duckdb.connect(db_name)
+        try:
+            conn.execute("BEGIN")
+            conn.execute(f"CREATE OR REPLACE TABLE {quote(table_name)} AS SELECT * FROM read_csv(?, header = true)", [path])
+            rows = conn.execute(f"SELECT COUNT(*) FROM {quote(table_name)}").fetchone()[0]
+            types = {row[1]: affinity(row[2]) for row in conn.execute(f"PRAGMA table_info({quote(table_name)})").fetchall()}
+            if not types:
+                raise ValueError("The CSV file has no header row")
+
+            profiler = TableProfiler()
+            dates = [column for column, kind in types.items() if kind == "DATE"]
+            cursor = conn.execute(f"SELECT * FROM {quote(table_name)}")
+            profiled = 0
+            while not (chunk := cursor.fetch_df_chunk(max(1, chunk_size // VECTOR_SIZE))).empty:
+                # pandas reads DATE as midnight timestamps, profile them as the dates the queries return
+                for column in dates:
+                    chunk[column] = chunk[column].dt.date
+                profiler.update(chunk)
+                profiled += len(chunk)
+                if progress is not None:
+                    progress(min(profiled / rows, 1.0), profiled)
+            profiler.write(conn, table_name, types, untyped="VARCHAR")
+
+            sample_table = sample_table_name(table_name)
+            conn.execute(f"DROP TABLE IF EXISTS {quote(sample_table)}")
+            if sample_rows and rows > sample_rows:
+                conn.execute(f"CREATE TABLE {quote(sample_table)} AS SELECT * FROM {quote(table_name)} USING SAMPLE reservoir({int(sample_rows)} ROWS) REPEATABLE (0)")
+            conn.execute("COMMIT")
+        except Exception:
+            try:
+                conn.execute("ROLLBACK")
+            except duckdb.Error:
+                pass
+            raise
+        finally:
+            conn.close()
+
+    reset_executor(db_name)
+    if progress is not None:
+        progress(1.0, rows)
+    return rows
@@ -0,0 +1,114 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# ------------------------------------- Image Store -------------------------------------
+
+class ImageStore():
+    """
+    Content-addressed PNG store: chat messages keep the returned reference (sha256 of the bytes)
+    instead of the image itself.
+
+    Files live in `store_dir`, a byte-budgeted LRU keeps recently shown images in memory so a
+    Streamlit rerun does not read them from disk again. The directory is trimmed to `max_disk_bytes`
+    by dropping the least recently used files.
+    """
+
+    def __init__(self, store_dir: str = "temp/images", memory_bytes: int = 32 * 1024 * 1024, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.store_dir = store_dir
+        self.memory_bytes = memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(store_dir, exist_ok=True)
+
+    def path(self, ref: str) -> str:
+        return os.path.join(self.store_dir, f"{ref}.png")
+
+    def put(self, data: bytes) -> str:
+        ref = hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+            self._count("stores")
+            self.evict_disk()
+        self._remember(ref, data)
+        return ref
+
+    def get(self, ref: str) -> bytes | None:
+        if not ref or len(ref) != 64:
+            return None
+        with self._lock:
+            data = self.memory.get(ref)
+            if data is not None:
+                self.memory.move_to_end(ref)
+                self.stats["memory_hits"] += 1
+                return data
+        try:
+            with open(self.path(ref), "rb") as file:
+                data = file.read()
+            os.utime(self.path(ref))   # mtime is the LRU clock of the disk tier
+        except (FileNotFoundError, ValueError):
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._remember(ref, data)
+        return data
+
+    def _remember(self, ref: str, data: bytes):
+        with self._lock:
+            if ref in self.memory:
+                self.memory.move_to_end(ref)
+                return
+            if len(data) > self.memory_bytes:
+                return
+            self.memory[ref] = data
+            self.bytes += len(data)
+            while self.bytes > self.memory_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def evict_disk(self):
+        files = []
+        for entry in os.scandir(self.store_dir):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            self._count("evictions")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self.memory), memory_bytes=self.bytes)
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageStore:
+    """Process-wide store shared by the agents and the UI."""
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = ImageStore()
+        return _image_store
@@ -0,0 +1,417 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from src.result_cache import QUOTED, canonicalize_sql
+from src.sql_executor import get_executor
+from src.profiler import load_profile
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------- Index Advisor -----------------------------------
+
+INDEX_PREFIX = "advisor_"
+IDENTIFIER = re.compile(r'"(?:[^"]|"")+"|\[[^\]]+\]|`[^`]+`|[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?')
+CLAUSE = re.compile(r"\b(WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|ON|UNION|EXCEPT|INTERSECT|FROM|JOIN|SELECT)\b", re.IGNORECASE)
+EQUALITY = re.compile(r"^\s*(==|=|IN\b|IS\b)", re.IGNORECASE)
+NUMBER = re.compile(r"(?<![\w.])\d+(\.\d+)?(e[+-]?\d+)?\b")
+RANGE = re.compile(r"^\s*(<=|>=|<|>|BETWEEN\b|LIKE\b|GLOB\b)", re.IGNORECASE)
+
+
+def query_shape(query: str) -> str:
+    """Canonical SQL with literals replaced by ?, queries differing only in their constants share a shape."""
+    parts = QUOTED.split(canonicalize_sql(query))
+    return "".join(
+        ("?" if part[0] == "'" else part) if i % 2 else NUMBER.sub("?", part)
+        for i, part in enumerate(parts)
+    )
+
+
+def unquote(identifier: str) -> str:
+    if identifier[0] in '"[`':
+        return identifier[1:-1].replace('""', '"')
+    return identifier.split(".")[-1]
+
+
+def is_full_scan(detail: str) -> bool:
+    return detail.startswith("SCAN ") and "INDEX" not in detail and "(subquery" not in detail and "CONSTANT ROW" not in detail
+
+
+def plan_kind(plan: list) -> str:
+    """'scan' (full table scan), 'index scan' (covering index scan) or 'search'."""
+    if any(is_full_scan(detail) for detail in plan):
+        return "scan"
+    if any(detail.startswith("SCAN ") and "INDEX" in detail for detail in plan):
+        return "index scan"
+    return "search"
+
+
+def extract_columns(query: str, columns: list) -> dict:
+    """
+    Columns a query filters (equality / range), groups, orders by and references, found by
+    scanning the clauses of the statement. String literals are ignored.
+    """
+    lookup = {column.lower(): column for column in columns}
+    parts = QUOTED.split(query)
+    # Literals become ?, quoted identifiers are kept
+    text = "".join(part if i % 2 == 0 or part[0] in '"[`' else "?" for i, part in enumerate(parts))
+
+    found = {"equality": [], "range": [], "group_by": [], "order_by": [], "referenced": []}
+
+    def add(kind, column):
+        if column not in found[kind]:
+            found[kind].append(column)
+
+    clauses = list(CLAUSE.finditer(text))
+    for index, clause_match in enumerate(clauses):
+        clause = re.sub(r"\s+", "", clause_match.group(1).upper())
+        end = clauses[index + 1].start() if index + 1 < len(clauses) else len(text)
+        segment = text[clause_match.end():end]
+        for match in IDENTIFIER.finditer(segment):
+            column = lookup.get(unquote(match.group(0)).lower())
+            if column is None:
+                continue
+            add("referenced", column)
+            following = segment[match.end():]
+            if clause in ("WHERE", "ON", "HAVING"):
+                if EQUALITY.match(following):
+                    add("equality", column)
+                elif RANGE.match(following):
+                    add("range", column)
+            elif clause == "GROUPBY":
+                add("group_by", column)
+            elif clause == "ORDERBY":
+                add("order_by", column)
+    return found
+
+
+class IndexAdvisor():
+    """
+    Watches the queries run against `table_name` and indexes the columns they keep scanning.
+
+    Every SELECT is logged with its EXPLAIN QUERY PLAN. Queries that still do a full table
+    scan vote for an index on their filter columns (equality first, most selective first,
+    then one range column) or their GROUP BY columns, made covering when the query only needs
+    a few more columns. Once a candidate got `min_scans` votes it is built in a background
+    thread, least used advisor indexes are dropped to stay within `disk_budget` bytes.
+    """
+
+    def __init__(self, db_name: str = "data/data.db", table_name: str = "data", disk_budget: int = 256 * 1024 * 1024,
+                 min_scans: int = 3, min_rows: int = 50_000, max_index_columns: int = 4, log_size: int = 1000, background: bool = True):
+        self.db_name = db_name
+        self.table_name = table_name
+        self.disk_budget = disk_budget
+        self.min_scans = min_scans
+        self.min_rows = min_rows
+        self.max_index_columns = max_index_columns
+        self.background = background
+        self.log = deque(maxlen=log_size)
+        self.plans = OrderedDict()          # query shape -> {"query", "plan", "count", "candidate"}
+        self.votes = {}                     # index columns -> set of query shapes
+        self.indexes = {}                   # index name -> info
+        self.dropped = []
+        self.conversions = []
+        self.failed = set()
+        self.deferred = {}                  # index columns -> scans when it did not fit the budget
+        self._lock = threading.Lock()
+        self._worker = None
+
+        # The executor it observes, reset_executor (re-ingestion, eviction) replaces it and retires the advisor
+        self.executor = executor = get_executor(db_name)
+        self.columns = [row[1] for row in executor.run(f"PRAGMA table_info({quote(table_name)});", use_cache=False)]
+        self.profile = load_profile(db_name, table_name)
+        # The profile already counted the rows during ingestion
+        profiled = next(iter(self.profile.values()), {}).get("rows")
+        self.rows = profiled if profiled is not None else executor.run(f"SELECT COUNT(*) FROM {quote(table_name)}", use_cache=False)[0][0]
+        self.table_pattern = re.compile(r"\b(FROM|JOIN)\s+(" + re.escape(quote(table_name)) + "|" + re.escape(table_name) + r")(?![\w\"])", re.IGNORECASE)
+        self.adopt_indexes()
+
+    def adopt_indexes(self):
+        """Advisor indexes left by an earlier run count against the budget and can be dropped again."""
+        existing = get_executor(self.db_name).run(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name LIKE ?",
+            (self.table_name, INDEX_PREFIX + "%"), use_cache=False
+        )
+        for (name,) in existing:
+            columns = tuple(row[2] for row in get_executor(self.db_name).run(f"PRAGMA index_info({quote(name)})", use_cache=False))
+            with get_executor(self.db_name).connection() as conn:
+                size = self.index_size(conn, name, columns)
+            self.indexes[name] = {"name": name, "columns": list(columns), "size": size, "build_seconds": None, "created": None, "uses": 0}
+
+    # ---- Query log ----
+
+    def explain(self, query: str) -> list:
+        # Own connection: EXPLAIN on a pooled connection keeps planning with the schema it loaded
+        # before the advisor created an index
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.db_name)}?mode=ro", uri=True, cached_statements=0)
+        try:
+            return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query).fetchall()]
+        finally:
+            conn.close()
+
+    def observe(self, query: str, elapsed: float = None):
+        """Called by the executor after a query ran, the plan is only computed the first time a query is seen."""
+        if not re.match(r"^\s*(SELECT|WITH)\b", query, re.IGNORECASE) or not self.table_pattern.search(query):
+            return
+        key = query_shape(query)
+        with self._lock:
+            entry = self.plans.get(key)
+        if entry is None:
+            try:
+                plan = self.explain(query)
+            except sqlite3.Error:
+                return
+            entry = {"query": query, "plan": plan, "count": 0, "candidate": self.candidate(query, plan)}
+            with self._lock:
+                entry = self.plans.setdefault(key, entry)
+                if len(self.plans) > self.log.maxlen:
+                    self.plans.popitem(last=False)
+
+        with self._lock:
+            entry["count"] += 1
+            self.plans.move_to_end(key)
+            self.log.append({"time": time.time(), "query": query, "elapsed": elapsed, "plan": entry["plan"]})
+            for name, info in self.indexes.items():
+                if any(name in detail for detail in entry["plan"]):
+                    info["uses"] += 1
+            candidate = entry["candidate"]
+            ready = False
+            if candidate is not None and candidate not in self.failed:
+                self.votes.setdefault(candidate, set()).add(key)
+                ready = self.scans(candidate) >= max(self.min_scans, 2 * self.deferred.get(candidate, 0))
+
+        if ready:
+            self.schedule()
+
+    def scans(self, candidate: tuple) -> int:
+        """Runs of the logged queries that still need `candidate`, the caller holds the lock."""
+        return sum(
+            self.plans[key]["count"] for key in self.votes.get(candidate, ())
+            if key in self.plans and self.plans[key]["candidate"] == candidate
+        )
+
+    def candidate(self, query: str, plan: list) -> tuple | None:
+        """Index columns (key columns, then covering ones) for a query doing a full scan, None when it needs none."""
+        if self.rows < self.min_rows or plan_kind(plan) != "scan":
+            return None
+        found = extract_columns(query, self.columns)
+        distinct = lambda column: self.profile.get(column, {}).get("distinct_count") or 0
+
+        if found["equality"] or found["range"]:
+            key = sorted(found["equality"], key=distinct, reverse=True)[:self.max_index_columns]
+            if found["range"] and len(key) < self.max_index_columns:
+                key.append(max(found["range"], key=distinct))
+        elif found["group_by"]:
+            key = found["group_by"][:self.max_index_columns]
+        elif found["order_by"]:
+            key = found["order_by"][:1]
+        else:
+            return None
+
+        # Covering: the query can be answered from the index alone
+        extra = [column for column in found["referenced"] if column not in key]
+        covering = bool(extra) and "*" not in re.sub(r"COUNT\s*\(\s*\*\s*\)", "", query, flags=re.IGNORECASE) and len(key) + len(extra) <= self.max_index_columns
+        return tuple(key + extra) if covering else tuple(key)
+
+    # ---- Index maintenance ----
+
+    def schedule(self):
+        if not self.background:
+            self.advise()
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self.advise, name="index-advisor", daemon=True)
+            self._worker.start()
+
+    def wait(self, timeout: float = None):
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def pending(self) -> list:
+        """Candidates with enough scans, most scanned first."""
+        with self._lock:
+            scored = []
+            for candidate in self.votes:
+                scans = self.scans(candidate)
+                # Candidates that did not fit the budget come back once they were scanned twice as often
+                if scans >= max(self.min_scans, 2 * self.deferred.get(candidate, 0)) and candidate not in self.failed and index_name(candidate) not in self.indexes:
+                    scored.append((scans, candidate))
+        return [candidate for _, candidate in sorted(scored, reverse=True)]
+
+    def advise(self):
+        # Candidates that became ready while an index was being built are picked up by the next pass
+        attempted = set()
+        while candidates := [candidate for candidate in self.pending() if candidate not in attempted]:
+            for candidate in candidates:
+                attempted.add(candidate)
+                try:
+                    self.create_index(candidate)
+                except sqlite3.Error as e:
+                    logger.warning("Index advisor could not create an index on %s: %s", candidate, e)
+                    with self._lock:
+                        self.failed.add(candidate)
+
+    def writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000;")
+        return conn
+
+    def estimate_size(self, columns: tuple) -> int:
+        """Bytes of an index on `columns`: rowid + average stored width, measured on a sample."""
+        widths = ", ".join(f"AVG(LENGTH({quote(column)}))" for column in columns)
+        # Not through run(): the advisor must not observe its own queries
+        with get_executor(self.db_name).connection() as conn:
+            sample = conn.execute(f"SELECT {widths} FROM (SELECT * FROM {quote(self.table_name)} LIMIT 10000)").fetchone()
+        row_bytes = sum(width or 0 for width in sample) + 8 + 2 * len(columns)
+        return int(self.rows * row_bytes * 1.2)   # b-tree pages are not full
+
+    def index_size(self, conn: sqlite3.Connection, name: str, columns: tuple) -> int:
+        try:
+            return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (name,)).fetchone()[0] or 0
+        except sqlite3.Error:
+            return self.estimate_size(columns)   # dbstat is not compiled in
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(info["size"] for info in self.indexes.values())
+
+    def make_room(self, needed: int, benefit: int) -> bool:
+        """Drops least used advisor indexes (less used than `benefit`) until `needed` bytes fit in the budget."""
+        if needed > self.disk_budget:
+            return False
+        with self._lock:
+            by_use = sorted(self.indexes.items(), key=lambda item: item[1]["uses"])
+        victims, free = [], self.disk_budget - self.used_bytes()
+        for name, info in by_use:
+            if free >= needed:
+                break
+            if info["uses"] >= benefit:
+                return False
+            victims.append(name)
+            free += info["size"]
+        if free < needed:
+            return False
+        for name in victims:
+            self.drop_index(name, reason="disk budget")
+        return True
+
+    def create_index(self, columns: tuple):
+        name = index_name(columns)
+        with self._lock:
+            benefit = self.scans(columns)
+        if benefit < self.min_scans:
+            return   # an index built meanwhile already serves these queries
+        if not self.make_room(self.estimate_size(columns), benefit):
+            with self._lock:
+                self.deferred[columns] = benefit
+            return
+
+        start = time.perf_counter()
+        conn = self.writer()
+        try:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(self.table_name)} ({', '.join(quote(column) for column in columns)})")
+            conn.execute(f"ANALYZE {quote(name)}")
+            size = self.index_size(conn, name, columns)
+        finally:
+            conn.close()
+
+        info = {"name": name, "columns": list(columns), "size": size, "build_seconds": round(time.perf_counter() - start, 3), "created": time.time(), "uses": 0}
+        with self._lock:
+            self.indexes[name] = info
+            scanning = [(key, dict(entry)) for key, entry in self.plans.items() if plan_kind(entry["plan"]) == "scan"]
+
+        # Every query still scanning is planned again, the new index may serve more than its voters
+        conversions = {}
+        for key, entry in scanning:
+            after = self.explain(entry["query"])
+            if after != entry["plan"]:
+                conversions[key] = {"query": entry["query"], "index": name, "before": entry["plan"], "after": after,
+                                    "before_kind": plan_kind(entry["plan"]), "after_kind": plan_kind(after), "runs_before": entry["count"]}
+        with self._lock:
+            self.conversions.extend(conversions.values())
+            for key, conversion in conversions.items():
+                if key in self.plans:
+                    self.plans[key]["plan"] = conversion["after"]
+                    self.plans[key]["candidate"] = self.candidate(conversion["query"], conversion["after"])
+
+    def drop_index(self, name: str, reason: str = ""):
+        conn = self.writer()
+        try:
+            conn.execute(f"DROP INDEX IF EXISTS {quote(name)}")
+        finally:
+            conn.close()
+        with self._lock:
+            info = self.indexes.pop(name, None)
+            if info is not None:
+                self.dropped.append(dict(info, reason=reason, dropped=time.time()))
+            # Queries that used it scan again and may vote for it again
+            for entry in self.plans.values():
+                if any(name in detail for detail in entry["plan"]):
+                    entry["plan"] = self.explain(entry["query"])
+                    entry["candidate"] = self.candidate(entry["query"], entry["plan"])
+            if info is not None and reason == "disk budget":
+                # Not rebuilt right away, indexes would otherwise keep evicting each other
+                columns = tuple(info["columns"])
+                self.deferred[columns] = max(self.scans(columns), info["uses"], 1)
+
+    def drop_all(self):
+        for name in list(self.indexes):
+            self.drop_index(name, reason="manual")
+
+    def report(self) -> dict:
+        """Indexes the advisor manages and the plan changes they achieved."""
+        with self._lock:
+            conversions = list(self.conversions)
+            return {
+                "table": self.table_name,
+                "rows": self.rows,
+                "observed_queries": sum(entry["count"] for entry in self.plans.values()),
+                "distinct_queries": len(self.plans),
+                "full_scans_pending": sum(1 for entry in self.plans.values() if plan_kind(entry["plan"]) == "scan"),
+                "indexes": [dict(info) for info in self.indexes.values()],
+                "used_bytes": sum(info["size"] for info in self.indexes.values()),
+                "disk_budget": self.disk_budget,
+                "dropped": list(self.dropped),
+                "scan_to_search": sum(1 for c in conversions if c["before_kind"] == "scan" and c["after_kind"] == "search"),
+                "scan_to_index_scan": sum(1 for c in conversions if c["before_kind"] == "scan" and c["after_kind"] == "index scan"),
+                "conversions": conversions,
+            }
+
+
+def quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def index_name(columns: tuple) -> str:
+    return INDEX_PREFIX + hashlib.sha1("\x1f".join(columns).encode()).hexdigest()[:12]
+
+
+_advisors = {}
+_advisors_lock = threading.Lock()
+
+
+def enable_index_advisor(db_name: str = "data/data.db", table_name: str = "data", **config) -> IndexAdvisor:
+    """Attaches a fresh advisor to the executor of `db_name`, call it again after the table was re-ingested."""
+    advisor = IndexAdvisor(db_name, table_name, **config)
+    advisor.executor.query_observer = advisor.observe
+    with _advisors_lock:
+        _advisors[(db_name, table_name)] = advisor
+    return advisor
+
+
+def get_index_advisor(db_name: str = "data/data.db", table_name: str = "data") -> IndexAdvisor | None:
+    """Advisor attached to the current executor of `db_name`, None once the file was re-ingested or evicted."""
+    with _advisors_lock:
+        advisor = _advisors.get((db_name, table_name))
+        if advisor is not None and advisor.executor is not get_executor(db_name):
+            del _advisors[(db_name, table_name)]
+            advisor = None
+        return advisor
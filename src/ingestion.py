@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import pandas as pd
+from src.sql_executor import BUNDLED_DATABASES, engine_name, reset_executor
+from src.profiler import TableProfiler
+from src.approximate import SAMPLE_ROWS, ReservoirSampler, sample_table_name
+
+
+# ------------------------------------ CSV Ingestion ------------------------------------
+
+INGEST_PRAGMAS = {
+    "journal_mode": "OFF",       # single bulk transaction, nothing to roll back to
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,   # 256MB
+    "temp_store": "MEMORY",
+}
+
+# Widening order of the declared column types, a column only ever moves to the right
+SQLITE_TYPES = ["INTEGER", "REAL", "TEXT"]
+
+
+def infer_sqlite_type(series: pd.Series) -> str | None:
+    """Maps a pandas column to a SQLite type, None when the chunk holds no values for it."""
+    values = series.dropna()
+    if values.empty:
+        return None
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(values):
+        # read_csv turns integer columns with missing values into floats
+        return "INTEGER" if (values % 1 == 0).all() else "REAL"
+    return "TEXT"
+
+
+def widen_type(current: str | None, new: str | None) -> str | None:
+    if current is None:
+        return new
+    if new is None:
+        return current
+    return max(current, new, key=SQLITE_TYPES.index)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def chunk_rows(chunk: pd.DataFrame):
+    """Yields plain Python tuples with NaN replaced by NULL, ready for executemany."""
+    columns = [chunk[col].to_numpy(dtype=object, na_value=None) for col in chunk.columns]
+    return zip(*columns)
+
+
+def create_table_sql(table_name: str, columns: list, types: dict) -> str:
+    column_defs = ", ".join(f"{quote_identifier(col)} {types[col] or 'TEXT'}" for col in columns)
+    return f"CREATE TABLE {quote_identifier(table_name)} ({column_defs})"
+
+
+def source_size(csv_file) -> int | None:
+    if isinstance(csv_file, (str, os.PathLike)):
+        return os.path.getsize(csv_file)
+    return getattr(csv_file, "size", None)
+
+
+def ingest_csv(csv_file, db_name: str = "data/data.db", table_name: str = "data", chunk_size: int = 50_000, progress=None, sample_rows: int = SAMPLE_ROWS) -> int:
+    """
+    Streams `csv_file` (path or file-like upload) into `table_name` chunk by chunk.
+
+    Column types are inferred from the first chunk and widened (INTEGER -> REAL -> TEXT) when
+    later chunks need it. All chunks are written with executemany inside one transaction into a
+    staging table that replaces `table_name` at the end, so peak memory is bounded by `chunk_size`.
+
+    The column profile (see src/profiler.py) is computed from the same chunks and stored in
+    `<table_name>__profile`.
+
+    Tables with more than `sample_rows` rows also get a uniform sample of that many rows in
+    `<table_name>__sample` for approximate queries (see src/approximate.py), 0 disables it.
+
+    `progress(fraction, rows)` is called after every chunk, fraction is None when the size is unknown.
+    Returns the number of ingested rows. `.duckdb` files are loaded by DuckDB, see src/duckdb_engine.py.
+    """
+    if engine_name(db_name) == "DuckDB":
+        from src.duckdb_engine import ingest_csv_duckdb
+        return ingest_csv_duckdb(csv_file, db_name=db_name, table_name=table_name, chunk_size=chunk_size, progress=progress, sample_rows=sample_rows)
+
+    total_bytes = source_size(csv_file)
+    handle = open(csv_file, "rb") if isinstance(csv_file, (str, os.PathLike)) else csv_file
+    staging = f"{table_name}__ingest"
+
+    # Pooled readers would block the journal mode switch
+    reset_executor(db_name)
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        for pragma, value in INGEST_PRAGMAS.items():
+            try:
+                conn.execute(f"PRAGMA {pragma}={value};")
+            except sqlite3.OperationalError:
+                # Another process is still reading in WAL mode, ingest without the tuning
+                pass
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+
+        columns, types, declared, insert_sql = None, {}, {}, None
+        rows = 0
+        profiler = TableProfiler()
+        sampler = ReservoirSampler(sample_rows) if sample_rows else None
+        for chunk in pd.read_csv(handle, chunksize=chunk_size):
+            if columns is None:
+                columns = [str(col) for col in chunk.columns]
+                types = {col: infer_sqlite_type(chunk[col]) for col in chunk.columns}
+                declared = dict(types)
+                conn.execute(create_table_sql(staging, columns, types))
+                placeholders = ", ".join("?" for _ in columns)
+                insert_sql = f"INSERT INTO {quote_identifier(staging)} VALUES ({placeholders})"
+            else:
+                for col in chunk.columns:
+                    types[col] = widen_type(types[col], infer_sqlite_type(chunk[col]))
+
+            conn.executemany(insert_sql, chunk_rows(chunk))
+            profiler.update(chunk)
+            if sampler is not None:
+                sampler.update(chunk)
+            rows += len(chunk)
+
+            if progress is not None:
+                fraction = min(handle.tell() / total_bytes, 1.0) if total_bytes else None
+                progress(fraction, rows)
+
+        if columns is None:
+            raise ValueError("The CSV file has no header row")
+
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+        if types == declared:
+            conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table_name)}")
+        else:
+            # SQLite cannot change a declared column type, rebuild once with the widened schema
+            conn.execute(create_table_sql(table_name, columns, types))
+            conn.execute(f"INSERT INTO {quote_identifier(table_name)} SELECT * FROM {quote_identifier(staging)}")
+            conn.execute(f"DROP TABLE {quote_identifier(staging)}")
+        profiler.write(conn, table_name, types)
+        sample_table = sample_table_name(table_name)
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(sample_table)}")
+        if sampler is not None and rows > sample_rows:
+            conn.execute(create_table_sql(sample_table, columns, types))
+            conn.executemany(f"INSERT INTO {quote_identifier(sample_table)} VALUES ({', '.join('?' for _ in columns)})", chunk_rows(sampler.frame()))
+        conn.execute("COMMIT")
+        # The committed sample database keeps its rollback journal, see BUNDLED_DATABASES
+        if os.path.abspath(db_name) not in BUNDLED_DATABASES:
+            conn.execute("PRAGMA journal_mode=WAL;")
+    except Exception:
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        raise
+    finally:
+        conn.close()
+        if handle is not csv_file:
+            handle.close()
+
+    reset_executor(db_name)
+    if progress is not None:
+        progress(1.0, rows)
+    return rows
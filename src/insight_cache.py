@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------ Insight Cache ------------------------------------
+
+# Prompts whose wording changes the generated insights, editing any of them invalidates the cache
+INSIGHT_PROMPTS = ["metadata", "relation_mapper", "insight_generator", "text_to_sql", "summarizer"]
+# Insights shipped with the sample datasets, seeded into the cache so they are not regenerated
+BUNDLED_INSIGHTS = {"data/market_data.csv": "temp/market_data.json", "data/test_data.csv": "temp/test_data.json"}
+
+
+def hash_file(csv_file, chunk_size: int = 1024 * 1024) -> str:
+    """Streams a path or file-like object through sha256, the file position is restored afterwards."""
+    digest = hashlib.sha256()
+    if isinstance(csv_file, (str, os.PathLike)):
+        with open(csv_file, "rb") as file:
+            while chunk := file.read(chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    position = csv_file.tell()
+    csv_file.seek(0)
+    while chunk := csv_file.read(chunk_size):
+        digest.update(chunk)
+    csv_file.seek(position)
+    return digest.hexdigest()
+
+
+def hash_text(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def schema_fingerprint(columns: list) -> str:
+    """`columns` is the PRAGMA table_info output (or any list of (name, type) pairs)."""
+    return hash_text(*columns)[:16]
+
+
+def prompt_version(sys_data: dict, names: list = INSIGHT_PROMPTS) -> str:
+    return hash_text(*(sys_data.get(name, "") for name in names))[:16]
+
+
+def write_json_atomic(path: str, data):
+    """Writes to a temporary file in the same directory and renames it over `path`."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, indent=4)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class InsightCache():
+    """
+    Insight JSON cache keyed by file content hash + schema fingerprint + prompt version.
+
+    `find` looks an upload up by content hash + prompt version alone, before the file is ingested.
+    Entries live in `cache_dir/<key>.json` and are tracked in `cache_dir/index.json` with their
+    size and last access time, the least recently used entries are evicted once `max_entries`
+    or `max_bytes` is exceeded. All files are written atomically.
+    """
+
+    def __init__(self, cache_dir: str = "temp/insights", max_entries: int = 50, max_bytes: int = 50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, schema_hash: str, prompt_hash: str) -> str:
+        return hash_text(content_hash, schema_hash, prompt_hash)[:32]
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            index = self.load_index()
+            if key not in index:
+                return None
+            try:
+                with open(self.entry_path(key), "r") as file:
+                    insights = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                del index[key]
+                write_json_atomic(self.index_path, index)
+                return None
+            index[key]["last_access"] = time.time()
+            write_json_atomic(self.index_path, index)
+            return insights
+
+    def put(self, key: str, insights: dict, **info):
+        """Stores `insights`, extra keyword arguments (source name, hashes...) are kept in the index."""
+        with self._lock:
+            path = self.entry_path(key)
+            write_json_atomic(path, insights)
+            index = self.load_index()
+            now = time.time()
+            index[key] = {**info, "size": os.path.getsize(path), "created": now, "last_access": now}
+            self.evict(index)
+            write_json_atomic(self.index_path, index)
+
+    def update(self, key: str, insights: dict) -> bool:
+        """Replaces the insights of an existing entry, its index info (source name, hashes...) is kept."""
+        with self._lock:
+            index = self.load_index()
+            if key not in index:
+                return False
+            path = self.entry_path(key)
+            write_json_atomic(path, insights)
+            index[key].update(size=os.path.getsize(path), last_access=time.time())
+            self.evict(index)
+            write_json_atomic(self.index_path, index)
+            return True
+
+    def find(self, content_hash: str, prompt_hash: str, database_type: str = "SQLite") -> str | None:
+        """Key of the entry generated from the same file content and prompts, found without ingesting the file."""
+        with self._lock:
+            index = self.load_index()
+        candidates = [
+            key for key, entry in index.items()
+            if entry.get("content_hash") == content_hash and entry.get("prompt_hash") == prompt_hash
+            and entry.get("database_type", "SQLite") == database_type
+        ]
+        return max(candidates, key=lambda key: index[key].get("last_access", 0), default=None)
+
+    def seed(self, csv_path: str, insights_path: str, prompt_hash: str) -> str | None:
+        """Adds the insights of a bundled sample dataset under its content hash, unless an entry exists already."""
+        if not (os.path.exists(csv_path) and os.path.exists(insights_path)):
+            return None
+        content_hash = hash_file(csv_path)
+        key = self.find(content_hash, prompt_hash)
+        if key is not None:
+            return key
+        with open(insights_path, "r") as file:
+            insights = json.load(file)
+        key = self.make_key(content_hash, "seed", prompt_hash)
+        self.put(key, insights, source_name=os.path.basename(csv_path), content_hash=content_hash, prompt_hash=prompt_hash,
+                 database_type="SQLite", seeded=True)
+        return key
+
+    def find_refreshable(self, schema_hash: str, prompt_hash: str, source_name: str, database_type: str = "SQLite", exclude: str = None) -> str | None:
+        """
+        Most recently used entry generated from an earlier version of the same source file (same name,
+        schema, prompts and engine), its SQL can be re-run on the new data. An unrelated dataset that
+        only shares the columns is not a match.
+        """
+        with self._lock:
+            index = self.load_index()
+        candidates = [
+            key for key, entry in index.items()
+            if key != exclude and entry.get("schema_hash") == schema_hash and entry.get("prompt_hash") == prompt_hash
+            and entry.get("source_name") == source_name and entry.get("database_type", "SQLite") == database_type
+        ]
+        return max(candidates, key=lambda key: index[key].get("last_access", 0), default=None)
+
+    def evict(self, index: dict):
+        """Drops least recently used entries from `index` (in place) and disk until within budget."""
+        by_age = sorted(index, key=lambda key: index[key].get("last_access", 0))
+        total = sum(entry.get("size", 0) for entry in index.values())
+        while by_age and (len(index) > self.max_entries or total > self.max_bytes):
+            key = by_age.pop(0)
+            total -= index.pop(key).get("size", 0)
+            try:
+                os.remove(self.entry_path(key))
+            except FileNotFoundError:
+                pass
+
+
+_seeded = set()
+_seeded_lock = threading.Lock()
+
+
+def seed_bundled_insights(cache: InsightCache, prompt_hash: str, bundled: dict = BUNDLED_INSIGHTS):
+    """Seeds the sample dataset insights once per process and prompt version."""
+    with _seeded_lock:
+        if (cache.cache_dir, prompt_hash) in _seeded:
+            return
+        _seeded.add((cache.cache_dir, prompt_hash))
+    for csv_path, insights_path in bundled.items():
+        try:
+            cache.seed(csv_path, insights_path, prompt_hash)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not seed insights from %s: %s", insights_path, e)
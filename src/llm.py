@@ -0,0 +1,78 @@
+import os
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+from src.llm_gateway import LLMGateway, GatewayTransport, PRIORITY_HEADER
+
+
+# ------------------------------------- LLM Clients -------------------------------------
+
+MODEL = "gpt-4o"
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+def gateway_limits() -> dict:
+    """
+    Client side limits of the gateway from LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE (your
+    OpenAI tier). Unset or 0 means no limit, the gateway then only backs off on the server's 429s.
+    """
+    return {
+        "requests_per_minute": float(os.environ.get("LLM_REQUESTS_PER_MINUTE") or 0) or None,
+        "tokens_per_minute": float(os.environ.get("LLM_TOKENS_PER_MINUTE") or 0) or None,
+    }
+
+
+_gateway = None
+_http_client = None
+_chat_models = {}
+_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Rate limiter, retry and coalescing layer shared by every OpenAI call, see src/llm_gateway.py."""
+    global _gateway
+    with _lock:
+        if _gateway is None:
+            _gateway = LLMGateway(**gateway_limits(), transport=httpx.HTTPTransport(limits=HTTP_LIMITS))
+        return _gateway
+
+
+def get_http_client() -> httpx.Client:
+    """One keep-alive connection pool for every OpenAI call in the process, requests pass the gateway."""
+    global _http_client
+    gateway = get_llm_gateway()
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(transport=GatewayTransport(gateway), timeout=HTTP_TIMEOUT)
+        return _http_client
+
+
+def get_chat_model(json_mode: bool = False, priority: str = "interactive") -> ChatOpenAI:
+    """
+    Shared ChatOpenAI instance (they are thread safe), `json_mode` forces a JSON object answer.
+    `priority` is the gateway lane: "interactive" (chat) or "background" (insight generation).
+    Agents bind their tools on top of it, which does not create a new client.
+    """
+    http_client = get_http_client()
+    with _lock:
+        llm = _chat_models.get((json_mode, priority))
+        if llm is None:
+            model_kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+            # The gateway retries with the shared backoff, client side retries would pile up on a 429.
+            # stream_usage: streamed answers end with their token usage, the gateway settles its estimate with it
+            llm = _chat_models[(json_mode, priority)] = ChatOpenAI(
+                model=MODEL, model_kwargs=model_kwargs, http_client=http_client, max_retries=0, stream_usage=True,
+                default_headers={PRIORITY_HEADER: priority},
+            )
+        return llm
+
+
+def reset_chat_models():
+    """Drops the cached models, the connection pool and the gateway, e.g. after the API key or ChatOpenAI itself was replaced."""
+    global _http_client, _gateway
+    with _lock:
+        _chat_models.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        _gateway = None
@@ -0,0 +1,297 @@
+import json
+import math
+import time
+import heapq
+import random
+import hashlib
+import threading
+import itertools
+import email.utils
+import httpx
+
+
+# ------------------------------------- LLM Gateway -------------------------------------
+
+# None: no client side limit, the server's 429s still pause the gateway (see src/llm.py for the env settings)
+REQUESTS_PER_MINUTE = None
+TOKENS_PER_MINUTE = None
+# Lower number goes first: chat answers are not queued behind background insight generation
+LANES = {"interactive": 0, "background": 1}
+PRIORITY_HEADER = "x-llm-priority"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+class TokenBucket():
+    """`per_minute` units refilled evenly, at most `burst_seconds` worth of them can be spent at once. No limit when `per_minute` is None/0."""
+
+    def __init__(self, per_minute: float = None, burst_seconds: float = 10.0):
+        self.unlimited = not per_minute
+        self.rate = per_minute / 60.0 if per_minute else math.inf
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.unlimited:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, 0 when they are now."""
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+def estimate_tokens(body: dict, content: bytes) -> int:
+    """Prompt tokens (~4 bytes of JSON per token) plus the completion the request may produce."""
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return len(content) // 4 + int(completion)
+
+
+def retry_delay(response: httpx.Response, attempt: int, base: float, cap: float) -> float:
+    """Retry-After (seconds or HTTP date, or retry-after-ms) when the server sent it, else exponential backoff with jitter."""
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return min(float(headers["retry-after-ms"]) / 1000.0, cap)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return min(float(value), cap)
+            except ValueError:
+                return min(max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0), cap)
+    except (TypeError, ValueError):
+        pass
+    return min(base * 2**attempt, cap) * random.uniform(0.5, 1.0)
+
+
+class LLMGateway():
+    """
+    Process-wide admission control for the OpenAI calls, plugged in as the httpx transport of
+    the shared client so every ChatOpenAI call (invoke or stream) goes through it:
+
+    - token buckets on requests/min and tokens/min (off unless set), the token cost is estimated from
+      the request and corrected with the `usage` of the answer, streamed answers included;
+    - priority lanes, a waiting interactive request is always admitted before background ones;
+    - a 429 pauses the whole gateway for its Retry-After (everyone shares the same limit), other
+      transient errors are retried with exponential backoff, the OpenAI client does not retry itself;
+    - identical non-streaming requests in flight at the same time are sent once, the followers
+      get a copy of the response.
+    """
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE, tokens_per_minute: int = TOKENS_PER_MINUTE, burst_seconds: float = 10.0,
+                 max_retries: int = 6, base_backoff: float = 1.0, max_backoff: float = 60.0, transport: httpx.BaseTransport = None):
+        # OpenAI enforces the per minute limits over shorter periods too, bursts are capped to `burst_seconds`
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.transport = transport or httpx.HTTPTransport()
+        self.paused_until = 0.0
+        self._condition = threading.Condition()
+        self._waiting = []                 # heap of (lane, sequence)
+        self._sequence = itertools.count()
+        self._in_flight = {}               # request key -> {"event", "response", "error"}
+        self._in_flight_lock = threading.Lock()
+        self.stats = {"requests": 0, "sent": 0, "coalesced": 0, "retries": 0, "rate_limited": 0, "failed": 0, "wait_seconds": 0.0}
+
+    def _count(self, key: str, amount=1):
+        with self._condition:
+            self.stats[key] += amount
+
+    # ---- Admission ----
+
+    def acquire(self, lane: int, tokens: int):
+        """Blocks until the request is at the head of the queue, not paused and within both budgets."""
+        ticket = (lane, next(self._sequence))
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    if self._waiting[0] == ticket:
+                        wait = max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            break
+                    else:
+                        wait = None   # woken up when the head changes
+                    self._condition.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+            self.stats["wait_seconds"] += time.monotonic() - start
+
+    def pause(self, seconds: float):
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def settle(self, estimated: int, used: int):
+        """Gives back (or takes) the difference between the consumed estimate and the reported token usage."""
+        with self._condition:
+            # acquire() consumed at most a full bucket, only that much can be given back
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + min(estimated, self.tokens.capacity) - used)
+            self._condition.notify_all()
+
+    # ---- Requests ----
+
+    def send(self, request: httpx.Request) -> httpx.Response:
+        self._count("requests")
+        lane = LANES.get(request.headers.get(PRIORITY_HEADER, "interactive"), 0)
+        if PRIORITY_HEADER in request.headers:
+            del request.headers[PRIORITY_HEADER]
+        content = request.read()
+        try:
+            body = json.loads(content) if content else {}
+        except ValueError:
+            body = {}
+        body = body if isinstance(body, dict) else {}
+        if body.get("stream") or request.method != "POST":
+            return self.send_with_retries(request, lane, body, content)
+
+        key = hashlib.sha256(request.method.encode() + str(request.url).encode() + content).hexdigest()
+        with self._in_flight_lock:
+            shared = self._in_flight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._in_flight[key] = {"event": threading.Event(), "response": None, "error": None}
+        if not leader:
+            self._count("coalesced")
+            shared["event"].wait()
+            if shared["error"] is not None:
+                raise shared["error"]
+            return copy_response(shared["response"], request)
+
+        try:
+            response = self.send_with_retries(request, lane, body, content)
+            response.read()
+            shared["response"] = response
+            return copy_response(response, request)
+        except Exception as e:
+            shared["error"] = e
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+            shared["event"].set()
+
+    def send_with_retries(self, request: httpx.Request, lane: int, body: dict, content: bytes) -> httpx.Response:
+        estimated = estimate_tokens(body, content)
+        attempt = 0
+        while True:
+            self.acquire(lane, estimated)
+            self._count("sent")
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                time.sleep(min(self.base_backoff * 2**attempt, self.max_backoff) * random.uniform(0.5, 1.0))
+                attempt += 1
+                self._count("retries")
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                if response.status_code >= 400:
+                    self._count("failed")
+                elif body.get("stream"):
+                    # Settled from the final usage chunk (stream_options.include_usage) once the stream was read
+                    return httpx.Response(response.status_code, headers=response.headers, request=request, extensions=response.extensions,
+                                          stream=UsageStream(response.stream, lambda used: self.settle(estimated, estimated if used is None else used)))
+                else:
+                    self.settle(estimated, reported_usage(response, estimated))
+                return response
+
+            delay = retry_delay(response, attempt, self.base_backoff, self.max_backoff)
+            response.read()
+            response.close()
+            if response.status_code == 429:
+                # The limit is shared by every caller: hold all of them, not only this request
+                self._count("rate_limited")
+                self.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            self._count("retries")
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return dict(self.stats, queued=len(self._waiting), paused=max(self.paused_until - time.monotonic(), 0.0))
+
+    def close(self):
+        self.transport.close()
+
+
+def reported_usage(response: httpx.Response, default: int) -> int:
+    try:
+        return int(json.loads(response.read())["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return default
+
+
+class UsageStream(httpx.SyncByteStream):
+    """Passes a streamed (SSE) answer through, `on_close(total_tokens or None)` is called once it was closed."""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+        self.used = None
+        self.pending = b""
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.scan(chunk)
+            yield chunk
+
+    def scan(self, chunk: bytes):
+        self.pending += chunk
+        *lines, self.pending = self.pending.split(b"\n")
+        for line in lines:
+            # Every chunk carries "usage": null, only the last one (empty choices) has the totals
+            if not line.startswith(b"data:") or b'"total_tokens"' not in line:
+                continue
+            try:
+                self.used = int(json.loads(line[5:])["usage"]["total_tokens"])
+            except (ValueError, KeyError, TypeError):
+                pass
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            if not self.closed:
+                self.closed = True
+                self.on_close(self.used)
+
+
+def copy_response(response: httpx.Response, request: httpx.Request) -> httpx.Response:
+    """Fresh response object over the already read body, one per caller."""
+    headers = [(key, value) for key, value in response.headers.items() if key.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(response.status_code, headers=headers, content=response.content, request=request)
+
+
+class GatewayTransport(httpx.BaseTransport):
+    """httpx transport routing every request of the client through the gateway."""
+
+    def __init__(self, gateway: LLMGateway):
+        self.gateway = gateway
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.gateway.send(request)
+
+    def close(self):
+        self.gateway.close()
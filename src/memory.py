@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+from langchain_core.messages import HumanMessage, ToolMessage, RemoveMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from src.digest import count_tokens, truncate_to_tokens
+
+
+# --------------------------------- Conversation Memory ---------------------------------
+
+HISTORY_TOKENS = 3000     # message tokens kept verbatim, older turns are folded into the summary
+TOOL_TOKENS = 300         # tool outputs of earlier turns are cut to this many tokens
+
+
+def message_tokens(message) -> int:
+    tokens = count_tokens(str(message.content or ""))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += count_tokens(str(tool_call.get("args", "")))
+    return tokens
+
+
+def split_turns(messages: list) -> list:
+    """Groups messages into turns, a turn starts at a HumanMessage, so tool calls never lose their results."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def digest_tool_messages(messages: list, max_tokens: int = TOOL_TOKENS) -> list:
+    """Copies (same id, so add_messages replaces them) of the large tool outputs cut to `max_tokens`."""
+    updates = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and not message.additional_kwargs.get("digested"):
+            content = str(message.content)
+            if count_tokens(content) > max_tokens:
+                updates.append(message.model_copy(update={
+                    "content": truncate_to_tokens(content, max_tokens) + " [cut, call the tool again for the full output]",
+                    "additional_kwargs": {**message.additional_kwargs, "digested": True},
+                }))
+    return updates
+
+
+def compact_history(messages: list, summarize, history_tokens: int = HISTORY_TOKENS, tool_tokens: int = TOOL_TOKENS) -> dict:
+    """
+    State update bounding the history before a new turn (the last message is its HumanMessage):
+    tool outputs of earlier turns are cut to digests, and when the rest is still over `history_tokens`
+    the oldest turns are removed and `summarize(turns)` folds them into the running summary.
+    Compaction goes down to half the window so the summarizer does not run on every turn.
+    """
+    turns = split_turns(messages)
+    update = {"messages": digest_tool_messages([message for turn in turns[:-1] for message in turn], tool_tokens)}
+    digested = {message.id: message for message in update["messages"]}
+    turns = [[digested.get(message.id, message) for message in turn] for turn in turns]
+
+    total = sum(message_tokens(message) for turn in turns for message in turn)
+    if total <= history_tokens:
+        return update
+
+    dropped = []
+    while len(turns) > 1 and total > history_tokens // 2:
+        turn = turns.pop(0)
+        total -= sum(message_tokens(message) for message in turn)
+        dropped.append(turn)
+    update["messages"] = [message for message in update["messages"] if message.id not in {m.id for turn in dropped for m in turn}]
+    update["messages"] += [RemoveMessage(id=message.id) for turn in dropped for message in turn]
+    update["summary"] = summarize(dropped)
+    return update
+
+
+def format_turns(turns: list) -> str:
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if isinstance(message, HumanMessage):
+                lines.append(f"User: {message.content}")
+            elif isinstance(message, ToolMessage):
+                lines.append(f"Tool {message.name}: {truncate_to_tokens(str(message.content), 150)}")
+            elif message.content:
+                lines.append(f"Assistant: {message.content}")
+            for tool_call in getattr(message, "tool_calls", None) or []:
+                lines.append(f"Assistant called {tool_call['name']} with {tool_call['args']}")
+    return "\n".join(lines)
+
+
+_checkpointers = {}
+_checkpointers_lock = threading.Lock()
+
+
+def get_checkpointer(path: str = "temp/checkpoints.db") -> SqliteSaver:
+    """Process-wide SQLite checkpointer, every chat thread is stored under its thread id."""
+    key = os.path.abspath(path)
+    with _checkpointers_lock:
+        saver = _checkpointers.get(key)
+        if saver is None:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            conn = sqlite3.connect(key, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            saver = _checkpointers[key] = SqliteSaver(conn)
+            saver.setup()
+        return saver
+
+
+def prune_checkpoints(saver: SqliteSaver, thread_id: str):
+    """Keeps only the latest checkpoint of `thread_id`, the history is in its state already."""
+    with saver.lock:
+        conn = saver.conn
+        for table in ("checkpoints", "writes"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id < "
+                "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '')",
+                (thread_id, thread_id)
+            )
+        conn.commit()
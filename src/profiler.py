@@ -0,0 +1,217 @@
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+# ------------------------------------ Column Profile -----------------------------------
+
+DISTINCT_SKETCH = 16_384     # KMV sketch size, distinct counts are exact below it
+QUANTILE_SAMPLE = 20_000     # bottom-k sample per numeric column, quantiles are exact below it
+TOP_CANDIDATES = 1_000       # value counts kept per column between chunks
+TOP_K = 10
+QUANTILES = {"p05": 0.05, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p95": 0.95}
+PROFILE_COLUMNS = [
+    "column_name", "position", "sqlite_type", "rows", "nulls", "null_rate", "distinct_count", "distinct_approx",
+    "min", "max", "mean", "std", *QUANTILES, "top_values", "top_approx",
+]
+# Declared types of the profile table, min/max hold numbers or text and stay untyped
+PROFILE_TYPES = {
+    "column_name": "TEXT", "position": "BIGINT", "sqlite_type": "TEXT", "rows": "BIGINT", "nulls": "BIGINT", "null_rate": "DOUBLE",
+    "distinct_count": "BIGINT", "distinct_approx": "BIGINT", "min": None, "max": None, "mean": "DOUBLE", "std": "DOUBLE",
+    **{name: "DOUBLE" for name in QUANTILES}, "top_values": "TEXT", "top_approx": "BIGINT",
+}
+HASH_SPACE = float(2**64)
+
+
+def profile_table_name(table_name: str) -> str:
+    return f"{table_name}__profile"
+
+
+def json_value(value):
+    """numpy scalars -> plain Python values for JSON/SQLite."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ColumnStats():
+    """Mergeable per-column state, updated with one vectorized pass per chunk."""
+
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+        self.rows = 0
+        self.nulls = 0
+        self.numeric = True
+        self.count = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.min = None
+        self.max = None
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.sample_keys = np.empty(0)
+        self.sample = np.empty(0)
+        self.top = pd.Series(dtype="int64")
+        self.top_pruned = False
+
+    def update(self, series: pd.Series):
+        values = series.dropna()
+        self.rows += len(series)
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+
+        # Distinct count: keep the DISTINCT_SKETCH smallest 64 bit hashes (k minimum values)
+        # read_csv may type the same numbers int in one chunk and float in the next
+        numeric = self.numeric and (pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values))
+        hashes = pd.util.hash_pandas_object(values.astype(float) if numeric else values, index=False).to_numpy()
+        if len(self.hashes) == DISTINCT_SKETCH:
+            hashes = hashes[hashes < self.hashes[-1]]
+        merged = np.concatenate([self.hashes, hashes])
+        merged.sort()
+        self.hashes = merged[np.concatenate(([True], merged[1:] != merged[:-1]))][:DISTINCT_SKETCH]
+
+        counts = values.value_counts()
+        self.top = counts if self.top.empty else self.top.add(counts, fill_value=0)
+        if len(self.top) > TOP_CANDIDATES:
+            self.top = self.top.nlargest(TOP_CANDIDATES)
+            self.top_pruned = True
+
+        if not numeric:
+            self.numeric = False
+            self.update_bounds(values)
+            return
+        data = values.to_numpy(dtype=float)
+        self.count += len(data)
+        self.sum += data.sum()
+        self.sum_squares += np.square(data).sum()
+        self.update_bounds(values)
+
+        # Uniform sample for quantiles: every value gets a random key, the smallest keys are kept
+        keys = np.concatenate([self.sample_keys, self.rng.random(len(data))])
+        sample = np.concatenate([self.sample, data])
+        if len(keys) > QUANTILE_SAMPLE:
+            keep = np.argpartition(keys, QUANTILE_SAMPLE)[:QUANTILE_SAMPLE]
+            keys, sample = keys[keep], sample[keep]
+        self.sample_keys, self.sample = keys, sample
+
+    def update_bounds(self, values: pd.Series):
+        if self.numeric:
+            low, high = values.min(), values.max()
+        else:
+            # Text (or a column that turned out not to be numeric) is compared as text
+            text = values.astype(str)
+            low, high = text.min(), text.max()
+            if self.min is not None:
+                self.min, self.max = str(self.min), str(self.max)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def distinct(self) -> tuple[int, bool]:
+        if len(self.hashes) < DISTINCT_SKETCH:
+            return len(self.hashes), False
+        return int((DISTINCT_SKETCH - 1) / (float(self.hashes[-1]) / HASH_SPACE)), True
+
+    def to_row(self, name: str, position: int, sqlite_type: str | None) -> tuple:
+        distinct, approx = self.distinct()
+        numeric = self.numeric and self.count > 0
+        mean = self.sum / self.count if numeric else None
+        std = float(np.sqrt(max(self.sum_squares / self.count - mean**2, 0.0))) if numeric else None
+        quantiles = np.quantile(self.sample, list(QUANTILES.values())).tolist() if numeric else [None] * len(QUANTILES)
+        top = [[json_value(value), int(count)] for value, count in self.top.nlargest(TOP_K).items()]
+        low, high = json_value(self.min), json_value(self.max)
+        if sqlite_type == "INTEGER" and numeric:
+            # read_csv made the column float because of missing values
+            low, high = int(low), int(high)
+            top = [[int(value) if isinstance(value, float) else value, count] for value, count in top]
+        return (
+            name, position, sqlite_type, self.rows, self.nulls, self.nulls / self.rows if self.rows else 0.0,
+            distinct, int(approx), low, high, mean, std, *quantiles,
+            json.dumps(top, default=str), int(self.top_pruned),
+        )
+
+
+class TableProfiler():
+    """
+    Profiles a table while it is ingested: dtype, null rate, distinct count (KMV sketch),
+    min/max/mean/std, quantiles (bottom-k sample) and top values, one vectorized pass per chunk.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.columns = {}
+
+    def update(self, chunk: pd.DataFrame):
+        for column in chunk.columns:
+            stats = self.columns.get(str(column))
+            if stats is None:
+                stats = self.columns[str(column)] = ColumnStats(self.rng)
+            stats.update(chunk[column])
+
+    def write(self, conn: sqlite3.Connection, table_name: str, types: dict, untyped: str = ""):
+        """
+        Stores the profile in the `<table>__profile` sidecar table, inside the caller's transaction.
+        `untyped` declares min/max, DuckDB needs a type ("VARCHAR") where SQLite keeps any value.
+        """
+        profile_table = quote(profile_table_name(table_name))
+        conn.execute(f"DROP TABLE IF EXISTS {profile_table}")
+        column_defs = ", ".join(f"{quote(column)} {PROFILE_TYPES[column] or untyped}".strip() for column in PROFILE_COLUMNS)
+        conn.execute(f"CREATE TABLE {profile_table} ({column_defs})")
+        placeholders = ", ".join("?" for _ in PROFILE_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO {profile_table} VALUES ({placeholders})",
+            [stats.to_row(name, position, types.get(name)) for position, (name, stats) in enumerate(self.columns.items())]
+        )
+
+
+def quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def numeric_bound(value, sqlite_type: str | None):
+    """min/max of a numeric column read back as text from a VARCHAR profile column (DuckDB)."""
+    if not isinstance(value, str) or sqlite_type not in ("INTEGER", "REAL"):
+        return value
+    try:
+        return int(value) if sqlite_type == "INTEGER" else float(value)
+    except ValueError:
+        return value
+
+
+def load_profile(db_name: str = "data/data.db", table_name: str = "data") -> dict:
+    """Column name -> profile dict, empty when the table was not ingested with a profile."""
+    from src.sql_executor import get_executor, DATABASE_ERRORS
+    try:
+        rows = get_executor(db_name).run(f"SELECT * FROM {quote(profile_table_name(table_name))} ORDER BY position")
+    except DATABASE_ERRORS:
+        return {}
+    profile = {}
+    for row in rows:
+        entry = dict(zip(PROFILE_COLUMNS, row))
+        entry["top_values"] = json.loads(entry["top_values"] or "[]")
+        entry["distinct_approx"] = bool(entry["distinct_approx"])
+        entry["top_approx"] = bool(entry["top_approx"])
+        entry["min"], entry["max"] = (numeric_bound(entry[bound], entry["sqlite_type"]) for bound in ("min", "max"))
+        profile[entry.pop("column_name")] = entry
+    return profile
+
+
+def format_number(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def profile_digest(profile: dict, top_k: int = 3) -> str:
+    """One line per column for prompts: type, nulls, distinct, range/mean or top values."""
+    lines = []
+    for name, entry in profile.items():
+        distinct = ("~" if entry["distinct_approx"] else "") + str(entry["distinct_count"])
+        parts = [f"{name} ({entry['sqlite_type'] or 'TEXT'})", f"nulls {entry['null_rate']:.1%}", f"distinct {distinct}"]
+        if entry["mean"] is not None:
+            parts.append(f"range {format_number(entry['min'])}..{format_number(entry['max'])}, mean {format_number(entry['mean'])}, median {format_number(entry['p50'])}")
+        # Top values only tell something when values repeat
+        if entry["top_values"] and entry["top_values"][0][1] > 1 and (entry["mean"] is None or entry["distinct_count"] <= top_k * 3):
+            parts.append("top " + ", ".join(f"{value!r}×{count}" for value, count in entry["top_values"][:top_k]))
+        lines.append("- " + "; ".join(parts))
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+
+# ------------------------------------ Result Cache -------------------------------------
+
+# String literals and quoted identifiers are kept verbatim, everything else is case/space folded
+QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])""")
+NON_DETERMINISTIC = re.compile(r"\b(random|randomblob|changes|last_insert_rowid|current_(date|time|timestamp))\b|'now'", re.IGNORECASE)
+
+
+def canonicalize_sql(query: str) -> str:
+    parts = QUOTED.split(query.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts))
+
+
+def db_fingerprint(db_name: str) -> tuple:
+    """Changes whenever the database or its WAL file is written to."""
+    fingerprint = []
+    for path in (db_name, db_name + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        # Readers create an empty WAL file on open, that is not a data change
+        fingerprint.extend((stat.st_mtime_ns, stat.st_size) if stat and stat.st_size else (0, 0))
+    return tuple(fingerprint)
+
+
+def estimate_size(result: list) -> int:
+    """Rough byte size of a list of row tuples, extrapolated from the first rows."""
+    if not result:
+        return sys.getsizeof(result)
+    sample = result[:20]
+    row_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample) / len(sample)
+    return int(sys.getsizeof(result) + row_bytes * len(result))
+
+
+class ResultCache():
+    """
+    Byte-budgeted LRU of query results shared by every SQLExecutor.
+
+    Entries are keyed by (database path, file fingerprint, canonical SQL) so a rewritten
+    database never serves old rows, `invalidate` drops a database's entries eagerly.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entry_fraction: float = 0.25):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * max_entry_fraction)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "skipped": 0}
+
+    @staticmethod
+    def make_key(db_name: str, query: str) -> tuple | None:
+        if NON_DETERMINISTIC.search(query):
+            return None
+        db_name = os.path.abspath(db_name)
+        return (db_name, db_fingerprint(db_name), canonicalize_sql(query))
+
+    def get(self, key: tuple) -> list | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(entry[0])
+
+    def put(self, key: tuple, result: list):
+        size = estimate_size(result)
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self.stats["skipped"] += 1
+                return
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (list(result), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self.entries:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def invalidate(self, db_name: str):
+        db_name = os.path.abspath(db_name)
+        with self._lock:
+            for key in [key for key in self.entries if key[0] == db_name]:
+                self.bytes -= self.entries.pop(key)[1]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+result_cache = ResultCache()
@@ -0,0 +1,300 @@
+import os
+import io
+import sys
+import base64
+import queue
+import pickle
+import signal
+import atexit
+import itertools
+import threading
+import traceback
+import multiprocessing as mp
+
+try:
+    import resource
+except ImportError:   # Windows, limits are then only enforced through the wall-clock timeout
+    resource = None
+
+
+# --------------------------------- Sandboxed Code Runner -------------------------------
+
+class SandboxLimits():
+    """Per task CPU seconds / wall-clock seconds, address space cap and the RSS after which a worker is recycled."""
+
+    def __init__(self, cpu_seconds: int = 20, wall_seconds: float = 30.0, max_memory: int = 2 * 1024**3, max_rss: int = 1024**3, max_tasks: int = 50):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.max_memory = max_memory
+        self.max_rss = max_rss
+        self.max_tasks = max_tasks
+
+
+class SandboxError(Exception):
+    pass
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+MAX_FRAME_ROWS = 500_000   # rows handed to the plotting code, a chart does not need more
+FRAME_BATCH = 50_000
+
+
+def encode_frame(columns: list, rows, max_rows: int = MAX_FRAME_ROWS) -> bytes:
+    """
+    Query rows (at most `max_rows`) as a pickled DataFrame, column blocks travel as buffers instead of
+    one object per cell. The frame is built from `rows` in batches, only one batch of tuples is held at
+    a time. Repetitive text columns are sent as categoricals (codes + distinct values), see `decode_frame`.
+    """
+    import pandas as pd
+    rows = iter(rows) if max_rows is None else itertools.islice(rows, max_rows)
+    chunks = []
+    while batch := list(itertools.islice(rows, FRAME_BATCH)):
+        chunks.append(pd.DataFrame.from_records(batch, columns=columns or None))
+    if not chunks:
+        frame = pd.DataFrame(columns=columns or None)
+    elif len(chunks) == 1:
+        frame = chunks[0]
+    else:
+        frame = pd.concat(chunks, ignore_index=True)
+    del chunks
+    for column in frame.columns[frame.dtypes == object].union(frame.select_dtypes("string").columns):
+        if frame[column].nunique() <= len(frame) // 2:
+            frame[column] = frame[column].astype("category")
+    return pickle.dumps(frame, protocol=5)
+
+
+def decode_frame(frame_bytes: bytes):
+    """Restores the plain column types the plotting code expects."""
+    frame = pickle.loads(frame_bytes)
+    for column in frame.select_dtypes("category").columns:
+        frame[column] = frame[column].astype(frame[column].cat.categories.dtype)
+    return frame
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def figure_png(plt, namespace: dict) -> bytes | None:
+    """PNG bytes of the chart: the current figure, or what older code left in `base64_image`."""
+    image = namespace.get("base64_image")
+    if isinstance(image, str) and image:
+        return base64.b64decode(image.split(",", 1)[-1])
+    if not plt.get_fignums():
+        return None
+    figure = plt.gcf()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", bbox_inches="tight", facecolor=figure.get_facecolor())
+    return buffer.getvalue()
+
+
+def _raise_cpu_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU time limit of the plotting code exceeded")
+
+
+def worker_main(conn, limits: SandboxLimits):
+    """Worker loop: heavy imports happen once, then every task runs in a fresh namespace."""
+    os.environ["MPLBACKEND"] = "Agg"
+    import numpy as np
+    import pandas as pd
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    if resource is not None:
+        try:
+            if limits.max_memory:
+                resource.setrlimit(resource.RLIMIT_AS, (limits.max_memory, limits.max_memory))
+            signal.signal(signal.SIGXCPU, _raise_cpu_exceeded)
+        except (ValueError, OSError):
+            pass   # e.g. macOS does not support RLIMIT_AS
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            task = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+
+        if resource is not None and limits.cpu_seconds:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            try:
+                resource.setrlimit(resource.RLIMIT_CPU, (used + limits.cpu_seconds, hard))
+            except (ValueError, OSError):
+                pass
+
+        namespace = {"plt": plt, "pd": pd, "np": np, "io": io, "base64": base64}
+        namespace.update(task.get("globals") or {})
+        try:
+            frame = decode_frame(task["frame"]) if task.get("frame") is not None else pd.DataFrame()
+            namespace["result_df"] = frame
+            # Building the tuples is the expensive part, skip it for code that only uses result_df
+            namespace["result_data"] = list(frame.itertuples(index=False, name=None)) if "result_data" in task["code"] else []
+            exec(task["code"], namespace, namespace)
+            reply = {"ok": True, "png": figure_png(plt, namespace)}
+        except BaseException as e:
+            reply = {
+                "ok": False, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc(),
+                "result_data": repr(namespace.get("result_data", "Not Set"))[:2000],
+            }
+        finally:
+            try:
+                plt.close("all")
+            except Exception:
+                pass # Ignore errors during cleanup
+
+        reply["rss"] = current_rss()
+        try:
+            conn.send_bytes(pickle.dumps(reply, protocol=5))
+        except Exception:
+            break
+
+
+class SandboxWorker():
+
+    def __init__(self, context, limits: SandboxLimits):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, limits), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.ready = False
+
+    def wait_ready(self, timeout: float):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise SandboxError("Sandbox worker did not start in time")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(1)
+        except Exception:
+            pass
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send_bytes(pickle.dumps(None))
+            self.process.join(1)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SandboxPool():
+    """
+    Pool of pre-warmed worker processes running LLM-written plotting code.
+
+    Workers import matplotlib (Agg), pandas and numpy once at start. Every task gets a CPU-time
+    limit and a wall-clock timeout, a worker that times out is killed and replaced, one that
+    served `max_tasks` tasks or grew past `max_rss` is recycled.
+    """
+
+    def __init__(self, size: int = 2, limits: SandboxLimits = None, start_method: str = "spawn"):
+        self.size = size
+        self.limits = limits or SandboxLimits()
+        # spawn: never fork a process holding Streamlit/HTTP threads
+        self.context = mp.get_context(start_method)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.closed = False
+        self.stats = {"tasks": 0, "errors": 0, "timeouts": 0, "recycled": 0}
+        for _ in range(size):
+            self._idle.put(SandboxWorker(self.context, self.limits))
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def run(self, code: str, frame: bytes = None, execution_globals: dict = None) -> dict:
+        """
+        Runs `code` with `result_df` (the decoded frame) and `result_data` (its rows as tuples) defined.
+        Returns the worker reply: ok, png (bytes, None when no figure was drawn) or error_type/error/traceback.
+        """
+        if self.closed:
+            raise SandboxError("Sandbox pool is closed")
+        worker = self._idle.get()
+        reply = {}
+        try:
+            worker.wait_ready(self.limits.wall_seconds * 2)
+            worker.conn.send_bytes(pickle.dumps({"code": code, "frame": frame, "globals": execution_globals}, protocol=5))
+            if worker.conn.poll(self.limits.wall_seconds):
+                reply = pickle.loads(worker.conn.recv_bytes())
+            else:
+                self._count("timeouts")
+                worker.kill()
+                worker = None
+                reply = {"ok": False, "error_type": "TimeoutError", "error": f"Plotting code did not finish within {self.limits.wall_seconds}s", "traceback": ""}
+        except (EOFError, OSError, SandboxError) as e:
+            # The worker died (memory limit, crash), it is replaced below
+            if worker is not None:
+                worker.kill()
+                worker = None
+            reply = {"ok": False, "error_type": type(e).__name__, "error": f"Sandbox worker failed: {e}", "traceback": ""}
+        finally:
+            self._count("tasks")
+            self._release(worker, reply.get("rss", 0))
+
+        if not reply["ok"]:
+            self._count("errors")
+        return reply
+
+    def _release(self, worker: SandboxWorker | None, rss: int = 0):
+        if worker is not None:
+            worker.tasks += 1
+            if worker.tasks >= self.limits.max_tasks or rss > self.limits.max_rss or not worker.process.is_alive():
+                worker.stop()
+                worker = None
+                self._count("recycled")
+        if self.closed:
+            if worker is not None:
+                worker.stop()
+            return
+        self._idle.put(worker or SandboxWorker(self.context, self.limits))
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, idle=self._idle.qsize())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Process-wide pool, created (and warmed up) on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = SandboxPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,195 @@
+import re
+import math
+import json
+import threading
+from collections import Counter
+from src.sql_executor import DATABASE_ERRORS, get_executor
+from src.profiler import load_profile
+
+
+# ------------------------------------- Schema Index ------------------------------------
+
+MAX_FULL_COLUMNS = 40     # tables up to this wide keep sending every column
+TOP_K_COLUMNS = 15        # columns sent per request for wider tables
+MAX_OVERVIEW_COLUMNS = 40 # column names in the shared dataset text of wide tables
+SAMPLE_ROWS = 5
+NAME_WEIGHT = 3           # a column name counts as many times in its document
+WORD = re.compile(r"[A-Z]?[a-z]+\d*|[A-Z]+\d*(?![a-z])|\d+")
+# SQLite and DuckDB wording of an unknown column
+SCHEMA_ERROR = re.compile(r"no such column|Referenced column .+ not found", re.IGNORECASE)
+
+
+def tokenize(text: str) -> list:
+    """Lowercase words, snake_case / camelCase / spaced names split, plural 's' dropped."""
+    tokens = []
+    for word in WORD.findall(str(text)):
+        word = word.lower()
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def is_schema_error(message: str) -> bool:
+    return bool(SCHEMA_ERROR.search(str(message or "")))
+
+
+class SchemaIndex():
+    """
+    BM25 index with one document per column: its name, the metadata agent description when
+    there is one, the profile type and top values and the sample values. `select(query)` returns
+    the columns relevant to a request so wide tables do not put every column in every prompt.
+    """
+
+    def __init__(self, columns: list, sample_rows: list = (), profile: dict = None, descriptions: dict = None,
+                 max_full_columns: int = MAX_FULL_COLUMNS, k1: float = 1.5, b: float = 0.75):
+        self.columns = list(columns)
+        self.sample_rows = [tuple(row) for row in sample_rows]
+        self.profile = profile or {}
+        self.descriptions = dict(descriptions or {})
+        self.max_full_columns = max_full_columns
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.build()
+
+    def document(self, position: int, name: str) -> list:
+        tokens = tokenize(name) * NAME_WEIGHT + tokenize(self.descriptions.get(name, ""))
+        entry = self.profile.get(name)
+        if entry:
+            tokens += tokenize(entry.get("sqlite_type") or "")
+            tokens += [token for value, _ in entry.get("top_values", [])[:5] if isinstance(value, str) for token in tokenize(value)]
+        # Only text values, numbers in a question rarely name a column
+        tokens += [token for row in self.sample_rows if position < len(row) and isinstance(row[position], str) for token in tokenize(row[position])]
+        return tokens
+
+    def build(self):
+        documents = [Counter(self.document(position, name)) for position, name in enumerate(self.columns)]
+        lengths = [sum(document.values()) for document in documents]
+        frequency = Counter(token for document in documents for token in document)
+        count = len(documents)
+        with self._lock:
+            self.documents = documents
+            self.lengths = lengths
+            self.average_length = (sum(lengths) / count) if count else 0.0
+            self.idf = {token: math.log(1 + (count - n + 0.5) / (n + 0.5)) for token, n in frequency.items()}
+
+    def add_descriptions(self, descriptions: dict):
+        """Column descriptions of the metadata agent, unknown column names are ignored."""
+        known = {name: text for name, text in descriptions.items() if name in self.columns}
+        if known:
+            self.descriptions.update(known)
+            self.build()
+
+    @property
+    def wide(self) -> bool:
+        return len(self.columns) > self.max_full_columns
+
+    def scores(self, query: str) -> list:
+        terms = set(tokenize(query))
+        with self._lock:
+            documents, lengths, average, idf = self.documents, self.lengths, self.average_length or 1.0, self.idf
+        scores = []
+        for document, length in zip(documents, lengths):
+            score = 0.0
+            for term in terms & document.keys():
+                tf = document[term]
+                score += idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average))
+            scores.append(score)
+        return scores
+
+    def select(self, query: str, k: int = TOP_K_COLUMNS) -> list:
+        """The `k` best matching columns in table order, every column when the table is not wide or k covers it."""
+        if not self.wide or k >= len(self.columns):
+            return list(self.columns)
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.columns)), key=lambda position: -scores[position])
+        # Columns that match nothing only fill up when fewer than k matched, in table order
+        keep = set(ranked[:k])
+        return [name for position, name in enumerate(self.columns) if position in keep]
+
+    def describe(self, columns: list) -> str:
+        """Same text as get_dataset_metadata, restricted to `columns`."""
+        positions = [self.columns.index(name) for name in columns]
+        sample_data = [tuple(row[position] for position in positions) for row in self.sample_rows]
+        text = f"column_names: {list(columns)}, sample_data: {sample_data}"
+        descriptions = {name: self.descriptions[name] for name in columns if name in self.descriptions}
+        if descriptions:
+            text += f", descriptions: {json.dumps(descriptions)}"
+        if len(columns) < len(self.columns):
+            text += f" ({len(columns)} of {len(self.columns)} columns, picked for this request)"
+        return text
+
+    def schema_prompt(self, query: str, k: int = TOP_K_COLUMNS) -> str:
+        return self.describe(self.select(query, k))
+
+    def column_weight(self, name: str) -> float:
+        """How useful a column is to name up front: described, few nulls, not constant, not an identifier."""
+        entry = self.profile.get(name) or {}
+        weight = 1.0 - (entry.get("null_rate") or 0.0)
+        rows, distinct = entry.get("rows") or 0, entry.get("distinct_count")
+        if rows and distinct is not None and distinct <= 1:
+            weight = 0.0
+        elif rows and distinct is not None and distinct >= 0.95 * rows and entry.get("sqlite_type") == "TEXT":
+            weight *= 0.5
+        return weight + (1.0 if name in self.descriptions else 0.0)
+
+    def overview(self, max_columns: int = MAX_OVERVIEW_COLUMNS) -> str:
+        """
+        Dataset text for wide tables: the `max_columns` most useful column names (table order) and the
+        column count, no sample rows. Requests get their own relevant columns with samples.
+        """
+        if len(self.columns) <= max_columns:
+            return f"column_names: {self.columns} ({len(self.columns)} columns, the sample rows of the relevant columns come with each request)"
+        ranked = sorted(range(len(self.columns)), key=lambda position: -self.column_weight(self.columns[position]))
+        keep = set(ranked[:max_columns])
+        shown = [name for position, name in enumerate(self.columns) if position in keep]
+        return (f"column_names: {shown} ({max_columns} of {len(self.columns)} columns listed, every column can be queried, "
+                f"the relevant ones with sample rows come with each request)")
+
+
+def build_schema_index(db_name: str = "data/data.db", table_name: str = "data", sample_rows: int = SAMPLE_ROWS, **config) -> SchemaIndex:
+    executor = get_executor(db_name)
+    columns = [row[1] for row in executor.run(f"PRAGMA table_info({table_name});")]
+    rows = executor.run(f"SELECT * FROM {table_name} LIMIT {int(sample_rows)};")
+    return SchemaIndex(columns, rows, load_profile(db_name, table_name), **config)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_schema_index(db_name: str = "data/data.db", table_name: str = "data") -> SchemaIndex | None:
+    """Process-wide index per table, rebuilt when the columns changed (descriptions are kept), None when the table cannot be read."""
+    try:
+        columns = [row[1] for row in get_executor(db_name).run(f"PRAGMA table_info({table_name});")]
+    except DATABASE_ERRORS:
+        return None
+    if not columns:
+        return None
+    with _indexes_lock:
+        index = _indexes.get((db_name, table_name))
+        if index is None or index.columns != columns:
+            descriptions = index.descriptions if index is not None else {}
+            index = _indexes[(db_name, table_name)] = build_schema_index(db_name, table_name, descriptions=descriptions)
+        return index
+
+
+def dataset_metadata(db_name: str = "data/data.db", table_name: str = "data") -> str:
+    """The dataset text shared by the agents: columns with sample rows, only the column names for wide tables."""
+    # build_schema_index raises the actual error when the table cannot be read
+    index = get_schema_index(db_name, table_name) or build_schema_index(db_name, table_name)
+    return index.overview() if index.wide else index.describe(index.columns)
+
+
+def parse_descriptions(content: str) -> dict:
+    """Column -> description from the metadata agent answer `{"metadata": [{column: description}, ...]}`."""
+    try:
+        items = json.loads(content).get("metadata", [])
+    except (ValueError, AttributeError):
+        return {}
+    descriptions = {}
+    for item in items if isinstance(items, list) else [items]:
+        if isinstance(item, dict):
+            descriptions.update({str(name): str(text) for name, text in item.items()})
+    return descriptions
@@ -0,0 +1,104 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from src.insight_cache import hash_text
+
+
+# --------------------------------- Prompt -> SQL Cache ---------------------------------
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the SQL a question needs."""
+    return re.sub(r"\s+", " ", prompt).strip().rstrip("?.!").strip().lower()
+
+
+class SQLMemoCache():
+    """
+    Persistent memo of natural-language prompt -> SQL known to execute successfully.
+
+    Rows are keyed by the normalized prompt, the table schema fingerprint and the text_to_sql
+    prompt version, expire after `ttl` seconds and the least recently used rows are dropped
+    once the table holds more than `max_entries`.
+    """
+
+    def __init__(self, db_path: str = "temp/sql_cache.db", ttl: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                prompt TEXT,
+                sql_queries TEXT,
+                created REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            )
+        """)
+
+    @staticmethod
+    def make_key(prompt: str, schema_hash: str, prompt_hash: str, table_name: str = "", database_type: str = "") -> str:
+        return hash_text(normalize_prompt(prompt), schema_hash, prompt_hash, table_name, database_type)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT sql_queries, created FROM sql_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE sql_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, prompt: str, sql_queries: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sql_cache (key, prompt, sql_queries, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, prompt, sql_queries, now, now)
+            )
+            self.stats["stores"] += 1
+            self.evict(now)
+
+    def delete(self, key: str):
+        """Drops a memoized SQL that no longer executes (schema drift, budget...)."""
+        with self._lock:
+            self.conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+
+    def evict(self, now: float):
+        expired = self.conn.execute("DELETE FROM sql_cache WHERE created < ?", (now - self.ttl,)).rowcount
+        overflow = self.conn.execute("""
+            DELETE FROM sql_cache WHERE key IN (
+                SELECT key FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,)).rowcount
+        self.stats["evictions"] += expired + overflow
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_sql_cache = None
+_sql_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> SQLMemoCache:
+    """Process-wide cache shared by every Text2SQL_Agent."""
+    global _sql_cache
+    with _sql_cache_lock:
+        if _sql_cache is None:
+            _sql_cache = SQLMemoCache()
+        return _sql_cache
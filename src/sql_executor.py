@@ -0,0 +1,408 @@
+import os
+import queue
+import logging
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from src.result_cache import result_cache
+
+# DuckDB is optional, without it every dataset is stored in SQLite
+try:
+    import duckdb
+    DATABASE_ERRORS = (sqlite3.Error, duckdb.Error)
+    ENGINES = ["SQLite", "DuckDB"]
+except ImportError:
+    DATABASE_ERRORS = (sqlite3.Error,)
+    ENGINES = ["SQLite"]
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------ SQL Executor -------------------------------------
+
+# Files with this suffix are DuckDB databases (see duckdb_engine.py), everything else is SQLite
+DUCKDB_SUFFIX = ".duckdb"
+# Appended to database_type in the prompts, the LLM writes the dialect of the engine that runs the SQL
+DIALECT_HINTS = {
+    "SQLite": "dates are TEXT, use date()/strftime(); LIKE ignores case; integer / integer truncates",
+    "DuckDB": "PostgreSQL-like dialect: DATE/TIMESTAMP columns, use date_trunc()/extract()/strftime(date, fmt); "
+              "LIKE is case-sensitive, ILIKE is not; median(), quantile_cont() available; cast to VARCHAR before string functions; / is float division",
+}
+
+# Committed sample database, kept in its rollback journal mode so using it leaves the tracked file untouched
+BUNDLED_DATABASES = {os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "data.db"))}
+
+READ_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,   # map up to 256MB of the file instead of read() into the page cache
+    "cache_size": -64 * 1024,         # 64MB page cache per connection (negative = KiB)
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+}
+
+
+def engine_name(db_name: str) -> str:
+    """"DuckDB" for .duckdb files, "SQLite" otherwise."""
+    return "DuckDB" if str(db_name).endswith(DUCKDB_SUFFIX) else "SQLite"
+
+
+def dialect_prompt(database_type: str) -> str:
+    hint = DIALECT_HINTS.get(database_type)
+    return f"{database_type} ({hint})" if hint else database_type
+
+
+class QueryBudget():
+    """Wall-clock seconds and SQLite VM instructions a single query may use, None disables a limit (DuckDB only has the time limit)."""
+
+    def __init__(self, seconds: float | None = 10.0, max_steps: int | None = None):
+        self.seconds = seconds
+        self.max_steps = max_steps
+
+    def __repr__(self):
+        return f"QueryBudget(seconds={self.seconds}, max_steps={self.max_steps})"
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Chat answers should come back quickly, background insight generation can afford more
+INTERACTIVE_BUDGET = QueryBudget(seconds=10.0, max_steps=200_000_000)
+INSIGHT_BUDGET = QueryBudget(seconds=60.0, max_steps=2_000_000_000)
+# Exact re-runs of sampled insights are requested explicitly and run in the background
+EXACT_REFRESH_BUDGET = QueryBudget(seconds=900.0, max_steps=None)
+PROGRESS_INTERVAL = 10_000   # VM instructions between two budget checks
+
+MAX_PREVIEW_ROWS = 200
+MAX_PREVIEW_BYTES = 32 * 1024
+FETCH_BATCH = 1000
+
+
+class QueryResult():
+    """
+    Bounded view of a query result: a preview capped by rows and bytes, the total row count,
+    column names and per-column summary stats. Rows past the preview are only kept in a
+    spill file when requested (charting), `iter_rows` streams the full result back lazily.
+    """
+
+    def __init__(self, columns: list):
+        self.columns = columns
+        self.preview = []
+        self.total_rows = 0
+        self.truncated = False
+        self.spill_path = None
+        self.approximate = None      # sample, margins and notes when estimated from a sample, see approximate.py
+        self._stats = [{"nulls": 0, "count": 0, "min": None, "max": None, "sum": 0.0} for _ in columns]
+
+    def collect(self, rows, max_rows: int, max_bytes: int, spill: bool = False):
+        preview_bytes = 0
+        spill_file = None
+        batch = []
+        try:
+            for row in rows:
+                self.total_rows += 1
+                self.update_stats(row)
+                if not self.truncated:
+                    preview_bytes += len(repr(row))
+                    if len(self.preview) < max_rows and preview_bytes <= max_bytes:
+                        self.preview.append(row)
+                        continue
+                    self.truncated = True
+                    if spill:
+                        spill_file = tempfile.NamedTemporaryFile(prefix="query_", suffix=".spill", delete=False)
+                        self.spill_path = spill_file.name
+                if spill_file is not None:
+                    batch.append(row)
+                    if len(batch) >= FETCH_BATCH:
+                        pickle.dump(batch, spill_file)
+                        batch = []
+            if spill_file is not None and batch:
+                pickle.dump(batch, spill_file)
+        finally:
+            if spill_file is not None:
+                spill_file.close()
+        return self
+
+    def update_stats(self, row: tuple):
+        for value, stats in zip(row, self._stats):
+            if value is None:
+                stats["nulls"] += 1
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats["count"] += 1
+                stats["sum"] += value
+                stats["min"] = value if stats["min"] is None else min(stats["min"], value)
+                stats["max"] = value if stats["max"] is None else max(stats["max"], value)
+
+    def summary(self) -> dict:
+        summary = {}
+        for column, stats in zip(self.columns, self._stats):
+            column_summary = {"nulls": stats["nulls"]}
+            if stats["count"]:
+                column_summary.update(min=stats["min"], max=stats["max"], mean=round(stats["sum"] / stats["count"], 4))
+            summary[column] = column_summary
+        return summary
+
+    def iter_rows(self):
+        yield from self.preview
+        if self.spill_path is None:
+            return
+        with open(self.spill_path, "rb") as file:
+            while True:
+                try:
+                    yield from pickle.load(file)
+                except EOFError:
+                    break
+
+    def to_dict(self) -> dict:
+        """Compact form handed to the LLM, stats are only added when the preview is incomplete."""
+        data = {"columns": self.columns, "db_result": self.preview, "total_rows": self.total_rows}
+        if self.truncated:
+            data["truncated"] = True
+            data["summary"] = self.summary()
+        if self.approximate:
+            data["approximate"] = self.approximate
+        return data
+
+    def close(self):
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
+
+    def __del__(self):
+        self.close()
+
+
+class SQLExecutor():
+    """
+    Pool of read-only SQLite connections for a single database file.
+
+    Connections are opened once with read-tuned PRAGMAs and reused across calls/threads,
+    so a query no longer pays for connect + page cache warm up. Prepared statements are
+    cached per connection by sqlite3 (`cached_statements`).
+    """
+
+    def __init__(self, db_name: str, pool_size: int = 4, statement_cache_size: int = 256):
+        self.db_name = db_name
+        self.pool_size = pool_size
+        self.statement_cache_size = statement_cache_size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "queries": 0, "closed": 0, "cancelled": 0}
+        self.query_observer = None   # called with (query, seconds) after a query really ran, see index_advisor
+        self.enable_wal()
+
+    def enable_wal(self):
+        """WAL lets readers run while a writer (re)ingests, it is persistent so one writer connection is enough."""
+        if not os.path.exists(self.db_name) or os.path.abspath(self.db_name) in BUNDLED_DATABASES:
+            return
+        try:
+            conn = sqlite3.connect(self.db_name)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"file:{os.path.abspath(self.db_name)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.statement_cache_size)
+        for pragma, value in READ_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value};")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+            self._count("hits")
+            return conn
+        except queue.Empty:
+            self._count("misses")
+            return self._connect()
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+            self._count("closed")
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    @contextmanager
+    def connection(self, budget: QueryBudget = None):
+        conn = self._acquire()
+        tracker = self.install_budget(conn, budget)
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            if tracker is not None and tracker["exceeded"]:
+                self._count("cancelled")
+                raise self.budget_exceeded(tracker["exceeded"], budget) from e
+            raise
+        finally:
+            if tracker is not None:
+                conn.set_progress_handler(None, 0)
+            # Connections are read-only, a failed query leaves no transaction behind
+            self._release(conn)
+
+    @staticmethod
+    def budget_exceeded(limit: str, budget: QueryBudget) -> QueryBudgetExceeded:
+        return QueryBudgetExceeded(
+            f"Query cancelled, too expensive: it exceeded the {limit} budget "
+            f"({budget}). Add a WHERE filter, aggregate with GROUP BY or add a LIMIT."
+        )
+
+    @staticmethod
+    def install_budget(conn: sqlite3.Connection, budget: QueryBudget) -> dict | None:
+        """Aborts the running statement through the progress handler once the budget is used up."""
+        if budget is None or (budget.seconds is None and budget.max_steps is None):
+            return None
+        tracker = {"steps": 0, "deadline": time.monotonic() + budget.seconds if budget.seconds else None, "exceeded": None}
+
+        def check_budget():
+            tracker["steps"] += PROGRESS_INTERVAL
+            if budget.max_steps is not None and tracker["steps"] > budget.max_steps:
+                tracker["exceeded"] = "VM step"
+            elif tracker["deadline"] is not None and time.monotonic() > tracker["deadline"]:
+                tracker["exceeded"] = "time"
+            return 1 if tracker["exceeded"] else 0
+
+        conn.set_progress_handler(check_budget, PROGRESS_INTERVAL)
+        return tracker
+
+    def run(self, query: str, params: tuple = (), use_cache: bool = True, budget: QueryBudget | None = INTERACTIVE_BUDGET) -> list:
+        """Full result as a list of rows, bounded like a chat query unless `budget=None` is passed explicitly."""
+        self._count("queries")
+        cache_key = result_cache.make_key(self.db_name, query) if use_cache and not params else None
+        if cache_key is not None:
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        with self.connection(budget) as conn:
+            cursor = conn.execute(query, params)
+            try:
+                result = self.fetch_all(cursor)
+            finally:
+                cursor.close()
+        self.notify(query, time.perf_counter() - start)
+
+        if cache_key is not None:
+            result_cache.put(cache_key, result)
+        return result
+
+    def run_bounded(self, query: str, max_rows: int = MAX_PREVIEW_ROWS, max_bytes: int = MAX_PREVIEW_BYTES, spill: bool = False, budget: QueryBudget = INTERACTIVE_BUDGET) -> QueryResult:
+        """Streams the result with fetchmany, only the capped preview (and optional spill file) is kept."""
+        self._count("queries")
+        cache_key = result_cache.make_key(self.db_name, query)
+        cached = result_cache.get(cache_key) if cache_key is not None else None
+
+        with self.connection(budget) as conn:
+            if cached is not None:
+                columns = self.column_names(conn, query)
+                return QueryResult(columns).collect(cached, max_rows, max_bytes, spill)
+
+            start = time.perf_counter()
+            cursor = conn.execute(query)
+            try:
+                columns = [column[0] for column in cursor.description or []]
+                result = QueryResult(columns).collect(self.fetch_batches(cursor), max_rows, max_bytes, spill)
+            finally:
+                cursor.close()
+        self.notify(query, time.perf_counter() - start)
+
+        # Small complete results are shared with run() through the result cache
+        if cache_key is not None and not result.truncated:
+            result_cache.put(cache_key, result.preview)
+        return result
+
+    def notify(self, query: str, seconds: float):
+        observer = self.query_observer
+        if observer is None:
+            return
+        try:
+            observer(query, seconds)
+        except Exception as e:
+            # Observing must never fail the query itself
+            logger.warning("Query observer failed: %s", e)
+
+    @staticmethod
+    def fetch_all(cursor: sqlite3.Cursor) -> list:
+        return cursor.fetchall()
+
+    @staticmethod
+    def fetch_batches(cursor: sqlite3.Cursor):
+        while rows := cursor.fetchmany(FETCH_BATCH):
+            yield from rows
+
+    @staticmethod
+    def column_names(conn: sqlite3.Connection, query: str) -> list:
+        """Column names without running the query, a prepared statement already knows them."""
+        try:
+            cursor = conn.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) LIMIT 0")
+        except DATABASE_ERRORS:
+            return []
+        columns = [column[0] for column in cursor.description]
+        cursor.close()
+        return columns
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["idle"] = self._idle.qsize()
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def create_executor(db_name: str) -> SQLExecutor:
+    if engine_name(db_name) == "DuckDB":
+        from src.duckdb_engine import DuckDBExecutor
+        return DuckDBExecutor(db_name)
+    return SQLExecutor(db_name)
+
+
+def get_executor(db_name: str = "data/data.db") -> SQLExecutor:
+    """Returns the process-wide executor for `db_name` (SQLite or DuckDB by suffix), creating it on first use."""
+    key = os.path.abspath(db_name)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = _executors[key] = create_executor(db_name)
+        return executor
+
+
+def reset_executor(db_name: str = "data/data.db"):
+    """Drops the pooled connections and cached results of `db_name`, e.g. after the file was rewritten."""
+    with _executors_lock:
+        executor = _executors.pop(os.path.abspath(db_name), None)
+    if executor is not None:
+        executor.close()
+    result_cache.invalidate(db_name)
+
+
+def executor_stats() -> dict:
+    with _executors_lock:
+        executors = list(_executors.items())
+    stats = {db_name: executor.get_stats() for db_name, executor in executors}
+    stats["result_cache"] = result_cache.get_stats()
+    return stats
+
+
+def run_sql_query(query: str, db_name: str = "data/data.db") -> list:
+    return get_executor(db_name).run(query)
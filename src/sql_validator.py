@@ -0,0 +1,166 @@
+import re
+import json
+import sqlite3
+import threading
+from difflib import get_close_matches
+from src.result_cache import QUOTED
+from src.sql_executor import DATABASE_ERRORS, get_executor
+
+
+# ------------------------------------ SQL Validator ------------------------------------
+
+FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+SAFE_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+MAX_REPAIRS = 5
+# SQLite and DuckDB wording of the errors repaired locally
+UNKNOWN_COLUMN = re.compile(r'no such column: (.+)$|Referenced column "([^"]+)" not found')
+UNKNOWN_TABLE = re.compile(r'no such table: (.+)$|Table with name (\S+) does not exist')
+
+_stats = {"queries": 0, "valid": 0, "repaired": 0, "rejected": 0, "parse_repaired": 0}
+_repairs_by_kind = {}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str, kinds: list = ()):
+    with _stats_lock:
+        _stats[key] += 1
+        for kind in kinds:
+            _repairs_by_kind[kind] = _repairs_by_kind.get(kind, 0) + 1
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats, repairs_by_kind=dict(_repairs_by_kind))
+
+
+def strip_fences(text: str) -> str:
+    return FENCE.sub("", text.strip())
+
+
+def parse_sql_queries(content: str) -> dict:
+    """
+    Parses the Text2SQL JSON ({"sql": [...]}) tolerating markdown fences, text around the
+    JSON object, a single string instead of a list, or a bare SQL statement.
+    """
+    text = strip_fences(str(content))
+    if text != str(content).strip():
+        _count("parse_repaired")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        data = None
+        if start != -1 and end > start:
+            try:
+                data = json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        if data is None:
+            if not re.match(r"^\s*(SELECT|WITH)\b", text, re.IGNORECASE):
+                raise
+            data = {"sql": [text]}
+        _count("parse_repaired")
+
+    if not isinstance(data, dict):
+        data = {"sql": data if isinstance(data, list) else [str(data)]}
+    if isinstance(data.get("sql"), str):
+        data["sql"] = [data["sql"]]
+    return data
+
+
+def table_columns(db_name: str, table_name: str) -> list:
+    return [row[1] for row in get_executor(db_name).run(f"PRAGMA table_info({quote_identifier(table_name)});")]
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def replace_unquoted(query: str, pattern: re.Pattern, replacement: str) -> str:
+    """Applies `pattern` only outside string literals and quoted identifiers."""
+    parts = QUOTED.split(query)
+    return "".join(part if i % 2 else pattern.sub(lambda _: replacement, part) for i, part in enumerate(parts))
+
+
+def quote_spaced_columns(query: str, columns: list) -> tuple[str, bool]:
+    """Quotes column names that need quoting (spaces, dashes...) when the query uses them bare."""
+    fixed = query
+    for column in sorted(columns, key=len, reverse=True):
+        if SAFE_IDENTIFIER.match(column):
+            continue
+        pattern = re.compile(r"(?<![\w\"'`\[])" + re.escape(column) + r"(?![\w\"'`\]])", re.IGNORECASE)
+        fixed = replace_unquoted(fixed, pattern, quote_identifier(column))
+    return fixed, fixed != query
+
+
+def repair(query: str, error: str, columns: list, table_name: str) -> tuple[str | None, str | None]:
+    """Returns (fixed query, repair kind) for mechanical errors, (None, None) when the LLM is needed."""
+    match = UNKNOWN_COLUMN.search(error)
+    if match:
+        name = (match.group(1) or match.group(2)).strip()
+        bare = name.split(".")[-1]
+        normalized = {re.sub(r"[\s_]+", "", column).lower(): column for column in columns}
+        column = normalized.get(re.sub(r"[\s_]+", "", bare).lower())
+        if column is None:
+            close = get_close_matches(bare.lower(), [column.lower() for column in columns], n=1, cutoff=0.85)
+            column = next((c for c in columns if close and c.lower() == close[0]), None)
+        if column is not None:
+            pattern = re.compile(r"(?<![\w\"`\[])" + re.escape(bare) + r"(?![\w\"`\]])", re.IGNORECASE)
+            fixed = replace_unquoted(query, pattern, quote_identifier(column))
+            # A wrongly quoted "name" is an identifier too
+            fixed = fixed.replace(quote_identifier(bare), quote_identifier(column)) if bare != column else fixed
+            if fixed != query:
+                return fixed, "column_name"
+
+    match = UNKNOWN_TABLE.search(error)
+    if match:
+        name = (match.group(1) or match.group(2)).strip().split(".")[-1]
+        if name.lower() != table_name.lower():
+            pattern = re.compile(r"(?<![\w\"`\[])" + re.escape(name) + r"(?![\w\"`\]])", re.IGNORECASE)
+            fixed = replace_unquoted(query, pattern, table_name)
+            fixed = fixed.replace(quote_identifier(name), quote_identifier(table_name))
+            if fixed != query:
+                return fixed, "table_name"
+
+    return None, None
+
+
+def validate_sql(query: str, db_name: str, table_name: str) -> tuple[str, list]:
+    """
+    Compiles `query` with EXPLAIN (nothing is executed) and fixes mechanical mistakes locally:
+    fenced SQL, unquoted column names with spaces, column name case/spacing and wrong table names.
+    Returns (query to run, applied repairs), raises the engine's error (sqlite3.Error, duckdb.Error) for errors only the LLM can fix.
+    """
+    _count("queries")
+    columns = table_columns(db_name, table_name)
+    repairs = []
+
+    fixed = strip_fences(query).rstrip(";").strip()
+    if fixed != query.strip().rstrip(";").strip():
+        repairs.append("markdown_fence")
+    fixed, quoted = quote_spaced_columns(fixed, columns)
+    if quoted:
+        repairs.append("identifier_quoting")
+
+    executor = get_executor(db_name)
+    for _ in range(MAX_REPAIRS):
+        try:
+            with executor.connection() as conn:
+                conn.execute("EXPLAIN " + fixed).fetchone()
+            break
+        except DATABASE_ERRORS as e:
+            candidate, kind = repair(fixed, str(e), columns, table_name)
+            if candidate is None:
+                _count("rejected")
+                raise
+            fixed = candidate
+            repairs.append(kind)
+    else:
+        _count("rejected")
+        raise sqlite3.OperationalError(f"Could not repair query after {MAX_REPAIRS} attempts: {fixed}")
+
+    if repairs:
+        _count("repaired", repairs)
+    else:
+        _count("valid")
+    return fixed, repairs
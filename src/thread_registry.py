@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from src.insight_cache import write_json_atomic
+from src.memory import get_checkpointer
+
+
+# ------------------------------------ Thread Registry ----------------------------------
+
+# Rebuilt when a thread is reopened (chat_bot) or only meaningful while the page is open
+TRANSIENT_KEYS = ("chat_bot", "refresh_errors")
+# Random key of the browser that owns a thread, also used in URLs so it is validated before use
+OWNER_KEY = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_owner_key() -> str:
+    return uuid.uuid4().hex
+
+
+def is_owner_key(owner) -> bool:
+    return isinstance(owner, str) and OWNER_KEY.match(owner) is not None
+
+
+class ThreadRegistry():
+    """
+    Chat threads that outlive the Streamlit session: title, insights, dataset key, metadata and the
+    displayed messages of every thread, one JSON file per thread in `root/<thread_id>.json`.
+
+    Each thread belongs to an owner key (one per browser, kept in the page URL), a session only
+    lists and opens the threads of its owner. `root/index.json` tracks the owner, title and
+    created/updated times of every thread, listing and eviction read the index alone and a thread
+    file is only parsed when the thread is opened.
+
+    The model side of the conversation is checkpointed under the same thread id (see memory.py), a
+    reopened thread continues where it stopped. Beyond `max_threads` the least recently updated
+    threads are deleted together with their checkpoints.
+    """
+
+    def __init__(self, root: str = "temp/threads", max_threads: int = 50, checkpoint_path: str = "temp/checkpoints.db"):
+        self.root = root
+        self.max_threads = max_threads
+        self.checkpoint_path = checkpoint_path
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def thread_path(self, thread_id: str) -> str:
+        return os.path.join(self.root, f"{thread_id}.json")
+
+    def load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def list_threads(self, owner: str) -> dict:
+        """thread_id -> {"title", "created", "updated"} of the threads of `owner`, oldest first (the sidebar lists them newest first)."""
+        with self._lock:
+            index = self.load_index()
+        threads = [(thread_id, {key: entry.get(key) for key in ("title", "created", "updated")})
+                   for thread_id, entry in index.items() if entry.get("owner") == owner]
+        threads.sort(key=lambda item: item[1].get("created") or 0)
+        return dict(threads)
+
+    def load(self, owner: str, thread_id: str) -> dict | None:
+        """Full data of a thread, None when it is gone (evicted) or belongs to another owner."""
+        with self._lock:
+            entry = self.load_index().get(thread_id)
+            if entry is None or entry.get("owner") != owner:
+                return None
+            try:
+                with open(self.thread_path(thread_id), "r") as file:
+                    return json.load(file)
+            except (OSError, json.JSONDecodeError):
+                return None
+
+    def save(self, owner: str, thread_id: str, thread_data: dict):
+        data = {key: value for key, value in thread_data.items() if key not in TRANSIENT_KEYS}
+        data.setdefault("created", time.time())
+        data["updated"] = time.time()
+        with self._lock:
+            index = self.load_index()
+            write_json_atomic(self.thread_path(thread_id), data)
+            index[thread_id] = {"owner": owner, "title": data.get("title"), "created": data["created"], "updated": data["updated"]}
+            evicted = self.evict(index, keep=thread_id)
+            write_json_atomic(self.index_path, index)
+        thread_data.setdefault("created", data["created"])
+        for evicted_id in evicted:
+            get_checkpointer(self.checkpoint_path).delete_thread(evicted_id)
+
+    def delete(self, thread_id: str):
+        with self._lock:
+            index = self.load_index()
+            index.pop(thread_id, None)
+            self.remove_file(thread_id)
+            write_json_atomic(self.index_path, index)
+        get_checkpointer(self.checkpoint_path).delete_thread(thread_id)
+
+    def remove_file(self, thread_id: str):
+        try:
+            os.remove(self.thread_path(thread_id))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, index: dict, keep: str = None) -> list:
+        """
+        Drops the least recently updated threads beyond `max_threads` from `index` (in place) and disk,
+        returns their ids, the caller deletes their checkpoints outside the lock.
+        """
+        by_age = sorted((thread_id for thread_id in index if thread_id != keep), key=lambda thread_id: index[thread_id].get("updated") or 0)
+        evicted = []
+        while by_age and len(index) > self.max_threads:
+            thread_id = by_age.pop(0)
+            del index[thread_id]
+            self.remove_file(thread_id)
+            evicted.append(thread_id)
+        return evicted
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_thread_registry() -> ThreadRegistry:
+    """Process-wide registry shared by every browser session, each session only sees its owner's threads."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ThreadRegistry()
+        return _registry
@@ -1,8 +1,9 @@
 import os
-import sqlite3
-import pandas as pd
 import PIL.Image as PIL
 import io, base64
+from src.ingestion import ingest_csv
+from src.sql_executor import get_executor
+from src.profiler import load_profile
 
 
 def encode_image_to_base64(img: PIL.Image) -> str:
@@ -50,30 +51,29 @@ def generate_multimodel_content(text: str, images: list) -> list:
     return content
 
 
-def csv_to_sqlite(csv_file="data/data.csv", db_name="data/data.db", table_name="data"):
-    df = pd.read_csv(csv_file)
-    conn = sqlite3.connect(db_name)
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
-    conn.close()
+def csv_to_sqlite(csv_file="data/data.csv", db_name="data/data.db", table_name="data", chunk_size=50_000, progress=None):
+    return ingest_csv(csv_file, db_name=db_name, table_name=table_name, chunk_size=chunk_size, progress=progress)
 
 def get_column_names(table_name="data", db_name="data/data.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    cursor.execute(f"PRAGMA table_info({table_name});")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    conn.close()
-    return columns
+    return [row[1] for row in get_executor(db_name).run(f"PRAGMA table_info({table_name});")]
+
+
+def get_dataset_metadata(table_name="data", db_name="data/data.db", sample_rows=5):
+    """Column names and a few sample rows, the text every agent gets to describe the dataset."""
+    sample_data = get_executor(db_name).run(f"SELECT * FROM {table_name} LIMIT {int(sample_rows)};")
+    return f"column_names: {get_column_names(table_name, db_name)}, sample_data: {sample_data}"
+
+def get_column_profile(table_name="data", db_name="data/data.db"):
+    """Per-column stats computed at ingestion, see src/profiler.py."""
+    return load_profile(db_name, table_name)
 
 
 def run_sql_query(query, db_name="data/data.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    return get_executor(db_name).run(query)
+
+def run_bounded_query(query, db_name="data/data.db", **limits):
+    """Preview + row count + stats instead of the full result, see sql_executor.QueryResult."""
+    return get_executor(db_name).run_bounded(query, **limits)
 
 def load_system_message(dir_path: str = "agent_prompt") -> dict:
     messages = {}
@@ -89,4 +89,7 @@ def load_system_message(dir_path: str = "agent_prompt") -> dict:
     return messages
 
 def save_last(a, b):
-    return b
\ No newline at end of file
+    return b
+
+def merge_dicts(a, b):
+    return {**(a or {}), **(b or {})}